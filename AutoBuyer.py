@@ -1,19 +1,54 @@
 import requests
 import time
 import traceback
+import logging
 import json
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
 # Import shared configurations
 from config import (
-    MARKET_HEADERS, COOKIES, CASH_API_URL,
+    MARKET_HEADERS, COOKIES, CASH_API_URL, SIMCOMPANIES_BASE_URL,
     BUY_THRESHOLD_PERCENTAGE, DEFAULT_CHECK_INTERVAL_SECONDS,
     PURCHASE_WAIT_MULTIPLIER, MARKET_REQUEST_TIMEOUT as REQUEST_TIMEOUT,
     MONEY_REQUEST_TIMEOUT, BUY_THRESHOLDS, MAX_TOTAL_COST, MIN_CASH_RESERVE,
     AUTOBUY_PRODUCT_DELAY_MIN_SECONDS, AUTOBUY_PRODUCT_DELAY_MAX_SECONDS,
-    AUTOBUY_RATE_LIMIT_BASE_DELAY_SECONDS
+    AUTOBUY_RATE_LIMIT_BASE_DELAY_SECONDS, AUTOBUY_SCAN_MODE, AUTOBUY_SCAN_MAX_WORKERS,
+    AUTOBUY_SCAN_RATE_PER_SECOND, AUTOBUY_SCAN_BURST,
+    MARKET_JSON_DECODER, MARKET_ORDERS_SORTED_BY_PRICE,
+    HTTP_CACHE_ENABLED, HTTP_CACHE_STALE_SECONDS, HTTP_POOL_MAXSIZE, HTTP_WARMUP_ENABLED,
+    PRICE_HISTORY_ENABLED, PRICE_HISTORY_DIR, PRICE_HISTORY_RAW_ROWS,
+    PRICE_HISTORY_MINUTE_ROWS, PRICE_HISTORY_HOUR_ROWS,
+    AUTOBUY_SCHEDULER, AUTOBUY_SCHEDULER_BUDGET_PER_HOUR, AUTOBUY_SCHEDULER_MIN_INTERVAL_SECONDS,
+    AUTOBUY_SCHEDULER_MAX_INTERVAL_SECONDS, AUTOBUY_SCHEDULER_BURST_INTERVAL_SECONDS,
+    AUTOBUY_SCHEDULER_BURST_MARGIN, RATE_GOVERNOR_ENABLED, RATE_GOVERNOR_PATH,
+    RATE_GOVERNOR_RATE_PER_SECOND, RATE_GOVERNOR_BURST, RATE_GOVERNOR_IDLE_SECONDS,
+    AUTOBUY_AIMD_ENABLED, AUTOBUY_AIMD_MIN_RATE_PER_SECOND, AUTOBUY_AIMD_MAX_RATE_PER_SECOND,
+    AUTOBUY_AIMD_INCREASE, AUTOBUY_AIMD_DECREASE, AUTOBUY_AIMD_SLOW_SECONDS, AUTOBUY_AIMD_STATE_PATH,
+    AUTOBUY_WARM_DRIVER, AUTOBUY_WARM_DRIVER_IDLE_SECONDS, AUTOBUY_WARM_DRIVER_MAX_AGE_SECONDS,
+    CASH_SERVICE_ENABLED, CASH_CACHE_TTL_SECONDS, CASH_REFRESH_INTERVAL_SECONDS,
+    COOKIE_BRIDGE_ENABLED, COOKIE_BRIDGE_REFRESH_SECONDS,
+    PURCHASE_BACKEND, PURCHASE_BACKENDS, PURCHASE_API_URL, BUY_REQUEST_TIMEOUT,
+    AUTOBUY_PIPELINE_ENABLED, AUTOBUY_PIPELINE_QUEUE_SIZE, AUTOBUY_PIPELINE_OPPORTUNITY_TTL_SECONDS,
+    AUTOBUY_BATCH_PURCHASE_ENABLED, AUTOBUY_BATCH_MAX_TABS,
+    LOGIN_STATE_CACHE_ENABLED, LOGIN_STATE_TTL_SECONDS, LOGIN_STATE_DIR,
+    TRADE_LEDGER_ENABLED, TRADE_LEDGER_PATH, TRADE_LOG_TEXT_FILES, AUTOBUY_MAX_DAILY_SPEND, MAX_DAILY_SPEND,
+    PRICE_RECHECK_API_ENABLED, PRICE_RECHECK_TIMEOUT_SECONDS
 )
-from market_utils import get_market_data, get_current_money
-from driver_utils import initialize_driver
+from market_utils import get_market_data, get_current_money, scan_market_data
+from driver_utils import initialize_driver, WarmDriver
+from rate_limiter import TokenBucket, SharedTokenBucket, AimdController
+from http_cache import parse_retry_after
+from http_client import create_session, warm_up
+from price_history import PriceHistoryStore, summarize_market_data
+from scheduler import PollScheduler
+from decision import DecisionCatalog, walk_depth
+from cash_service import CashService
+from cookie_bridge import CookieBridge
+from login_state import LoginState, state_path_for_profile
+from trade_ledger import TEXT_LOG_PATHS, TradeLedger
+from purchase_executor import HttpPurchaseExecutor
+from pipeline import Opportunity, OpportunityQueue, PipelineWorker
+from log_utils import configure_logging, setup_logger
 
 # --- Selenium Imports ---
 from selenium.webdriver.remote.webdriver import WebDriver # For type hinting
@@ -29,31 +64,171 @@ import os
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Resolves with [status, detail] on the first success/error toast or change of the first market row.
+# Arguments: previous first-row outerHTML, timeout in milliseconds, async callback.
+PURCHASE_WATCH_SCRIPT = """
+const [previousRowHtml, timeoutMs, done] = arguments;
+const ERROR_SELECTOR = '.alert-danger, .alert-warning, .error-message, .toast-error';
+const SUCCESS_SELECTOR = '.alert-success, .toast-success';
+const ROW_SELECTOR = "tr[aria-label*='market order']";
+const startedAt = Date.now();
+let finished = false;
+let observer = null;
+let timer = null;
+const visible = (el) => el.getClientRects().length > 0;
+const finish = (result) => {
+    if (finished) return;
+    finished = true;
+    if (observer) observer.disconnect();
+    clearTimeout(timer);
+    done(result);
+};
+const check = (addedNodes) => {
+    const error = Array.from(document.querySelectorAll(ERROR_SELECTOR)).find(visible);
+    if (error) return finish(['rejected', error.innerText.trim() || 'Purchase rejected by page']);
+    const success = Array.from(document.querySelectorAll(SUCCESS_SELECTOR)).find(visible);
+    if (success) return finish(['confirmed', success.innerText.trim() || 'Success message displayed']);
+    for (const node of addedNodes || []) {
+        const text = (node.textContent || '').trim();
+        if (/purchased/i.test(text)) return finish(['confirmed', text.slice(0, 200)]);
+    }
+    const row = document.querySelector(ROW_SELECTOR);
+    if (!row) {
+        if (Date.now() - startedAt >= 1500) return finish(['confirmed', 'First market order disappeared']);
+        timer = setTimeout(() => check(), 1500 - (Date.now() - startedAt));
+        return;
+    }
+    if (previousRowHtml && row.outerHTML !== previousRowHtml) {
+        return finish(['confirmed', 'First market order price or quantity changed']);
+    }
+};
+observer = new MutationObserver((records) => check(records.flatMap((record) => Array.from(record.addedNodes))));
+observer.observe(document.documentElement, {childList: true, subtree: true, characterData: true,
+                                            attributes: true, attributeFilter: ['class', 'style']});
+setTimeout(() => finish(null), timeoutMs);
+check();
+"""
+
 class AutoBuyer:
     # --- Modified __init__ to accept target_products dictionary ---
     # Removed driver: WebDriver from parameters
     def __init__(self, target_products, max_buy_quantity, market_headers, headers, cookies, drivers):
+        configure_logging()
         self.TARGET_PRODUCTS = target_products # Store the dictionary
         self.MAX_BUY_QUANTITY = max_buy_quantity # Store the dictionary instead of a single value
         self.MARKET_HEADERS = market_headers
-        self.session = requests.Session() # Keep requests session for market data fetching
-        self.session.headers.update(self.MARKET_HEADERS)
+        self.session = create_session( # Keep requests session for market data fetching
+            headers=self.MARKET_HEADERS,
+            pool_maxsize=HTTP_POOL_MAXSIZE,
+            cache=HTTP_CACHE_ENABLED,
+            stale_if_rate_limited=HTTP_CACHE_STALE_SECONDS,
+            default_backoff=AUTOBUY_RATE_LIMIT_BASE_DELAY_SECONDS
+        )
         self.driver = None # Initialize driver to None, will be created in main_loop
+        self.warm_driver = None  # Long-lived browser when AUTOBUY_WARM_DRIVER is enabled
         self._consecutive_rate_limits = 0
+        self.scan_mode = AUTOBUY_SCAN_MODE
+        if RATE_GOVERNOR_ENABLED:  # Budget shared with every other AutoBuyer/TradeMonitor on this host
+            self.rate_limiter = SharedTokenBucket(
+                RATE_GOVERNOR_PATH, RATE_GOVERNOR_RATE_PER_SECOND, max(1, RATE_GOVERNOR_BURST),
+                client_name=f"AutoBuyer-{os.getpid()}", idle_after=RATE_GOVERNOR_IDLE_SECONDS
+            )
+        else:
+            self.rate_limiter = TokenBucket(AUTOBUY_SCAN_RATE_PER_SECOND, max(1, AUTOBUY_SCAN_BURST))
+        self.pacer = None
+        if AUTOBUY_AIMD_ENABLED:  # Learned request rate drives the token bucket and the sleeps below
+            max_rate = AUTOBUY_AIMD_MAX_RATE_PER_SECOND
+            if RATE_GOVERNOR_ENABLED:  # Never learn past the host-wide budget
+                max_rate = min(max_rate, RATE_GOVERNOR_RATE_PER_SECOND)
+            self.pacer = AimdController(
+                self.rate_limiter.rate_per_second,
+                min_rate=min(AUTOBUY_AIMD_MIN_RATE_PER_SECOND, max_rate),
+                max_rate=max_rate,
+                increase=AUTOBUY_AIMD_INCREASE,
+                decrease=AUTOBUY_AIMD_DECREASE,
+                slow_seconds=AUTOBUY_AIMD_SLOW_SECONDS,
+                state_path=AUTOBUY_AIMD_STATE_PATH,
+                limiter=self.rate_limiter
+            )
+            self.session.hooks['response'].append(self.pacer)
+        self._idle_book_hashes = {}  # product -> content hash of the last book that needed no action
+        self.scheduler = None
+        if AUTOBUY_SCHEDULER == "adaptive":
+            self.scheduler = PollScheduler(
+                list(self.TARGET_PRODUCTS),
+                budget_per_second=AUTOBUY_SCHEDULER_BUDGET_PER_HOUR / 3600,
+                min_interval=AUTOBUY_SCHEDULER_MIN_INTERVAL_SECONDS,
+                max_interval=AUTOBUY_SCHEDULER_MAX_INTERVAL_SECONDS,
+                burst_interval=AUTOBUY_SCHEDULER_BURST_INTERVAL_SECONDS,
+                burst_margin=AUTOBUY_SCHEDULER_BURST_MARGIN
+            )
+        self.decision_catalog = DecisionCatalog(
+            self.TARGET_PRODUCTS, BUY_THRESHOLDS, self.MAX_BUY_QUANTITY, MAX_TOTAL_COST,
+            default_threshold=BUY_THRESHOLD_PERCENTAGE
+        )
+        # Authenticated session for account endpoints (cash balance, purchases)
+        self.api_session = create_session(headers=headers or self.MARKET_HEADERS, cookies=cookies or COOKIES,
+                                          pool_maxsize=2, timer=False)
+        self.login_state = None
+        if LOGIN_STATE_CACHE_ENABLED:  # Skip the login-check navigation while a recent check still holds
+            self.login_state = LoginState(
+                state_path_for_profile(LOGIN_STATE_DIR, os.getenv("USER_DATA_DIR_autobuy")),
+                ttl=LOGIN_STATE_TTL_SECONDS
+            )
+            self.session.hooks['response'].append(self.login_state)
+            self.api_session.hooks['response'].append(self.login_state)
+        self.cookie_bridge = None
+        if COOKIE_BRIDGE_ENABLED:  # Browser-profile cookies for the HTTP sessions
+            self.cookie_bridge = CookieBridge(
+                user_data_dir=os.getenv("USER_DATA_DIR_autobuy"),
+                driver_provider=lambda: self.warm_driver.driver if self.warm_driver is not None else None,
+                refresh_interval=COOKIE_BRIDGE_REFRESH_SECONDS
+            )
+            self.cookie_bridge.attach(self.session)
+            self.cookie_bridge.attach(self.api_session)
+        self.cash_service = None
+        if CASH_SERVICE_ENABLED:  # Balance over HTTP instead of a /landscape/ page load per purchase
+            self.cash_service = CashService(self.api_session, CASH_API_URL, ttl=CASH_CACHE_TTL_SECONDS,
+                                            timeout=MONEY_REQUEST_TIMEOUT)
+        self.purchase_executor = HttpPurchaseExecutor(
+            self.api_session, PURCHASE_API_URL,
+            market_page_template=f"{SIMCOMPANIES_BASE_URL}/market/resource/{{resource_id}}/",
+            timeout=BUY_REQUEST_TIMEOUT
+        )
+        self.price_recheck_executor = None
+        if PRICE_RECHECK_API_ENABLED:  # Re-check fetches run while the browser loads the market page
+            self.price_recheck_executor = ThreadPoolExecutor(max_workers=max(1, AUTOBUY_BATCH_MAX_TABS),
+                                                             thread_name_prefix="price-recheck")
+        self.opportunity_queue = None
+        self.pipeline_worker = None  # Started in main_loop, which knows the browser profile
+        if AUTOBUY_PIPELINE_ENABLED:  # Scanner and purchase executor run as separate workers
+            self.opportunity_queue = OpportunityQueue(maxsize=AUTOBUY_PIPELINE_QUEUE_SIZE,
+                                                      ttl=AUTOBUY_PIPELINE_OPPORTUNITY_TTL_SECONDS)
+        self.trade_ledger = None
+        if TRADE_LEDGER_ENABLED:
+            self.trade_ledger = TradeLedger(TRADE_LEDGER_PATH)
+            for path in TEXT_LOG_PATHS:  # One-time migration; unchanged files are skipped
+                imported = self.trade_ledger.import_text_log(path)
+                if imported:
+                    logger.info(f"Imported {imported} trade events from {path} into {TRADE_LEDGER_PATH}.")
+        self.price_history = None
+        if PRICE_HISTORY_ENABLED:
+            self.price_history = PriceHistoryStore(
+                PRICE_HISTORY_DIR,
+                raw_rows=PRICE_HISTORY_RAW_ROWS,
+                minute_rows=PRICE_HISTORY_MINUTE_ROWS,
+                hour_rows=PRICE_HISTORY_HOUR_ROWS
+            )
 
         # --- Setup for error logging ---
-        self.error_log_path = os.path.join('record', 'autobuyer_error.log')
-        if not os.path.exists('record'):
-            os.makedirs('record')
+        # Written by the background log writer instead of opening the file for every message
+        self.error_logger = setup_logger("AutoBuyer.errors", 'autobuyer_error.log', console=False,
+                                         fmt='[%(asctime)s] %(message)s')
 
     def _log_error_message(self, message):
-        try:
-            with open(self.error_log_path, 'a', encoding='utf-8') as f:
-                import datetime # Import locally
-                timestamp = datetime.datetime.now().isoformat()
-                f.write(f"[{timestamp}] {message}\n")
-        except Exception as e:
-            print(f"CRITICAL: Failed to write to error log: {e}") # Print to console if logging itself fails
+        self.error_logger.error(message)
 
     def _extract_resource_id(self, url):
         """Parse resource ID from product API URL"""
@@ -62,7 +237,7 @@ class AutoBuyer:
             if len(path_parts) >= 5 and path_parts[0] == 'api' and path_parts[2] == 'market':
                 return int(path_parts[4])
         except (ValueError, IndexError) as e:
-            print(f"Error parsing resource ID ({url}): {e}")
+            logger.error(f"Error parsing resource ID ({url}): {e}")
         return None
 
     @staticmethod
@@ -76,21 +251,114 @@ class AutoBuyer:
         return float(normalized)
 
     # --- Modified get_market_data to accept product details ---
-    def get_market_data(self, product_name, product_info):
-        print(f"--- Start processing {product_name} (Q{product_info['quality']}) market data ---")
+    def get_market_data(self, product_name, product_info, timeout=REQUEST_TIMEOUT, headers=None, token_timeout=None):
+        logger.info(f"--- Start processing {product_name} (Q{product_info['quality']}) market data ---")
         error_details = {}
+        started_at = time.monotonic()
+        if not self.rate_limiter.acquire(timeout=token_timeout):  # Only with token_timeout: give up rather than queue
+            message = f"No rate limiter token within {token_timeout}s"
+            logger.warning(f"[{product_name}] {message}")
+            return None, {'kind': 'rate_limited', 'message': message}
+        if token_timeout is not None:  # The wait for a token comes out of the request's time budget
+            timeout = max(0.1, timeout - (time.monotonic() - started_at))
         data = get_market_data(
             self.session,
             product_info['url'], # Use URL from product_info
             product_info['quality'], # Use quality from product_info
-            timeout=REQUEST_TIMEOUT,
+            timeout=timeout,
+            headers=headers,
             return_order_detail=True,
-            error_details=error_details
+            error_details=error_details,
+            decoder=MARKET_JSON_DECODER,
+            assume_sorted=MARKET_ORDERS_SORTED_BY_PRICE,
+            buy_threshold=BUY_THRESHOLDS.get(product_name, BUY_THRESHOLD_PERCENTAGE)
         )
+        if error_details.get('kind') == 'rate_limited':  # Pause every process sharing the limiter
+            self.rate_limiter.backoff(parse_retry_after(error_details.get('retry_after'), AUTOBUY_RATE_LIMIT_BASE_DELAY_SECONDS))
         return data, error_details
 
+    def scan_market(self, product_items):
+        """Fetch all products concurrently, paced by the shared token bucket."""
+        products = dict(product_items)
+        logger.info(f"--- Concurrent scan of {len(products)} products (workers={AUTOBUY_SCAN_MAX_WORKERS}, "
+              f"rate={self.rate_limiter.rate_per_second:.3f}/s, burst={self.rate_limiter.capacity:.0f}) ---")
+        started_at = time.monotonic()
+        results = scan_market_data(
+            self.session,
+            products,
+            rate_limiter=self.rate_limiter,
+            max_workers=AUTOBUY_SCAN_MAX_WORKERS,
+            timeout=REQUEST_TIMEOUT,
+            return_order_detail=True,
+            decoder=MARKET_JSON_DECODER,
+            assume_sorted=MARKET_ORDERS_SORTED_BY_PRICE,
+            buy_thresholds={name: BUY_THRESHOLDS.get(name, BUY_THRESHOLD_PERCENTAGE) for name in products}
+        )
+        logger.info(f"--- Concurrent scan finished in {time.monotonic() - started_at:.2f}s ---")
+        return results
+
+    def _warm_up_connections(self, product_items, connections):
+        """Re-open keep-alive connections to the market API before the cycle's first fetch."""
+        started_at = time.monotonic()
+        results = warm_up(self.session, [info['url'] for _, info in product_items],
+                          connections=connections, timeout=REQUEST_TIMEOUT, rate_limiter=self.rate_limiter)
+        for origin, outcome in results.items():
+            if isinstance(outcome, str):
+                logger.warning(f"Connection warmup to {origin} failed: {outcome}")
+        logger.info(f"Warmed {connections} connection(s) in {time.monotonic() - started_at:.2f}s.")
+
+    def _rank_by_opportunity(self, product_items, results):
+        """Evaluate the whole scan at once and move actionable products to the front.
+
+        Returns the reordered items and the :class:`decision.CatalogDecision`,
+        whose trigger flags then decide the purchases of this scan.
+        """
+        available_cash = self.cash_service.cached() if self.cash_service is not None else None
+        decision = self.decision_catalog.evaluate(results, available_cash=available_cash,
+                                                  min_cash_reserve=MIN_CASH_RESERVE if available_cash is not None else 0.0)
+        opportunities = decision.opportunities()
+        if not opportunities:
+            logger.info(f"No product meets its buy threshold in this scan ({len(decision)} evaluated).")
+            return product_items, decision
+        logger.info(f"--- {len(opportunities)} opportunities in this scan (largest expected saving first) ---")
+        for rank, opportunity in enumerate(opportunities, 1):
+            logger.info(f"  {rank}. {opportunity['name']}: {opportunity['quantity']} @ ${opportunity['price']:.3f} "
+                  f"(threshold ${opportunity['threshold_price']:.3f}, saving ~${opportunity['expected_savings']:,.2f})")
+        position = {opportunity['name']: rank for rank, opportunity in enumerate(opportunities)}
+        return sorted(product_items, key=lambda item: position.get(item[0], len(position))), decision
+
+    def _record_price_history(self, product_name, market_data):
+        """Append the book summary to the price-history store; never interrupts trading."""
+        if self.price_history is None:
+            return
+        summary = summarize_market_data(market_data)
+        if summary is None:
+            return
+        try:
+            self.price_history.append(product_name, *summary)
+        except Exception as e:
+            self._log_error_message(f"Failed to record price history for {product_name}: {e}")
+
+    def _schedule_next_poll(self, product_name, market_data):
+        """Feed the fetched book to the adaptive scheduler (no-op in fixed mode)."""
+        if self.scheduler is None:
+            return
+        summary = summarize_market_data(market_data)
+        if summary is None:
+            return
+        lowest_price, second_lowest_price = summary[0], summary[1]
+        threshold_price = None
+        if second_lowest_price is not None:
+            threshold_price = second_lowest_price * BUY_THRESHOLDS.get(product_name, BUY_THRESHOLD_PERCENTAGE)
+        interval = self.scheduler.observe(product_name, lowest_price, threshold_price)
+        logger.info(f"Next poll for {product_name} in {interval:.0f}s (priority {self.scheduler.priority(product_name):.2f}).")
+
     def _log_trade(self, status, product_name, resource_id, order_id, price, quantity, detail=""):
-        """Append an auditable trade event. Only CONFIRMED is considered successful."""
+        """Record an auditable trade event. Only CONFIRMED is considered successful."""
+        if self.trade_ledger is not None:
+            self.trade_ledger.record(status, product_name, resource_id, order_id, price, quantity, detail)
+            if not TRADE_LOG_TEXT_FILES:
+                return
         import datetime
         os.makedirs('record', exist_ok=True)
         log_entry = (
@@ -104,45 +372,56 @@ class AutoBuyer:
             with open('record/successful_trade.txt', 'a', encoding='utf-8') as f:
                 f.write(log_entry)
 
-    def _wait_for_purchase_confirmation(self, previous_row_html):
-        """Return (status, detail) after checking UI messages and market-row changes."""
-        success_xpath = (
-            "//*[contains(@class,'alert-success') or contains(@class,'toast-success') "
-            "or contains(translate(normalize-space(.),'PURCHASED','purchased'),'purchased')]"
-        )
-        error_xpath = (
-            "//*[contains(@class,'alert-danger') or contains(@class,'alert-warning') "
-            "or contains(@class,'error-message') or contains(@class,'toast-error')]"
-        )
-        started_at = time.monotonic()
+    def _wait_for_purchase_confirmation(self, previous_row_html, timeout=12):
+        """Return (status, detail) from an in-page MutationObserver watching toasts and the first market row.
 
-        def detect_result(driver):
-            errors = driver.find_elements(By.XPATH, error_xpath)
-            for element in errors:
-                if element.is_displayed():
-                    message = element.text.strip() or "Purchase rejected by page"
-                    return ("rejected", message)
-
-            successes = driver.find_elements(By.XPATH, success_xpath)
-            for element in successes:
-                if element.is_displayed():
-                    return ("confirmed", element.text.strip() or "Success message displayed")
-
-            rows = driver.find_elements(By.CSS_SELECTOR, "tr[aria-label*='market order']")
-            if not rows:
-                if time.monotonic() - started_at >= 1.5:
-                    return ("confirmed", "First market order disappeared")
-                return False
+        The observer resolves as soon as the DOM changes, instead of re-querying
+        the page on an interval. If the buy click reloads the page, the script is
+        run again on the new document, where the result message is already present.
+        """
+        self.driver.set_script_timeout(timeout + 5)
+        deadline = time.monotonic() + timeout
+        last_error = None
+        for _ in range(3):
+            remaining_ms = int(max(0.0, deadline - time.monotonic()) * 1000)
+            try:
+                result = self.driver.execute_async_script(PURCHASE_WATCH_SCRIPT, previous_row_html, remaining_ms)
+                if result:
+                    return tuple(result)
+            except WebDriverException as e:  # Document unloaded by a navigation after the click
+                last_error = f"{type(e).__name__}: {e.msg if hasattr(e, 'msg') else e}"
+            if time.monotonic() >= deadline:
+                break
+        detail = f"No success, error, or market-order change detected within {timeout} seconds"
+        return ("unknown", f"{detail} ({last_error})" if last_error else detail)
 
-            current_row_html = rows[0].get_attribute("outerHTML")
-            if previous_row_html and current_row_html != previous_row_html:
-                return ("confirmed", "First market order price or quantity changed")
-            return False
+    def _start_price_recheck(self, product_name, product_info):
+        """Start a fresh API read of the product's book in the background. Returns a future, or None if disabled."""
+        if self.price_recheck_executor is None:
+            return None
+        # no-cache: a snapshot from the scan (or a stale one kept during a 429 backoff) must not pass the check.
+        # token_timeout: after a sweep empties the bucket, or during a 429 backoff, fall back to the page
+        # instead of queueing a request that would be sent after the purchase has moved on.
+        return self.price_recheck_executor.submit(self.get_market_data, product_name, product_info,
+                                                  timeout=PRICE_RECHECK_TIMEOUT_SECONDS,
+                                                  headers={'Cache-Control': 'no-cache'},
+                                                  token_timeout=PRICE_RECHECK_TIMEOUT_SECONDS)
 
-        try:
-            return WebDriverWait(self.driver, 12, poll_frequency=0.4).until(detect_result)
-        except TimeoutException:
-            return ("unknown", "No success, error, or market-order change detected within 12 seconds")
+    def _live_market_price(self, product_name, price_recheck):
+        """Lowest price from the API re-check, or from the market page if it failed.
+
+        Returns ``(price, order_book)``; ``order_book`` is None when the price
+        came from the page. The price is None if neither source gave one.
+        """
+        if price_recheck is not None:
+            try:
+                data, error_details = price_recheck.result(timeout=PRICE_RECHECK_TIMEOUT_SECONDS + 1)
+            except Exception as e:  # Includes a re-check still running past its timeout
+                data, error_details = None, {'message': f"{type(e).__name__} - {e}"}
+            if data is not None:
+                return data['lowest_order']['price'], data.get('order_book')
+            logger.warning(f"[{product_name}] API price re-check failed ({error_details.get('message')}), reading the market page instead.")
+        return self._get_current_market_price(self.driver, product_name), None
 
     def _get_current_market_price(self, driver, product_name): # Added product_name for logging
         """使用 Selenium 取得網頁上第一個訂單的價格 (float)，使用 aria-label 定位並加入等待機制"""
@@ -161,22 +440,22 @@ class AutoBuyer:
                 
                 price_text = price_text_raw.strip().replace('$', '').replace(',', '')
                 if not price_text: # 檢查處理後的價格文本是否為空
-                    print(f"[Warning] [{product_name}] Price text is empty after stripping from 4th td.")
+                    logger.warning(f"[{product_name}] Price text is empty after stripping from 4th td.")
                     self._log_error_message(f"[{product_name}] Price text empty in 4th td. Row HTML: {first_row.get_attribute('outerHTML')}")
                     return None
                 try:
                     return self._parse_price_text(price_text_raw)
                 except ValueError:
-                    print(f"[Warning] [{product_name}] Could not convert price text '{price_text}' to float.")
+                    logger.warning(f"[{product_name}] Could not convert price text '{price_text}' to float.")
                     self._log_error_message(f"[{product_name}] ValueError converting price text to float: '{price_text}'. Row HTML: {first_row.get_attribute('outerHTML')}")
                     return None
             else:
-                print(f"[Warning] [{product_name}] 訂單列欄位數不足 ({len(tds)} found), 無法取得價格.")
+                logger.warning(f"[{product_name}] 訂單列欄位數不足 ({len(tds)} found), 無法取得價格.")
                 row_html = first_row.get_attribute('outerHTML') if first_row else "Not found" # Defensive check for first_row
                 self._log_error_message(f"[{product_name}] 訂單列欄位數不足 ({len(tds)}). Row selector: '{first_row_selector}'. Row HTML: {row_html}")
                 return None
         except TimeoutException:
-            print(f"[Warning] [{product_name}] 等待市場訂單元素 ('{first_row_selector}') 超時。")
+            logger.warning(f"[{product_name}] 等待市場訂單元素 ('{first_row_selector}') 超時。")
             self._log_error_message(f"[{product_name}] Timeout waiting for element: {first_row_selector}. Current URL: {driver.current_url}")
             return None
         except Exception as e:
@@ -187,134 +466,250 @@ class AutoBuyer:
             except:
                 page_html_snippet = "Could not retrieve page snippet."
             
-            print(f"[Warning] [{product_name}] 無法取得網頁即時價格: {type(e).__name__} - {e}")
+            logger.warning(f"[{product_name}] 無法取得網頁即時價格: {type(e).__name__} - {e}")
             self._log_error_message(f"[{product_name}] Error in _get_current_market_price: {type(e).__name__} - {e}. Selector: '{first_row_selector}'. URL: {driver.current_url}. HTML snippet: {page_html_snippet}")
             return None
 
     # --- Modified trigger_buy_action to accept product details ---
-    def trigger_buy_action(self, product_name, product_info, order_id, price, quantity_available):
+    def _spend_limit(self, product_name):
+        """Most one purchase of ``product_name`` may cost under its MAX_TOTAL_COST and the daily spend caps."""
+        limit = MAX_TOTAL_COST.get(product_name) or float('inf')
+        if self.trade_ledger is not None:  # Daily spend caps, from today's confirmed trades
+            if MAX_DAILY_SPEND.get(product_name):
+                limit = min(limit, max(0, MAX_DAILY_SPEND[product_name] - self.trade_ledger.spend(product_name)))
+            if AUTOBUY_MAX_DAILY_SPEND > 0:
+                limit = min(limit, max(0, AUTOBUY_MAX_DAILY_SPEND - self.trade_ledger.spend()))
+        return limit
+
+    def _plan_purchase(self, product_name, orders, available_cash=None):
+        """Walk ``orders`` cheapest first within MAX_BUY_QUANTITY, the spend caps and, given ``available_cash``, the cash reserve."""
+        max_cost = self._spend_limit(product_name)
+        if available_cash is not None:
+            max_cost = min(max_cost, max(0, available_cash - MIN_CASH_RESERVE))
+        return walk_depth(orders, self.MAX_BUY_QUANTITY.get(product_name, float('inf')), max_cost)
+
+    def _buy_over_http(self, product_name, product_info, order_id, price, quantity_available, depth_orders=None):
+        """Buy through the purchase API. Returns True/False, or None to fall back to the Selenium flow.
+
+        ``depth_orders`` (default: the given order alone) are the orders that
+        may be filled; the request's ``maxPrice`` is the highest one taken.
+        """
+        resource_id = self._extract_resource_id(product_info['url'])
+        if resource_id is None:
+            return None
+        available_cash = self.cash_service.balance() if self.cash_service is not None else None
+        if available_cash is None:
+            logger.info(f"Cash balance not available over HTTP ({product_name}), using the Selenium purchase flow.")
+            return None
+        plan = self._plan_purchase(product_name, depth_orders or [{'price': price, 'quantity': quantity_available}],
+                                   available_cash)
+        buy_quantity = plan.quantity
+        if buy_quantity <= 0:
+            self._log_trade("REJECTED", product_name, resource_id, order_id, price, 0, "cash reserve")
+            logger.info(f"Insufficient spendable cash after keeping reserve ${MIN_CASH_RESERVE:,.2f}.")
+            return False
+        price = plan.max_price
+
+        logger.info(f"===========Trigger HTTP buy ({product_name}) ===========")
+        logger.info(f"Buying {buy_quantity} x {product_name} (Q{product_info['quality']}) at up to ${price:.3f} "
+                    f"across {plan.levels} order(s), about ${plan.cost:,.2f}")
+        self._log_trade("ATTEMPTED", product_name, resource_id, order_id, price, buy_quantity, "backend=http")
+        result = self.purchase_executor.buy(resource_id, product_info['quality'], buy_quantity, price)
+        logger.info(f"HTTP purchase result ({product_name}): {result.status} in {result.seconds * 1000:.0f} ms - {result.detail}")
+
+        if result.fallback:
+            self._log_trade("REJECTED", product_name, resource_id, order_id, price, buy_quantity,
+                            f"http backend unavailable ({result.detail}), falling back to Selenium")
+            return None
+        if result.status == "confirmed":
+            self._log_trade("CONFIRMED", product_name, resource_id, order_id, result.cost / result.filled,
+                            result.filled, result.detail)
+            if self.cash_service is not None:
+                self.cash_service.debit(result.cost)
+            logger.info(f">>> Purchase confirmed for {product_name} <<<")
+            return True
+        if result.status == "rejected":
+            self._log_trade("REJECTED", product_name, resource_id, order_id, price, buy_quantity, result.detail)
+            self._log_error_message(f"HTTP purchase rejected for {product_name}: {result.detail}")
+            return False
+        self._log_trade("UNKNOWN", product_name, resource_id, order_id, price, buy_quantity, result.detail)
+        self._log_error_message(f"HTTP purchase result unknown for {product_name}: {result.detail}")
+        if self.cash_service is not None:
+            self.cash_service.invalidate()
+        return False
+
+    def trigger_buy_action(self, product_name, product_info, order_id, price, quantity_available, depth_orders=None,
+                           price_recheck=None):
+        ticket = self._submit_buy_order(product_name, product_info, order_id, price, quantity_available,
+                                        depth_orders=depth_orders, price_recheck=price_recheck)
+        if ticket is None:
+            return False
+        return self._confirm_buy_order(ticket)
+
+    def _submit_buy_order(self, product_name, product_info, order_id, price, quantity_available, available_cash=None,
+                          depth_orders=None, price_recheck=None):
+        """Re-check the live price, fill the market form and click buy on the current tab.
+
+        Returns a ticket for ``_confirm_buy_order`` once the buy button has been
+        clicked, or None if the purchase was not submitted. ``available_cash``
+        skips the balance lookup, e.g. for the later orders of a batch.
+        ``depth_orders`` (default: the given order alone) are the orders the
+        form quantity may fill; the market fills the cheapest first.
+        ``price_recheck`` is a re-check started earlier by ``_start_price_recheck``;
+        otherwise one is started here, before any page load.
+        """
         if not self.driver:
             err_msg = "Selenium purchase failed: WebDriver instance is invalid."
-            print(f"XXX {err_msg} XXX")
+            logger.error(err_msg)
             self._log_error_message(f"{product_name}: {err_msg}")
-            return False
+            return None
 
         resource_id = self._extract_resource_id(product_info['url'])
         if resource_id is None:
             err_msg = f"Selenium purchase failed: Unable to parse resource ID for {product_name} from {product_info['url']}."
-            print(f"XXX {err_msg} XXX")
+            logger.error(err_msg)
             self._log_error_message(err_msg)
-            return False
-        market_page_url = f"https://www.simcompanies.com/market/resource/{resource_id}/"
+            return None
+        market_page_url = f"{SIMCOMPANIES_BASE_URL}/market/resource/{resource_id}/"
         target_quality = product_info['quality'] # Get quality for logging/logic
 
-        print(f"===========Trigger Selenium buy condition ({product_name}) ===========")
-        print(f"Preparing to use Selenium to buy {product_name} (Q{target_quality}) (Resource ID: {resource_id})")
-        print(f"Order ID: {order_id} (Note: Selenium may not use ID directly, but by price/position)")
-        print(f"Price: ${price:.3f}")
-        print(f"Available quantity: {quantity_available}")
-
-        buy_quantity = min(quantity_available, self.MAX_BUY_QUANTITY.get(product_name, float('inf'))) # Use product-specific max quantity
+        logger.info(f"===========Trigger Selenium buy condition ({product_name}) ===========")
+        logger.info(f"Preparing to use Selenium to buy {product_name} (Q{target_quality}) (Resource ID: {resource_id})")
+        logger.info(f"Order ID: {order_id} (Note: Selenium may not use ID directly, but by price/position)")
+        logger.info(f"Price: ${price:.3f}")
+        orders = depth_orders or [{'price': price, 'quantity': quantity_available}]
+        logger.info(f"Available quantity: {sum(order['quantity'] for order in orders)} in {len(orders)} order(s)")
 
-        max_total_cost = MAX_TOTAL_COST.get(product_name)
-        if max_total_cost:
-            buy_quantity = min(buy_quantity, int(max_total_cost // price))
+        buy_quantity = self._plan_purchase(product_name, orders).quantity
 
         if buy_quantity <= 0:
-            print("Error: Calculated buy quantity is 0 or less, canceling purchase.")
-            return False
+            logger.error("Calculated buy quantity is 0 or less, canceling purchase.")
+            return None
 
-        print(f"Attempting to buy quantity: {buy_quantity}")
+        logger.info(f"Attempting to buy quantity: {buy_quantity}")
 
         try:
-            available_cash = get_current_money(self.driver)
+            if price_recheck is None:
+                price_recheck = self._start_price_recheck(product_name, product_info)
+            if available_cash is None and self.cash_service is not None:
+                available_cash = self.cash_service.balance()
+            if available_cash is None:  # Cash service disabled or API unavailable
+                available_cash = get_current_money(self.driver)
             if available_cash is None:
                 self._log_trade("REJECTED", product_name, resource_id, order_id, price, buy_quantity, "cash unavailable")
-                return False
-            affordable_quantity = int(max(0, available_cash - MIN_CASH_RESERVE) // price)
-            buy_quantity = min(buy_quantity, affordable_quantity)
+                return None
+            plan = self._plan_purchase(product_name, orders, available_cash)
+            buy_quantity = plan.quantity
             if buy_quantity <= 0:
                 self._log_trade("REJECTED", product_name, resource_id, order_id, price, 0, "cash reserve")
-                print(f"Insufficient spendable cash after keeping reserve ${MIN_CASH_RESERVE:,.2f}.")
-                return False
+                logger.info(f"Insufficient spendable cash after keeping reserve ${MIN_CASH_RESERVE:,.2f}.")
+                return None
 
             if self.driver.current_url != market_page_url:
-                print(f"Warning: Not on target market page ({product_name}), navigating to: {market_page_url}")
+                logger.warning(f"Not on target market page ({product_name}), navigating to: {market_page_url}")
                 self.driver.get(market_page_url)
                 # Wait for a known element on the market page to ensure it's loaded before price check
                 WebDriverWait(self.driver, 20).until(
                     EC.presence_of_element_located((By.CSS_SELECTOR, 'input[name="quantity"]'))
                 )
-                print("Market page loaded, quantity input box found.")
+                logger.info("Market page loaded, quantity input box found.")
 
             # 新增：下單前再次檢查網頁即時價格
-            print(f"[{product_name}] 觸發購買時的目標價格: ${price:.3f}")
-            current_market_price = self._get_current_market_price(self.driver, product_name) # Pass product_name
+            logger.info(f"[{product_name}] 觸發購買時的目標價格: ${price:.3f}")
+            current_market_price, live_book = self._live_market_price(product_name, price_recheck)
 
             if current_market_price is None:
-                print(f"[警告] [{product_name}] 無法獲取當前網頁即時價格，為安全起見，取消下單。")
+                logger.warning(f"[{product_name}] 無法獲取當前網頁即時價格，為安全起見，取消下單。")
                 # Error already logged in _get_current_market_price if it returns None
                 # self._log_error_message(f"{product_name}: 無法獲取當前網頁即時價格，取消下單。觸發價格 ${price:.3f}")
-                return False
+                return None
             
-            print(f"[{product_name}] 檢查時的網頁即時價格: ${current_market_price:.3f}")
+            logger.info(f"[{product_name}] 檢查時的即時價格 ({'API' if live_book is not None else '網頁'}): ${current_market_price:.3f}")
 
             if current_market_price > price:
-                print(f"[警告] [{product_name}] 當前網頁價格 (${current_market_price:.3f}) 已高於觸發價格 (${price:.3f})，取消下單。")
+                logger.warning(f"[{product_name}] 當前網頁價格 (${current_market_price:.3f}) 已高於觸發價格 (${price:.3f})，取消下單。")
                 self._log_error_message(f"{product_name}: 當前網頁價格 (${current_market_price:.3f}) 已高於觸發價格 (${price:.3f})，取消下單。")
-                return False
+                return None
             else:
-                print(f"[{product_name}] 價格檢查通過：網頁即時價格 (${current_market_price:.3f}) <= 觸發價格 (${price:.3f})。")
+                logger.info(f"[{product_name}] 價格檢查通過：網頁即時價格 (${current_market_price:.3f}) <= 觸發價格 (${price:.3f})。")
+            if live_book is not None and plan.levels > 1:  # Orders taken since the scan would be filled at higher prices
+                live_depth = live_book.depth_below(plan.max_price, inclusive=True)
+                if live_depth < buy_quantity:
+                    logger.warning(f"[{product_name}] Only {live_depth} units left at or below ${plan.max_price:.3f}, buying {live_depth}.")
+                    buy_quantity = live_depth
 
             wait = WebDriverWait(self.driver, 15)
             quantity_input = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, 'input[name="quantity"]')))
             quantity_input.click()
             quantity_input.clear()
             quantity_input.send_keys(str(buy_quantity))
-            time.sleep(0.3)
             actual_value = quantity_input.get_attribute('value')
             if str(actual_value) != str(buy_quantity):
-                print(f"send_keys ineffective, using JS to set value...")
+                logger.info("send_keys ineffective, using JS to set value...")
                 self.driver.execute_script(
                     "arguments[0].value = arguments[1]; arguments[0].dispatchEvent(new Event('input', {bubbles:true})); arguments[0].dispatchEvent(new Event('change', {bubbles:true}));",
                     quantity_input, str(buy_quantity)
                 )
-                time.sleep(0.3)
                 actual_value = quantity_input.get_attribute('value')
             if str(actual_value) != str(buy_quantity):
-                print(f"Warning: Failed to fill in quantity field, actual value is {actual_value}")
+                logger.warning(f"Failed to fill in quantity field, actual value is {actual_value}")
             else:
-                print(f"Successfully filled in quantity: {actual_value}")
+                logger.info(f"Successfully filled in quantity: {actual_value}")
 
             purchase_form = quantity_input.find_element(By.XPATH, "./ancestor::form[1]")
             buy_button = WebDriverWait(purchase_form, 15).until(
                 lambda form: form.find_element(By.XPATH, ".//button[contains(@class,'btn-primary') and not(@disabled)]")
             )
 
-            is_button_enabled = False
-            for _ in range(10):
-                if buy_button.is_enabled():
-                    is_button_enabled = True
-                    break
-                time.sleep(0.5)
+            try:
+                WebDriverWait(self.driver, 5, poll_frequency=0.1).until(lambda driver: buy_button.is_enabled())
+                is_button_enabled = True
+            except TimeoutException:
+                is_button_enabled = False
 
             if not is_button_enabled:
                 err_msg = f"Buy button remains disabled for {product_name}, cannot click. Possibly insufficient balance or invalid quantity."
-                print(f"XXX {err_msg} XXX")
+                logger.error(err_msg)
                 self._log_error_message(err_msg)
-                print(f"===================================")
-                return False
+                logger.info("===================================")
+                return None
 
-            print("Clicking buy button...")
+            logger.info("Clicking buy button...")
             market_rows = self.driver.find_elements(By.CSS_SELECTOR, "tr[aria-label*='market order']")
             previous_row_html = market_rows[0].get_attribute("outerHTML") if market_rows else None
-            self._log_trade("ATTEMPTED", product_name, resource_id, order_id, current_market_price, buy_quantity)
+            # Past the first order the fill price is the planned average, which counts against the spend caps
+            trade_price = current_market_price if plan.levels <= 1 else max(current_market_price, plan.vwap)
+            self._log_trade("ATTEMPTED", product_name, resource_id, order_id, trade_price, buy_quantity)
             buy_button.click()
+            return {
+                'product_name': product_name, 'resource_id': resource_id, 'order_id': order_id,
+                'price': trade_price, 'quantity': buy_quantity, 'previous_row_html': previous_row_html
+            }
 
-            result_status, result_detail = self._wait_for_purchase_confirmation(previous_row_html)
+        except (TimeoutException, NoSuchElementException, StaleElementReferenceException) as e_sel_op:
+            err_msg = f"Selenium purchase failed ({product_name}): Error finding element or during operation: {type(e_sel_op).__name__} - {e_sel_op}"
+            logger.error(err_msg)
+            self._log_error_message(err_msg)
+            logger.info("===================================")
+            return None
+        except Exception as e_trigger_buy:
+            err_msg = f"Selenium purchase failed ({product_name}): Unexpected error during purchase: {type(e_trigger_buy).__name__} - {e_trigger_buy}"
+            logger.exception(err_msg)
+            self._log_error_message(f"{err_msg}\n{traceback.format_exc()}")
+            logger.info("===================================")
+            return None
+
+    def _confirm_buy_order(self, ticket):
+        """Wait for the result of a submitted order on the current tab, log it and return True if confirmed."""
+        product_name, resource_id, order_id = ticket['product_name'], ticket['resource_id'], ticket['order_id']
+        current_market_price, buy_quantity = ticket['price'], ticket['quantity']
+        try:
+            result_status, result_detail = self._wait_for_purchase_confirmation(ticket['previous_row_html'])
             if result_status == "confirmed":
                 self._log_trade("CONFIRMED", product_name, resource_id, order_id, current_market_price, buy_quantity, result_detail)
-                print(f">>> Purchase confirmed for {product_name} <<<")
+                logger.info(f">>> Purchase confirmed for {product_name} <<<")
+                if self.cash_service is not None:
+                    self.cash_service.debit(current_market_price * buy_quantity)
                 return True
 
             if result_status == "rejected":
@@ -323,23 +718,301 @@ class AutoBuyer:
                 return False
 
             self._log_trade("UNKNOWN", product_name, resource_id, order_id, current_market_price, buy_quantity, result_detail)
+            if self.cash_service is not None:
+                self.cash_service.invalidate()  # The trade may have gone through; re-read before the next one
             self._log_error_message(f"Purchase result unknown for {product_name}: {result_detail}")
             return False
-
-        except (TimeoutException, NoSuchElementException, StaleElementReferenceException) as e_sel_op:
-            err_msg = f"Selenium purchase failed ({product_name}): Error finding element or during operation: {type(e_sel_op).__name__} - {e_sel_op}"
-            print(f"XXX {err_msg} XXX")
-            self._log_error_message(err_msg)
-            print(f"===================================")
-            return False
-        except Exception as e_trigger_buy:
-            err_msg = f"Selenium purchase failed ({product_name}): Unexpected error during purchase: {type(e_trigger_buy).__name__} - {e_trigger_buy}"
-            print(f"XXX {err_msg} XXX")
+        except Exception as e_confirm:
+            err_msg = f"Selenium purchase result check failed ({product_name}): {type(e_confirm).__name__} - {e_confirm}"
+            logger.error(err_msg)
+            self._log_trade("UNKNOWN", product_name, resource_id, order_id, current_market_price, buy_quantity, err_msg)
+            if self.cash_service is not None:
+                self.cash_service.invalidate()
             self._log_error_message(f"{err_msg}\n{traceback.format_exc()}")
-            traceback.print_exc()
-            print(f"===================================")
             return False
 
+    def _ensure_driver(self, user_data_dir_autobuy):
+        if self.warm_driver is not None:  # Health-checked on every use, restarted if it crashed
+            self.driver = self.warm_driver.get()
+        elif self.driver is None:
+            logger.info("Initializing Selenium WebDriver in AutoBuyer.main_loop via driver_utils.initialize_driver()...")
+            try:
+                self.driver = initialize_driver(user_data_dir=user_data_dir_autobuy, user_data_dir_env_var="USER_DATA_DIR_autobuy")
+            except Exception as e_wd_init: # Catch specific exception for logging
+                err_msg = f"WebDriver initialization failed: {type(e_wd_init).__name__} - {e_wd_init}"
+                logger.error(err_msg)
+                self._log_error_message(err_msg) # Log the error
+                raise # Re-raise the exception to stop the process if critical
+        return self.driver
+
+    def _check_login(self, product_name, market_page_url):
+        """Open the market page and wait for the purchase form as a login indicator; prompt for a manual login if missing."""
+        logger.info(f"Navigating to market page for login check ({product_name}): {market_page_url}")
+        self.driver.get(market_page_url)
+        login_confirmed = False
+        try:
+            login_check_element_selector = 'input[name="quantity"]'
+            logger.info(f"Waiting for login indicator element ({login_check_element_selector}) to be visible and clickable...")
+            # Robust wait: retry if StaleElementReferenceException occurs
+            wait = WebDriverWait(self.driver, 20)
+            for attempt in range(3):
+                try:
+                    wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, login_check_element_selector)))
+                    logger.info("Login status OK.")
+                    login_confirmed = True
+                    break
+                except StaleElementReferenceException:
+                    logger.info(f"StaleElementReferenceException caught while waiting for login element, retrying ({attempt+1}/3)...")
+                    time.sleep(1)
+                    continue
+            else:
+                err_msg = "Failed to get a stable reference to the login element after retries."
+                logger.error(err_msg)
+                self._log_error_message(f"Login check for {product_name}: {err_msg}")
+                # Instead of raising, just log and skip this attempt
+                login_confirmed = False # Ensure it's false
+        except TimeoutException:
+            err_msg = "Login indicator element not found within expected time."
+            logger.warning("*"*20)
+            logger.error(err_msg)
+            self._log_error_message(f"Login check for {product_name}: {err_msg} - Manual login might be required.")
+            logger.warning(">>> You may need to log in to SimCompanies manually <<<")
+            input(">>> After logging in, return here and press Enter to continue <<<")
+            logger.warning("*"*20)
+            logger.info("Trying to refresh the page and check login status again...")
+            self.driver.refresh()
+            try:
+                wait = WebDriverWait(self.driver, 15)
+                for attempt_refresh in range(3):
+                    try:
+                        wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, login_check_element_selector)))
+                        logger.info("Login confirmed after refresh.")
+                        login_confirmed = True
+                        break
+                    except StaleElementReferenceException:
+                        logger.info(f"StaleElementReferenceException caught after refresh, retrying ({attempt_refresh+1}/3)...")
+                        time.sleep(1)
+                        continue
+                else:
+                    err_msg = "Still unable to confirm login status after refresh. Subsequent purchase may fail."
+                    logger.error(err_msg)
+                    self._log_error_message(f"Login check for {product_name}: {err_msg}")
+            except TimeoutException:
+                err_msg = "Still unable to confirm login status after refresh. Subsequent purchase may fail."
+                logger.error(err_msg)
+                self._log_error_message(f"Login check for {product_name}: {err_msg}")
+        return login_confirmed
+
+    def _execute_purchase(self, product_name, product_info, lowest_order, user_data_dir_autobuy, depth_orders=None):
+        """Buy ``lowest_order``, and the rest of ``depth_orders`` if given, over HTTP or through the browser.
+
+        Returns True if a purchase was attempted.
+        """
+        price = lowest_order['price']
+        http_outcome = None
+        if PURCHASE_BACKENDS.get(product_name, PURCHASE_BACKEND) == "http":
+            http_outcome = self._buy_over_http(product_name, product_info, lowest_order['id'],
+                                               price, lowest_order['quantity'], depth_orders=depth_orders)
+        if http_outcome is not None:
+            logger.info(f"HTTP buy operation ({product_name}) {'completed successfully' if http_outcome else 'was not confirmed; see the trade log for status'}.")
+            return True
+        else:  # Selenium purchase flow (also the fallback when the HTTP backend is unavailable)
+            self._ensure_driver(user_data_dir_autobuy)
+
+            resource_id = self._extract_resource_id(product_info['url'])
+            if resource_id is None:
+                err_msg = f"Unable to start purchase for {product_name}, could not parse resource ID. Skipping this product."
+                logger.error(err_msg)
+                self._log_error_message(err_msg)
+                return False
+
+            market_page_url = f"{SIMCOMPANIES_BASE_URL}/market/resource/{resource_id}/"
+            price_recheck = self._start_price_recheck(product_name, product_info)  # Runs during the login check
+
+            if self.login_state is not None and self.login_state.is_fresh():
+                logger.info(f"Login verified {time.time() - self.login_state.verified_at:.0f}s ago, skipping the login check navigation ({product_name}).")
+                login_confirmed = True
+            else:
+                login_confirmed = self._check_login(product_name, market_page_url)
+                if login_confirmed and self.login_state is not None:
+                    self.login_state.mark_verified()
+
+            if login_confirmed:
+                success = self.trigger_buy_action(  # Pass product details
+                    product_name=product_name,
+                    product_info=product_info,
+                    order_id=lowest_order['id'],
+                    price=price,
+                    quantity_available=lowest_order['quantity'],
+                    depth_orders=depth_orders,
+                    price_recheck=price_recheck
+                )
+                if self.login_state is not None:
+                    if success:
+                        self.login_state.mark_verified()
+                    else:
+                        self.login_state.observe_url(self.driver.current_url)
+                if success:
+                    logger.info(f"Selenium buy operation ({product_name}) completed successfully.")
+                else:
+                    logger.info(f"Selenium buy operation ({product_name}) was not confirmed; see the trade log for status.")
+                return True
+            else:
+                err_msg = f"Login not confirmed ({product_name}), skipping this purchase attempt."
+                logger.error(err_msg)
+                self._log_error_message(err_msg) # Log the failure
+                return False
+
+    def _make_opportunity(self, product_name, product_info, lowest_order, second_lowest_price, threshold_price,
+                          depth_orders=None):
+        """A triggered order ranked by its expected saving (capped fill across ``depth_orders`` vs the second-lowest price)."""
+        plan = self._plan_purchase(product_name, depth_orders or [lowest_order])
+        return Opportunity(
+            product_name, lowest_order['id'],
+            priority=plan.quantity * second_lowest_price - plan.cost,
+            payload={'product_info': product_info, 'lowest_order': lowest_order, 'threshold_price': threshold_price,
+                     'depth_orders': depth_orders}
+        )
+
+    def _enqueue_opportunity(self, opportunity):
+        """Hand a triggered order to the executor worker."""
+        if self.opportunity_queue.put(opportunity):
+            logger.info(f"Queued purchase of {opportunity.product_name} order {opportunity.order_id} (saving ~${opportunity.priority:,.2f}).")
+        else:
+            logger.info(f"Purchase of {opportunity.product_name} order {opportunity.order_id} not queued (already executing or outranked).")
+
+    def _execute_opportunity(self, opportunity, user_data_dir_autobuy):
+        age = time.monotonic() - opportunity.created_at
+        logger.info(f"--- Executing queued purchase: {opportunity.product_name} order {opportunity.order_id} "
+              f"(queued {age:.1f}s ago) ---")
+        self._execute_purchase(opportunity.product_name, opportunity.payload['product_info'],
+                               opportunity.payload['lowest_order'], user_data_dir_autobuy,
+                               depth_orders=opportunity.payload.get('depth_orders'))
+
+    def _execute_batch(self, opportunities, user_data_dir_autobuy):
+        """Buy several triggered orders, largest saving first; browser purchases share one tab per order."""
+        opportunities = sorted(opportunities, key=lambda opportunity: opportunity.priority, reverse=True)
+        in_browser = [o for o in opportunities if PURCHASE_BACKENDS.get(o.product_name, PURCHASE_BACKEND) != "http"]
+        for opportunity in opportunities:
+            if opportunity not in in_browser:  # One request each; falls back to a single-tab purchase if needed
+                self._execute_purchase(opportunity.product_name, opportunity.payload['product_info'],
+                                       opportunity.payload['lowest_order'], user_data_dir_autobuy,
+                                       depth_orders=opportunity.payload.get('depth_orders'))
+        for start in range(0, len(in_browser), AUTOBUY_BATCH_MAX_TABS):
+            chunk = in_browser[start:start + AUTOBUY_BATCH_MAX_TABS]
+            if len(chunk) == 1:
+                self._execute_purchase(chunk[0].product_name, chunk[0].payload['product_info'],
+                                       chunk[0].payload['lowest_order'], user_data_dir_autobuy,
+                                       depth_orders=chunk[0].payload.get('depth_orders'))
+            else:
+                self._buy_in_tabs(chunk, user_data_dir_autobuy)
+
+    def _buy_in_tabs(self, opportunities, user_data_dir_autobuy):
+        """Open one tab per order so the market pages load in parallel, then submit every order before confirming any.
+
+        The cash reserve is checked against one balance read for the whole
+        batch, minus the cost of the orders already submitted. Returns the
+        number of orders submitted.
+        """
+        driver = self._ensure_driver(user_data_dir_autobuy)
+        available_cash = self.cash_service.balance() if self.cash_service is not None else None
+        if available_cash is None:
+            available_cash = get_current_money(driver)  # Uses the current tab, before the market tabs open
+        if available_cash is None:
+            for opportunity in opportunities:
+                lowest_order = opportunity.payload['lowest_order']
+                self._log_trade("REJECTED", opportunity.product_name, self._extract_resource_id(opportunity.payload['product_info']['url']),
+                                lowest_order['id'], lowest_order['price'], 0, "cash unavailable")
+            return 0
+
+        logger.info(f"===========Batch purchase: opening {len(opportunities)} market tabs ===========")
+        original_handle = driver.current_window_handle
+        tabs = []
+        tickets = []
+        try:
+            for opportunity in opportunities:
+                resource_id = self._extract_resource_id(opportunity.payload['product_info']['url'])
+                if resource_id is None:
+                    err_msg = f"Unable to start purchase for {opportunity.product_name}, could not parse resource ID. Skipping this product."
+                    logger.error(err_msg)
+                    self._log_error_message(err_msg)
+                    continue
+                known_handles = set(driver.window_handles)
+                # window.open returns before the page loads, so every tab loads at the same time
+                driver.execute_script("window.open(arguments[0], '_blank');",
+                                      f"{SIMCOMPANIES_BASE_URL}/market/resource/{resource_id}/")
+                new_handles = [handle for handle in driver.window_handles if handle not in known_handles]
+                if not new_handles:
+                    self._log_error_message(f"Could not open a market tab for {opportunity.product_name} (blocked popup?).")
+                    continue
+                tabs.append((new_handles[0], opportunity))
+
+            committed_cost = 0.0
+            for handle, opportunity in tabs:
+                driver.switch_to.window(handle)
+                # Started per tab, so the price is fresh when this order is submitted after the earlier ones
+                price_recheck = self._start_price_recheck(opportunity.product_name, opportunity.payload['product_info'])
+                try:
+                    WebDriverWait(driver, 20).until(
+                        EC.element_to_be_clickable((By.CSS_SELECTOR, 'input[name="quantity"]'))
+                    )
+                except TimeoutException:
+                    err_msg = f"Login not confirmed ({opportunity.product_name}), skipping this purchase attempt."
+                    logger.error(err_msg)
+                    self._log_error_message(err_msg)
+                    if self.login_state is not None:
+                        self.login_state.observe_url(driver.current_url)
+                    continue
+                if self.login_state is not None:
+                    self.login_state.mark_verified()
+                lowest_order = opportunity.payload['lowest_order']
+                ticket = self._submit_buy_order(
+                    opportunity.product_name, opportunity.payload['product_info'], lowest_order['id'],
+                    lowest_order['price'], lowest_order['quantity'], available_cash=available_cash - committed_cost,
+                    depth_orders=opportunity.payload.get('depth_orders'), price_recheck=price_recheck
+                )
+                if ticket is not None:
+                    committed_cost += ticket['price'] * ticket['quantity']
+                    tickets.append((handle, ticket))
+
+            for handle, ticket in tickets:  # Orders are already placed; collect their results
+                driver.switch_to.window(handle)
+                if self._confirm_buy_order(ticket):
+                    logger.info(f"Selenium buy operation ({ticket['product_name']}) completed successfully.")
+                else:
+                    logger.info(f"Selenium buy operation ({ticket['product_name']}) was not confirmed; see the trade log for status.")
+        finally:
+            for handle, _ in tabs:
+                try:
+                    driver.switch_to.window(handle)
+                    driver.close()
+                except WebDriverException:
+                    pass  # Tab already gone
+            try:
+                driver.switch_to.window(original_handle)
+            except WebDriverException as e_switch:
+                self._log_error_message(f"Could not return to the original browser tab: {type(e_switch).__name__} - {e_switch}")
+        return len(tickets)
+
+    def _release_driver(self):
+        """After a batch of purchases: keep a warm driver open (replacing it if needed) or close the per-cycle one."""
+        if self.cookie_bridge is not None and self.driver is not None:
+            self.cookie_bridge.refresh(driver=self.driver)  # Pick up cookies the site rotated during the purchase
+        if self.warm_driver is not None:  # Keep the browser open; replace it only if crashed or expired
+            self.driver = None
+            self.warm_driver.maintain()
+        elif self.driver: # If WebDriver was initialized in this cycle
+            logger.info("Ensuring WebDriver is closed at the end of the product check iteration...")
+            try:
+                self.driver.quit()
+                logger.info("WebDriver closed successfully after product check iteration.")
+            except Exception as e_wd_quit:  # Catch more general exceptions during quit
+                err_msg = f"Error closing WebDriver after product check iteration: {type(e_wd_quit).__name__} - {e_wd_quit}"
+                logger.error(err_msg)
+                self._log_error_message(err_msg) # Log the error
+            finally:
+                self.driver = None  # Important to reset for the next full cycle or if buy condition met again
+
     def main_loop(self):
         # self.driver is initialized to None in __init__ and will be (re)created here if needed.
         # Any driver passed via __init__ is no longer accepted.
@@ -350,25 +1023,77 @@ class AutoBuyer:
             if not os.path.exists(user_data_dir_autobuy):
                 raise FileNotFoundError(f"The specified user data directory for autobuy does not exist: {user_data_dir_autobuy}")
             
-            print(f"AutoBuyer will use profile: {user_data_dir_autobuy}")
+            logger.info(f"AutoBuyer will use profile: {user_data_dir_autobuy}")
+            if self.cookie_bridge is not None:
+                self.cookie_bridge.refresh()  # Before the cash refresh thread needs them
+            if self.cash_service is not None:
+                self.cash_service.start(CASH_REFRESH_INTERVAL_SECONDS)
+            if AUTOBUY_WARM_DRIVER:
+                first_resource_id = next(
+                    (rid for rid in map(self._extract_resource_id, (info['url'] for info in self.TARGET_PRODUCTS.values()))
+                     if rid is not None), None)
+                self.warm_driver = WarmDriver(
+                    user_data_dir=user_data_dir_autobuy,
+                    user_data_dir_env_var="USER_DATA_DIR_autobuy",
+                    idle_timeout=AUTOBUY_WARM_DRIVER_IDLE_SECONDS,
+                    max_age=AUTOBUY_WARM_DRIVER_MAX_AGE_SECONDS,
+                    warm_url=f"{SIMCOMPANIES_BASE_URL}/market/resource/{first_resource_id}/" if first_resource_id else None
+                )
+                self.warm_driver.start()  # Open the browser now so the first purchase does not wait for Chrome
+            if self.opportunity_queue is not None:
+                self.pipeline_worker = PipelineWorker(
+                    self.opportunity_queue,
+                    handler=lambda opportunity: self._execute_opportunity(opportunity, user_data_dir_autobuy),
+                    batch_handler=lambda batch: self._execute_batch(batch, user_data_dir_autobuy),
+                    batch_size=AUTOBUY_BATCH_MAX_TABS if AUTOBUY_BATCH_PURCHASE_ENABLED else 1,
+                    on_idle=self._release_driver
+                )
+                self.pipeline_worker.start()
             while True:
                 purchase_attempted_in_cycle = False
+                pending_purchases = []  # Triggered orders for the batch purchase after the scan
                 api_error_in_cycle = False  # New flag for API errors
-                print("\n" + "=" * 15 + " Starting new check cycle (all target products) " + "=" * 15)
-
-                # --- Shuffle product order to avoid pattern ---
                 import random
-                product_items = list(self.TARGET_PRODUCTS.items())
-                random.shuffle(product_items)
+                cycle_started_at = time.monotonic()
+                if self.cookie_bridge is not None:
+                    self.cookie_bridge.ensure_fresh()
+                if self.pacer is not None and self.scheduler is not None:
+                    self.scheduler.budget_per_second = self.pacer.rate  # Adaptive polls share the learned rate
+                if self.scheduler is not None:  # Only the products whose adaptive poll time has come
+                    product_items = [(name, self.TARGET_PRODUCTS[name]) for name in self.scheduler.due()]
+                    if not product_items:
+                        wait_seconds = max(1.0, self.scheduler.seconds_until_next())
+                        logger.info(f"No product due yet, sleeping {wait_seconds:.1f}s until the next scheduled poll...")
+                        time.sleep(wait_seconds)
+                        continue
+                else:
+                    # --- Shuffle product order to avoid pattern ---
+                    product_items = list(self.TARGET_PRODUCTS.items())
+                    random.shuffle(product_items)
+                logger.info("=" * 15 + f" Starting new check cycle ({len(product_items)} products) " + "=" * 15)
+
+                concurrent_scan = self.scan_mode == "concurrent"
+                if HTTP_WARMUP_ENABLED:
+                    self._warm_up_connections(product_items, AUTOBUY_SCAN_MAX_WORKERS if concurrent_scan else 1)
+                prefetched = self.scan_market(product_items) if concurrent_scan else None
+                decision = None
+                if concurrent_scan:
+                    product_items, decision = self._rank_by_opportunity(product_items, prefetched)
 
                 for product_name, product_info in product_items:
-                    if api_error_in_cycle:  # If an error occurred, skip remaining products for this cycle
-                        print(f"Skipping remaining products in this cycle due to an earlier API error.")
+                    if api_error_in_cycle and not concurrent_scan:  # If an error occurred, skip remaining products for this cycle
+                        logger.warning("Skipping remaining products in this cycle due to an earlier API error.")
                         break
 
-                    print(f"\n--- Checking product: {product_name} (Q{product_info['quality']}) ---")
+                    logger.info(f"--- Checking product: {product_name} (Q{product_info['quality']}) ---")
 
-                    market_data, fetch_error = self.get_market_data(product_name, product_info)
+                    if concurrent_scan:
+                        market_data, fetch_error = prefetched.get(product_name, (None, {'kind': 'cancelled'}))
+                        if fetch_error.get('kind') == 'cancelled':
+                            logger.info(f"Fetch for {product_name} was cancelled after an HTTP 429 in this scan.")
+                            continue
+                    else:
+                        market_data, fetch_error = self.get_market_data(product_name, product_info)
 
                     if market_data is None:
                         kind = fetch_error.get('kind', 'unknown')
@@ -379,155 +1104,96 @@ class AutoBuyer:
                             f"Market fetch failed for {product_name}: kind={kind}, "
                             f"http_status={status_code}, retry_after={retry_after}, message={message}"
                         )
-                        print(detail)
+                        logger.warning(detail)
                         if kind not in ('empty_market', 'no_valid_orders'):
                             self._log_error_message(detail)
                         if kind == 'rate_limited':
                             api_error_in_cycle = True
+                            if concurrent_scan:
+                                continue  # Data already fetched for other products is still evaluated
                             break
-                        time.sleep(AUTOBUY_PRODUCT_DELAY_MIN_SECONDS)
+                        if not concurrent_scan:
+                            time.sleep(AUTOBUY_PRODUCT_DELAY_MIN_SECONDS)
                         continue
 
                     # Proceed if market_data is not None
-                    if 'lowest_order' in market_data and 'second_lowest_price' in market_data:
+                    self._record_price_history(product_name, market_data)
+                    self._schedule_next_poll(product_name, market_data)
+                    content_hash = market_data.get('content_hash')
+                    if content_hash and self._idle_book_hashes.get(product_name) == content_hash:
+                        logger.info(f"Order book unchanged since last check ({product_name}, cache: {market_data.get('cache_status')}), skipping threshold evaluation.")
+                    elif 'lowest_order' in market_data and 'second_lowest_price' in market_data:
                         lowest_order = market_data['lowest_order']
                         lowest_price = lowest_order['price']
                         second_lowest_price = market_data['second_lowest_price']
 
                         threshold = BUY_THRESHOLDS.get(product_name, BUY_THRESHOLD_PERCENTAGE)
-                        buy_threshold_price = second_lowest_price * threshold
-                        print(f"Threshold calculation ({product_name}): 2nd lowest price ${second_lowest_price:.3f} at {threshold*100:.1f}% = ${buy_threshold_price:.3f}")
-
-                        if lowest_price < buy_threshold_price:
-                            print(f"***> Condition met ({product_name})! Lowest price ${lowest_price:.3f} < threshold ${buy_threshold_price:.3f}")
-                            if self.driver is None:
-                                print("Initializing Selenium WebDriver in AutoBuyer.main_loop via driver_utils.initialize_driver()...")
-                                try:
-                                    self.driver = initialize_driver(user_data_dir=user_data_dir_autobuy, user_data_dir_env_var="USER_DATA_DIR_autobuy")
-                                except Exception as e_wd_init: # Catch specific exception for logging
-                                    err_msg = f"WebDriver initialization failed: {type(e_wd_init).__name__} - {e_wd_init}"
-                                    print(err_msg)
-                                    self._log_error_message(err_msg) # Log the error
-                                    raise # Re-raise the exception to stop the process if critical
-
-                            resource_id = self._extract_resource_id(product_info['url'])
-                            if resource_id is None:
-                                err_msg = f"Unable to start purchase for {product_name}, could not parse resource ID. Skipping this product."
-                                print(f"XXX {err_msg} XXX")
-                                self._log_error_message(err_msg)
-                                continue
-
-                            market_page_url = f"https://www.simcompanies.com/market/resource/{resource_id}/"
-
-                            print(f"Navigating to market page for login check ({product_name}): {market_page_url}")
-                            self.driver.get(market_page_url)
-                            login_confirmed = False
-                            try:
-                                login_check_element_selector = 'input[name="quantity"]'
-                                print(f"Waiting for login indicator element ({login_check_element_selector}) to be visible and clickable...")
-                                # Robust wait: retry if StaleElementReferenceException occurs
-                                wait = WebDriverWait(self.driver, 20)
-                                for attempt in range(3):
-                                    try:
-                                        wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, login_check_element_selector)))
-                                        print("Login status OK.")
-                                        login_confirmed = True
-                                        break
-                                    except StaleElementReferenceException:
-                                        print(f"StaleElementReferenceException caught while waiting for login element, retrying ({attempt+1}/3)...")
-                                        time.sleep(1)
-                                        continue
-                                else:
-                                    err_msg = "Failed to get a stable reference to the login element after retries."
-                                    print(f"XXX {err_msg} XXX")
-                                    self._log_error_message(f"Login check for {product_name}: {err_msg}")
-                                    # Instead of raising, just log and skip this attempt
-                                    login_confirmed = False # Ensure it's false
-                            except TimeoutException:
-                                err_msg = "Login indicator element not found within expected time."
-                                print("\n" + "*"*20)
-                                print(f"Warning: {err_msg}")
-                                self._log_error_message(f"Login check for {product_name}: {err_msg} - Manual login might be required.")
-                                print(">>> You may need to log in to SimCompanies manually <<<")
-                                input(">>> After logging in, return here and press Enter to continue <<<")
-                                print("*"*20 + "\n")
-                                print("Trying to refresh the page and check login status again...")
-                                self.driver.refresh()
-                                try:
-                                    wait = WebDriverWait(self.driver, 15)
-                                    for attempt_refresh in range(3):
-                                        try:
-                                            wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, login_check_element_selector)))
-                                            print("Login confirmed after refresh.")
-                                            login_confirmed = True
-                                            break
-                                        except StaleElementReferenceException:
-                                            print(f"StaleElementReferenceException caught after refresh, retrying ({attempt_refresh+1}/3)...")
-                                            time.sleep(1)
-                                            continue
-                                    else:
-                                        err_msg = "Still unable to confirm login status after refresh. Subsequent purchase may fail."
-                                        print(f"XXX Warning: {err_msg} XXX")
-                                        self._log_error_message(f"Login check for {product_name}: {err_msg}")
-                                except TimeoutException:
-                                    err_msg = "Still unable to confirm login status after refresh. Subsequent purchase may fail."
-                                    print(f"XXX Warning: {err_msg} XXX")
-                                    self._log_error_message(f"Login check for {product_name}: {err_msg}")
-
-                            if login_confirmed:
-                                success = self.trigger_buy_action(  # Pass product details
-                                    product_name=product_name,
-                                    product_info=product_info,
-                                    order_id=lowest_order['id'],
-                                    price=lowest_price,
-                                    quantity_available=lowest_order['quantity']
-                                )
-                                purchase_attempted_in_cycle = True  # Mark that an attempt was made in this cycle
-                                if success:
-                                    print(f"Selenium buy operation ({product_name}) completed successfully.")
-                                else:
-                                    print(f"Selenium buy operation ({product_name}) was not confirmed; see trade_events.txt for status.")
-                            else:
-                                err_msg = f"Login not confirmed ({product_name}), skipping this purchase attempt."
-                                print(err_msg)
-                                self._log_error_message(err_msg) # Log the failure
+                        row = decision.index_of(product_name) if decision is not None else None
+                        if row is not None:  # The catalog already applied the buy rule to the whole scan
+                            buy_threshold_price = float(decision.threshold_prices[row])
+                            condition_met = bool(decision.triggered[row])
+                        else:
+                            buy_threshold_price = second_lowest_price * threshold
+                            condition_met = lowest_price < buy_threshold_price
+                        logger.info(f"Threshold calculation ({product_name}): 2nd lowest price ${second_lowest_price:.3f} at {threshold*100:.1f}% = ${buy_threshold_price:.3f}")
+
+                        if condition_met:
+                            logger.info(f"***> Condition met ({product_name})! Lowest price ${lowest_price:.3f} < threshold ${buy_threshold_price:.3f}")
+                            self._idle_book_hashes.pop(product_name, None)
+                            depth_orders = market_data.get('orders_below_threshold')
+                            if depth_orders:
+                                logger.info(f"Depth below threshold ({product_name}): {sum(order['quantity'] for order in depth_orders)} "
+                                            f"units in {len(depth_orders)} order(s), up to ${depth_orders[-1]['price']:.3f}.")
+                            opportunity = self._make_opportunity(product_name, product_info, lowest_order,
+                                                                 second_lowest_price, buy_threshold_price, depth_orders)
+                            if self.opportunity_queue is not None:  # The executor worker buys it; keep scanning
+                                self._enqueue_opportunity(opportunity)
+                            elif AUTOBUY_BATCH_PURCHASE_ENABLED:  # Bought together after the scan
+                                pending_purchases.append(opportunity)
+                            elif self._execute_purchase(product_name, product_info, lowest_order, user_data_dir_autobuy,
+                                                        depth_orders=depth_orders):
+                                purchase_attempted_in_cycle = True
 
                         else:
-                            print(f"---> Condition not met ({product_name}). Lowest price ${lowest_price:.3f} >= threshold ${buy_threshold_price:.3f}")
+                            logger.info(f"---> Condition not met ({product_name}). Lowest price ${lowest_price:.3f} >= threshold ${buy_threshold_price:.3f}")
+                            self._idle_book_hashes[product_name] = content_hash
 
                     elif 'lowest_order' in market_data:  # market_data is not None here
                         lowest_order = market_data['lowest_order']
-                        print(f"Only one price level found ({product_name}: lowest order ID:{lowest_order['id']}, ${lowest_order['price']:.3f}, {lowest_order['quantity']} units), cannot compare, skipping trigger check.")
+                        logger.info(f"Only one price level found ({product_name}: lowest order ID:{lowest_order['id']}, ${lowest_order['price']:.3f}, {lowest_order['quantity']} units), cannot compare, skipping trigger check.")
+                        self._idle_book_hashes[product_name] = content_hash
                     else:  # market_data is not None, but doesn't have expected keys
                         err_msg = f"Not enough market data obtained this check ({product_name}: missing lowest order and/or second lowest price), will retry later."
-                        print(err_msg)
+                        logger.error(err_msg)
                         self._log_error_message(err_msg) # Log the error
 
-                    if not api_error_in_cycle:  # Only sleep if no API error caused an early break
+                    if not api_error_in_cycle and not concurrent_scan:  # Only sleep if no API error caused an early break
                         # --- Add random jitter between product checks (2-8s) ---
                         sleep_time = random.uniform(
                             AUTOBUY_PRODUCT_DELAY_MIN_SECONDS,
                             AUTOBUY_PRODUCT_DELAY_MAX_SECONDS
                         )
-                        print(f"Sleeping {sleep_time:.2f} seconds before next product check...")
+                        if self.pacer is not None:
+                            sleep_time = random.uniform(0.8, 1.2) / self.pacer.rate
+                        logger.info(f"Sleeping {sleep_time:.2f} seconds before next product check...")
                         time.sleep(sleep_time)
 
-                if self.driver: # If WebDriver was initialized in this cycle
-                    print("\nEnsuring WebDriver is closed at the end of the product check iteration...")
-                    try:
-                        self.driver.quit()
-                        print("WebDriver closed successfully after product check iteration.")
-                    except Exception as e_wd_quit:  # Catch more general exceptions during quit
-                        err_msg = f"Error closing WebDriver after product check iteration: {type(e_wd_quit).__name__} - {e_wd_quit}"
-                        print(err_msg)
-                        self._log_error_message(err_msg) # Log the error
-                    finally:
-                        self.driver = None  # Important to reset for the next full cycle or if buy condition met again
+                if pending_purchases:
+                    logger.info(f"--- Buying {len(pending_purchases)} triggered products together ---")
+                    self._execute_batch(pending_purchases, user_data_dir_autobuy)
+                    purchase_attempted_in_cycle = True
+                if self.pipeline_worker is None:  # The executor worker releases the driver when its queue drains
+                    self._release_driver()
 
                 # --- Increase and randomize sleep duration between cycles ---
                 min_sleep = DEFAULT_CHECK_INTERVAL_SECONDS * 0.8
                 max_sleep = DEFAULT_CHECK_INTERVAL_SECONDS * 2.5
                 sleep_duration_seconds = random.uniform(min_sleep, max_sleep)
+                if self.scheduler is not None:
+                    sleep_duration_seconds = max(1.0, self.scheduler.seconds_until_next())
+                elif self.pacer is not None:  # Start the next sweep once the learned rate allows it
+                    sweep_seconds = len(product_items) / self.pacer.rate - (time.monotonic() - cycle_started_at)
+                    sleep_duration_seconds = max(1.0, sweep_seconds * random.uniform(0.8, 1.2))
 
                 if api_error_in_cycle:
                     self._consecutive_rate_limits += 1
@@ -535,33 +1201,58 @@ class AutoBuyer:
                         AUTOBUY_RATE_LIMIT_BASE_DELAY_SECONDS * (2 ** (self._consecutive_rate_limits - 1)),
                         1800
                     )
+                    if self.pacer is not None:  # The rate cut replaces exponential growth; wait out Retry-After only
+                        backoff = self.rate_limiter.blocked_for() or AUTOBUY_RATE_LIMIT_BASE_DELAY_SECONDS
                     sleep_duration_seconds = max(backoff, sleep_duration_seconds)
-                    print(f"\nHTTP 429 occurred. Consecutive rate limits: {self._consecutive_rate_limits}; backing off {sleep_duration_seconds:.2f}s.")
+                    logger.warning(f"HTTP 429 occurred. Consecutive rate limits: {self._consecutive_rate_limits}; backing off {sleep_duration_seconds:.2f}s.")
                 else:
                     self._consecutive_rate_limits = 0
-                    print(f"\nAll product checks complete for this cycle, sleeping for {sleep_duration_seconds:.2f} seconds...")
+                    logger.info(f"All product checks complete for this cycle, sleeping for {sleep_duration_seconds:.2f} seconds...")
+                if self.session.timer is not None:
+                    logger.info(f"HTTP timings this cycle: {self.session.timer.summary()}")
+                    self.session.timer.reset()
+                if self.opportunity_queue is not None:
+                    logger.info(f"Purchase queue: {len(self.opportunity_queue)} waiting; {self.opportunity_queue.summary()}")
+                if self.trade_ledger is not None:
+                    logger.info(f"Confirmed spend today: ${self.trade_ledger.spend():,.2f}")  # Also writes pending events
+                if self.pacer is not None:
+                    logger.info(f"Pacing: {self.pacer.summary()}")
+                    self.pacer.save()
 
                 time.sleep(sleep_duration_seconds)
 
         except WebDriverException as e_wd_main:
             err_msg = f"Error occurred while starting or operating WebDriver: {type(e_wd_main).__name__} - {e_wd_main}"
-            print(f"XXX {err_msg} XXX")
+            logger.exception(err_msg)
             self._log_error_message(f"{err_msg}\n{traceback.format_exc()}") # Log with stack trace
-            traceback.print_exc()
         except Exception as e_main_loop:
             err_msg = f"Unexpected error occurred during main loop: {type(e_main_loop).__name__} - {e_main_loop}"
-            print(f"XXX {err_msg} XXX")
+            logger.exception(err_msg)
             self._log_error_message(f"{err_msg}\n{traceback.format_exc()}") # Log with stack trace
-            traceback.print_exc()
         finally:
+            if self.pipeline_worker is not None:
+                self.pipeline_worker.stop(timeout=BUY_REQUEST_TIMEOUT * 2)  # Let a purchase in progress finish
+            if self.warm_driver is not None:
+                self.driver = None  # Owned by the warm driver, closed below
+                self.warm_driver.quit()
             if self.driver:
-                print("Closing Selenium WebDriver due to an exception or loop termination in finally block...")
+                logger.info("Closing Selenium WebDriver due to an exception or loop termination in finally block...")
                 try:
                     self.driver.quit()
-                    print("WebDriver closed successfully in finally block.")
+                    logger.info("WebDriver closed successfully in finally block.")
                 except Exception as e_wd_finally_quit:  # Catch more general exceptions during quit
                     err_msg = f"Error closing WebDriver in finally block: {type(e_wd_finally_quit).__name__} - {e_wd_finally_quit}"
-                    print(err_msg)
+                    logger.error(err_msg)
                     self._log_error_message(err_msg) # Log the error
                 finally:
                     self.driver = None  # Ensure it's reset
+            if self.cash_service is not None:
+                self.cash_service.stop()
+            if self.price_recheck_executor is not None:
+                self.price_recheck_executor.shutdown(wait=False)
+            if self.price_history is not None:
+                self.price_history.flush()
+            if self.trade_ledger is not None:
+                self.trade_ledger.close()
+            if isinstance(self.rate_limiter, SharedTokenBucket):
+                self.rate_limiter.close()  # Release this process's share of the host budget
@@ -1,65 +1,114 @@
-import requests
+import logging
 import time
 # Import shared configurations
 from config import (
     BUY_THRESHOLD_PERCENTAGE, DEFAULT_CHECK_INTERVAL_SECONDS,
     MARKET_REQUEST_TIMEOUT as REQUEST_TIMEOUT,
-    TARGET_PRODUCTS, MARKET_HEADERS, COOKIES
+    TARGET_PRODUCTS, MARKET_HEADERS, COOKIES,
+    MARKET_JSON_DECODER, MARKET_ORDERS_SORTED_BY_PRICE,
+    HTTP_CACHE_ENABLED, HTTP_CACHE_STALE_SECONDS, HTTP_WARMUP_ENABLED,
+    AUTOBUY_RATE_LIMIT_BASE_DELAY_SECONDS, RATE_GOVERNOR_ENABLED, RATE_GOVERNOR_PATH,
+    RATE_GOVERNOR_RATE_PER_SECOND, RATE_GOVERNOR_BURST, RATE_GOVERNOR_IDLE_SECONDS
 )
+import os
 from market_utils import get_market_data
+from http_client import create_session, warm_up
+from http_cache import parse_retry_after
+from rate_limiter import SharedTokenBucket
+from log_utils import configure_logging
+
+logger = logging.getLogger(__name__)
 
 class TradeMonitor:
     def __init__(self, target_products, headers, cookies):
+        configure_logging()
         self.TARGET_PRODUCTS = target_products
-        self.session = requests.Session()
-        self.session.headers.update(headers)
-        self.session.cookies.update(cookies)
+        self.session = create_session(
+            headers=headers,
+            cookies=cookies,
+            pool_maxsize=1,  # Products are checked one at a time
+            cache=HTTP_CACHE_ENABLED,
+            stale_if_rate_limited=HTTP_CACHE_STALE_SECONDS
+        )
+        self._idle_book_hashes = {}
+        self.rate_limiter = None
+        if RATE_GOVERNOR_ENABLED:  # Budget shared with AutoBuyer and other monitors on this host
+            self.rate_limiter = SharedTokenBucket(
+                RATE_GOVERNOR_PATH, RATE_GOVERNOR_RATE_PER_SECOND, max(1, RATE_GOVERNOR_BURST),
+                client_name=f"TradeMonitor-{os.getpid()}", idle_after=RATE_GOVERNOR_IDLE_SECONDS
+            )
 
     def get_market_data(self, product_name, product_info):
-        print(f"--- Start processing {product_name} (Q{product_info['quality']}) market data ---")
-        return get_market_data(
+        logger.info(f"--- Start processing {product_name} (Q{product_info['quality']}) market data ---")
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        error_details = {}
+        data = get_market_data(
             self.session,
             product_info['url'],
             product_info['quality'],
             timeout=REQUEST_TIMEOUT,
-            return_order_detail=False
+            return_order_detail=False,
+            error_details=error_details,
+            decoder=MARKET_JSON_DECODER,
+            assume_sorted=MARKET_ORDERS_SORTED_BY_PRICE
         )
+        if self.rate_limiter is not None and error_details.get('kind') == 'rate_limited':
+            # Pause every process sharing the governor instead of letting each hit its own 429
+            self.rate_limiter.backoff(parse_retry_after(error_details.get('retry_after'), AUTOBUY_RATE_LIMIT_BASE_DELAY_SECONDS))
+        return data
 
     def trigger_buy_action(self, product_name, product_info, price):
-        print(f"===========Trigger buy condition ({product_name})===========")
-        print(f"Product ({product_name} Q{product_info['quality']})")
-        print(f"Lowest price at trigger: ${price:.3f}")
-        print("!!! WARNING: Auto-buy operation not executed (TradeMonitor mode), please check game rules and operate manually !!!")
-        print(f"===================================")
+        logger.info(f"===========Trigger buy condition ({product_name})===========")
+        logger.info(f"Product ({product_name} Q{product_info['quality']})")
+        logger.info(f"Lowest price at trigger: ${price:.3f}")
+        logger.warning("!!! WARNING: Auto-buy operation not executed (TradeMonitor mode), please check game rules and operate manually !!!")
+        logger.info("===================================")
 
     def main_loop(self):
         while True:
-            print("\n" + "=" * 15 + " Start a new round of checks (all target products) " + "=" * 15)
+            logger.info("=" * 15 + " Start a new round of checks (all target products) " + "=" * 15)
+            if HTTP_WARMUP_ENABLED:
+                warm_up(self.session, [info['url'] for info in self.TARGET_PRODUCTS.values()], timeout=REQUEST_TIMEOUT,
+                        rate_limiter=self.rate_limiter)
 
             for product_name, product_info in self.TARGET_PRODUCTS.items():
-                print(f"\n--- Checking product: {product_name} (Q{product_info['quality']}) ---")
+                logger.info(f"--- Checking product: {product_name} (Q{product_info['quality']}) ---")
                 market_data = self.get_market_data(product_name, product_info)
 
-                if market_data and 'lowest_price' in market_data and 'second_lowest_price' in market_data:
+                content_hash = market_data.get('content_hash') if market_data else None
+                if content_hash and self._idle_book_hashes.get(product_name) == content_hash:
+                    logger.info(f"Order book unchanged since last check ({product_name}), skipping threshold evaluation.")
+                elif market_data and 'lowest_price' in market_data and 'second_lowest_price' in market_data:
                     lowest_price = market_data['lowest_price']
                     second_lowest_price = market_data['second_lowest_price']
 
                     buy_threshold_price = second_lowest_price * BUY_THRESHOLD_PERCENTAGE
-                    print(f"Threshold calculation ({product_name}): Second lowest price ${second_lowest_price:.3f} at {BUY_THRESHOLD_PERCENTAGE*100}% = ${buy_threshold_price:.3f}")
+                    logger.info(f"Threshold calculation ({product_name}): Second lowest price ${second_lowest_price:.3f} at {BUY_THRESHOLD_PERCENTAGE*100}% = ${buy_threshold_price:.3f}")
 
                     if lowest_price < buy_threshold_price:
-                        print(f"***> Condition met ({product_name})! Lowest price ${lowest_price:.3f} < threshold ${buy_threshold_price:.3f}")
+                        logger.info(f"***> Condition met ({product_name})! Lowest price ${lowest_price:.3f} < threshold ${buy_threshold_price:.3f}")
+                        order_book = market_data.get('order_book')
+                        if order_book is not None:
+                            depth = order_book.depth_below(buy_threshold_price)
+                            filled, total_cost, vwap = order_book.cost_for_quantity(depth)
+                            if filled:
+                                logger.info(f"Below-threshold liquidity ({product_name}): {filled} units, total ${total_cost:,.2f} (VWAP ${vwap:.3f})")
                         self.trigger_buy_action(product_name, product_info, lowest_price)
                     else:
-                        print(f"---> Condition not met ({product_name}). Lowest price ${lowest_price:.3f} >= threshold ${buy_threshold_price:.3f}")
+                        logger.info(f"---> Condition not met ({product_name}). Lowest price ${lowest_price:.3f} >= threshold ${buy_threshold_price:.3f}")
+                        self._idle_book_hashes[product_name] = content_hash
 
                 elif market_data and 'lowest_price' in market_data:
-                    print(f"Only one price found ({product_name}: lowest price ${market_data['lowest_price']:.3f}), cannot compare, skipping trigger check.")
+                    logger.info(f"Only one price found ({product_name}: lowest price ${market_data['lowest_price']:.3f}), cannot compare, skipping trigger check.")
+                    self._idle_book_hashes[product_name] = content_hash
                 else:
-                    print(f"Insufficient market data obtained this check ({product_name}: lowest and second lowest price), will retry later.")
+                    logger.info(f"Insufficient market data obtained this check ({product_name}: lowest and second lowest price), will retry later.")
 
                 time.sleep(1)
 
+            logger.info(f"HTTP timings this round: {self.session.timer.summary()}")
+            self.session.timer.reset()
             check_interval_seconds = DEFAULT_CHECK_INTERVAL_SECONDS
-            print(f"\nAll product checks complete, sleeping for {check_interval_seconds} seconds...")
+            logger.info(f"All product checks complete, sleeping for {check_interval_seconds} seconds...")
             time.sleep(check_interval_seconds)
\ No newline at end of file
@@ -0,0 +1,326 @@
+"""Replay recorded order-book summaries through AutoBuyer's buy rule.
+
+Snapshots come from the price-history store (``PRICE_HISTORY_ENABLED=true``).
+Each threshold setting is evaluated over the whole timeline at once with
+``decision.evaluate_catalog``, the stage that decides concurrent scans; only
+triggered snapshots then go through the simulated executor. Purchases are
+planned with ``decision.walk_depth`` under the same caps as
+``AutoBuyer._plan_purchase`` (MAX_BUY_QUANTITY, MAX_TOTAL_COST, the daily
+spend caps and the cash reserve), with latency on a simulated clock.
+
+The history keeps only the quantity at the lowest price. With thresholds
+below 1 that is every order the live buyer would take (anything cheaper
+than ``second_lowest * threshold`` sits at the lowest price); with a
+threshold of 1 or more the live buyer can also reach the second price
+level, which the replay does not see.
+
+Usage:
+    python backtest.py --thresholds config,0.94,0.92,0.90 [--days 30] [--tier 1m] [--product Power]
+    python backtest.py --thresholds 0.90 --cash 20000000 --latency 5 --fills record/backtest_fills.csv
+"""
+import argparse
+import csv
+import datetime
+import math
+import sys
+import time
+
+import numpy as np
+
+from decision import evaluate_catalog, walk_depth
+
+# Why a triggered listing was not bought: it was gone by the time the order executed, the order would
+# have dipped into MIN_CASH_RESERVE, a daily spend cap was reached, or MAX_BUY_QUANTITY/MAX_TOTAL_COST left 0 units.
+MISSED_REASONS = ('gone', 'cash reserve', 'daily cap', 'quantity cap')
+
+
+class Timeline:
+    """Snapshots of several products merged in time order, as parallel arrays.
+
+    ``products`` holds indices into ``names``; ``depth`` is the quantity at
+    the lowest price. ``second_lowest`` is NaN for single-level books.
+    """
+
+    __slots__ = ('names', 'timestamps', 'products', 'lowest', 'second_lowest', 'depth', '_product_rows')
+
+    def __init__(self, names, timestamps, products, lowest, second_lowest, depth):
+        order = np.argsort(np.asarray(timestamps, dtype=np.float64), kind='stable')
+        self.names = list(names)
+        self.timestamps = np.asarray(timestamps, dtype=np.float64)[order]
+        self.products = np.asarray(products, dtype=np.int64)[order]
+        self.lowest = np.asarray(lowest, dtype=np.float64)[order]
+        self.second_lowest = np.asarray(second_lowest, dtype=np.float64)[order]
+        self.depth = np.asarray(depth, dtype=np.int64)[order]
+        self._product_rows = {}
+
+    @classmethod
+    def from_store(cls, store, names, start=None, end=None, tier=None):
+        """Load ``names`` from a :class:`price_history.PriceHistoryStore`; products without rows are kept but empty."""
+        columns = {key: [] for key in ('timestamp', 'product', 'lowest', 'second_lowest', 'depth_at_lowest')}
+        for index, name in enumerate(names):
+            data = store.query(name, start, end, tier)
+            columns['product'].append(np.full(len(data['timestamp']), index, dtype=np.int64))
+            for key in ('timestamp', 'lowest', 'second_lowest', 'depth_at_lowest'):
+                columns[key].append(data[key])
+        merged = {key: np.concatenate(parts) if parts else np.empty(0) for key, parts in columns.items()}
+        return cls(names, merged['timestamp'], merged['product'], merged['lowest'],
+                   merged['second_lowest'], merged['depth_at_lowest'])
+
+    def __len__(self):
+        return int(self.timestamps.size)
+
+    def next_snapshot(self, index, at):
+        """Row of the same product's first snapshot at or after ``at``, or None."""
+        product = int(self.products[index])
+        entry = self._product_rows.get(product)
+        if entry is None:
+            rows = np.flatnonzero(self.products == product)
+            entry = self._product_rows[product] = (rows, self.timestamps[rows])
+        rows, timestamps = entry
+        position = int(np.searchsorted(timestamps, at, side='left'))
+        return int(rows[position]) if position < rows.size else None
+
+
+class SimulatedClock:
+    """Replay time, moved forward by the engine instead of waiting; callable like ``time.time``."""
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance_to(self, timestamp):
+        self.now = max(self.now, timestamp)
+
+
+class SimulatedExecutor:
+    """Fills purchases against the recorded books instead of the market.
+
+    An order triggered by a snapshot executes ``latency`` seconds later
+    against the product's first snapshot from then on, at that snapshot's
+    lowest price; if the price has risen above the triggering price the
+    listing is gone. Cash starts at ``cash`` and is only spent; purchases
+    keep ``min_cash_reserve`` and stay within ``max_daily_spend`` (per
+    product) and ``total_daily_spend`` (0 = no cap), counted per local day
+    like the trade ledger.
+    """
+
+    def __init__(self, timeline, clock, cash=math.inf, min_cash_reserve=0.0, max_daily_spend=None,
+                 total_daily_spend=0.0, latency=0.0):
+        self.timeline = timeline
+        self.clock = clock
+        self.cash = cash
+        self.min_cash_reserve = min_cash_reserve
+        self.max_daily_spend = max_daily_spend or {}
+        self.total_daily_spend = total_daily_spend
+        self.latency = latency
+        self._spent = {}  # (day, product index or None) -> confirmed spend
+
+    def buy(self, index, quantity, price, max_quantity=math.inf, max_total_cost=math.inf):
+        """Buy up to ``quantity`` units triggered at row ``index``. Returns ``(filled, cost, reason)``.
+
+        The fill is planned like ``AutoBuyer._plan_purchase``: ``walk_depth``
+        within ``max_quantity`` and the smallest of ``max_total_cost``, the
+        daily spend left and the cash above the reserve.
+        """
+        timeline = self.timeline
+        self.clock.advance_to(timeline.timestamps[index] + self.latency)
+        row = timeline.next_snapshot(index, self.clock()) if self.latency else index
+        if row is None or timeline.lowest[row] > price:
+            return 0, 0.0, 'gone'
+        live_price = float(timeline.lowest[row])
+        orders = [{'price': live_price, 'quantity': min(quantity, int(timeline.depth[row]))}]
+
+        day = datetime.date.fromtimestamp(self.clock())
+        product = int(timeline.products[index])
+        limits = [(max_total_cost, 'quantity cap'), (self.cash - self.min_cash_reserve, 'cash reserve')]
+        product_cap = self.max_daily_spend.get(timeline.names[product])
+        if product_cap:
+            limits.append((product_cap - self._spent.get((day, product), 0.0), 'daily cap'))
+        if self.total_daily_spend > 0:
+            limits.append((self.total_daily_spend - self._spent.get((day, None), 0.0), 'daily cap'))
+        budget, reason = min(limits, key=lambda limit: limit[0])
+        fill = walk_depth(orders, max_quantity, max(0.0, budget))
+        filled = fill.quantity
+        if filled <= 0:
+            return 0, 0.0, reason
+        cost = fill.cost
+        self.cash -= cost
+        for key in ((day, product), (day, None)):
+            self._spent[key] = self._spent.get(key, 0.0) + cost
+        return filled, cost, None
+
+
+class BacktestResult:
+    """Fills and missed opportunities of one threshold setting.
+
+    A listing is a run of triggered snapshots of one product with the same
+    lowest and second-lowest price. It is missed when nothing was bought from
+    it; ``missed`` maps the reason of its last failed attempt to
+    ``[listings, units, savings]``.
+    """
+
+    def __init__(self, label):
+        self.label = label
+        self.snapshots = 0
+        self.triggered = 0
+        self.listings = 0
+        self.fills = []  # (timestamp, product, price, quantity, cost, savings)
+        self.missed = {reason: [0, 0, 0.0] for reason in MISSED_REASONS}
+
+    def summary(self):
+        missed = [sum(values[i] for values in self.missed.values()) for i in range(3)]
+        return {
+            'label': self.label, 'snapshots': self.snapshots, 'triggered': self.triggered, 'listings': self.listings,
+            'fills': len(self.fills), 'units': sum(fill[3] for fill in self.fills),
+            'spend': sum(fill[4] for fill in self.fills), 'savings': sum(fill[5] for fill in self.fills),
+            'missed_listings': missed[0], 'missed_units': missed[1], 'missed_savings': missed[2],
+        }
+
+
+def run_backtest(timeline, thresholds, max_buy_quantities, max_total_costs, label=None, default_threshold=0.94,
+                 clock=None, **executor_kwargs):
+    """Replay ``timeline`` with ``thresholds`` (a number, or a dict by product name like ``BUY_THRESHOLDS``).
+
+    Every snapshot is evaluated in one ``evaluate_catalog`` call for the
+    trigger. Triggered snapshots then buy, in time order, what the listing
+    still has after earlier fills, through a :class:`SimulatedExecutor`
+    built from ``executor_kwargs``. As in ``AutoBuyer._submit_buy_order``,
+    a purchase the quantity and cost caps leave no unit for is not sent.
+    """
+    if not isinstance(thresholds, dict):
+        thresholds = {name: thresholds for name in timeline.names}
+
+    def per_product(values, default):
+        return np.array([values.get(name) or default for name in timeline.names], dtype=np.float64)
+
+    rows = timeline.products
+    max_buy = per_product(max_buy_quantities, np.inf)
+    max_cost = per_product(max_total_costs, np.inf)  # 0 or unset means no cap, as in AutoBuyer._spend_limit
+    decision = evaluate_catalog(
+        rows, timeline.lowest, timeline.second_lowest, timeline.depth,
+        thresholds=per_product(thresholds, default_threshold)[rows],
+        max_buy_quantities=max_buy[rows],
+        max_total_costs=np.where(np.isinf(max_cost), 0.0, max_cost)[rows],
+    )
+    clock = clock or SimulatedClock(float(timeline.timestamps[0]) if len(timeline) else 0.0)
+    executor = SimulatedExecutor(timeline, clock, **executor_kwargs)
+    result = BacktestResult(label if label is not None else str(thresholds))
+    result.snapshots = len(timeline)
+
+    listings = {}  # product -> [key, depth when first seen, units bought, saving per unit, last failure]
+
+    def close(listing):
+        if listing[2] == 0:
+            missed = result.missed[listing[4] or 'gone']
+            missed[0] += 1
+            missed[1] += listing[1]
+            missed[2] += listing[1] * listing[3]
+
+    triggered = np.flatnonzero(decision.triggered)
+    result.triggered = int(triggered.size)
+    for index in triggered.tolist():
+        product = int(rows[index])
+        price = float(timeline.lowest[index])
+        second = float(timeline.second_lowest[index])
+        key = (price, second)
+        listing = listings.get(product)
+        if listing is None or listing[0] != key:
+            if listing is not None:
+                close(listing)
+            listing = listings[product] = [key, int(timeline.depth[index]), 0, second - price, None]
+            result.listings += 1
+        quantity = int(timeline.depth[index]) - listing[2]
+        if quantity <= 0:
+            continue  # Everything this listing offers was bought already
+        if walk_depth([{'price': price, 'quantity': quantity}], max_buy[product], max_cost[product]).quantity <= 0:
+            listing[4] = 'quantity cap'
+            continue
+        filled, cost, reason = executor.buy(index, quantity, price, max_buy[product], max_cost[product])
+        if not filled:
+            listing[4] = reason
+            continue
+        listing[2] += filled
+        result.fills.append((float(clock()), timeline.names[product], cost / filled, filled, cost,
+                             filled * second - cost))
+    for listing in listings.values():
+        close(listing)
+    return result
+
+
+def _parse_thresholds(spec, config_thresholds):
+    settings = []
+    for item in spec.split(','):
+        item = item.strip()
+        if item == 'config':
+            settings.append(('config', dict(config_thresholds)))
+        elif item:
+            settings.append((item, float(item)))
+    return settings
+
+
+def main(argv=None):
+    from config import (
+        BUY_THRESHOLDS, BUY_THRESHOLD_PERCENTAGE, MAX_BUY_QUANTITY, MAX_TOTAL_COST, MAX_DAILY_SPEND,
+        AUTOBUY_MAX_DAILY_SPEND, MIN_CASH_RESERVE, PRICE_HISTORY_DIR, TARGET_PRODUCTS
+    )
+    from price_history import PriceHistoryStore
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--thresholds', default='config',
+                        help="Comma-separated settings; 'config' uses BUY_THRESHOLDS, a number applies to every product")
+    parser.add_argument('--product', action='append', help='Product to replay (repeatable; default: TARGET_PRODUCTS)')
+    parser.add_argument('--days', type=float, default=30)
+    parser.add_argument('--tier', choices=('raw', '1m', '1h'), help='History tier (default: finest covering --days)')
+    parser.add_argument('--history-dir', default=PRICE_HISTORY_DIR)
+    parser.add_argument('--cash', type=float, default=math.inf, help='Starting cash (default: unlimited)')
+    parser.add_argument('--reserve', type=float, default=MIN_CASH_RESERVE)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds from trigger to execution')
+    parser.add_argument('--fills', help='Write every fill to this CSV file')
+    args = parser.parse_args(argv)
+
+    names = args.product or list(TARGET_PRODUCTS)
+    started_at = time.perf_counter()
+    store = PriceHistoryStore(args.history_dir)
+    timeline = Timeline.from_store(store, names, start=time.time() - args.days * 86400, tier=args.tier)
+    print(f"Loaded {len(timeline):,} snapshots of {len(names)} products in {time.perf_counter() - started_at:.2f}s")
+    if not len(timeline):
+        print("No price history recorded; enable PRICE_HISTORY_ENABLED while the auto-buyer runs.")
+        return 1
+
+    results = []
+    for label, thresholds in _parse_thresholds(args.thresholds, BUY_THRESHOLDS):
+        started_at = time.perf_counter()
+        results.append(run_backtest(
+            timeline, thresholds, MAX_BUY_QUANTITY, MAX_TOTAL_COST, label=label,
+            default_threshold=BUY_THRESHOLD_PERCENTAGE, cash=args.cash, min_cash_reserve=args.reserve,
+            max_daily_spend=MAX_DAILY_SPEND, total_daily_spend=AUTOBUY_MAX_DAILY_SPEND, latency=args.latency
+        ))
+        print(f"  {label}: replayed in {time.perf_counter() - started_at:.2f}s")
+
+    print(f"\n{'threshold':<10} {'triggers':>9} {'listings':>9} {'fills':>7} {'units':>12} {'spend':>18} "
+          f"{'savings':>16} {'missed':>7} {'missed units':>13} {'missed savings':>16}")
+    for result in results:
+        s = result.summary()
+        print(f"{s['label']:<10} {s['triggered']:>9,} {s['listings']:>9,} {s['fills']:>7,} {s['units']:>12,} "
+              f"{s['spend']:>18,.2f} {s['savings']:>16,.2f} {s['missed_listings']:>7,} {s['missed_units']:>13,} "
+              f"{s['missed_savings']:>16,.2f}")
+        reasons = ", ".join(f"{reason} {values[0]}" for reason, values in result.missed.items() if values[0])
+        if reasons:
+            print(f"{'':<10} missed: {reasons}")
+
+    if args.fills:
+        with open(args.fills, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(('threshold', 'time', 'product', 'price', 'quantity', 'cost', 'savings'))
+            for result in results:
+                for timestamp, product, price, quantity, cost, savings in result.fills:
+                    writer.writerow((result.label, datetime.datetime.fromtimestamp(timestamp).isoformat(), product,
+                                     f"{price:.3f}", quantity, f"{cost:.2f}", f"{savings:.2f}"))
+        print(f"Fills written to {args.fills}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""Compare market payload decoders: response.json(), orjson and streaming.
+
+Usage: python benchmarks/bench_market_parse.py [--sizes 1000,10000,100000] [--repeat 5]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from market_utils import get_market_data, orjson  # noqa: E402
+
+
+class FakeResponse:
+    """Minimal stand-in for requests.Response serving a fixed payload."""
+
+    def __init__(self, payload, chunk_size):
+        self.status_code = 200
+        self.headers = {}
+        self.content = payload
+        self._chunk_size = chunk_size
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def raise_for_status(self):
+        return None
+
+    def json(self):
+        return json.loads(self.content)
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.content), self._chunk_size):
+            yield self.content[start:start + self._chunk_size]
+
+    def close(self):
+        pass
+
+
+class FakeSession:
+    def __init__(self, payload, chunk_size=16 * 1024):
+        self.payload = payload
+        self.chunk_size = chunk_size
+
+    def get(self, url, timeout=None, stream=False, headers=None):
+        return FakeResponse(self.payload, self.chunk_size)
+
+
+def build_payload(order_count, seed=7):
+    """Price-ascending book with mixed qualities, like the live market endpoint."""
+    rng = random.Random(seed)
+    price = 1.0
+    orders = []
+    for order_id in range(order_count):
+        price += rng.choice((0.0, 0.0, 0.001, 0.01))
+        orders.append({
+            'id': order_id,
+            'kind': 1,
+            'quality': rng.choice((0, 0, 1, 2, 3)),
+            'price': round(price, 3),
+            'quantity': rng.randint(1, 50000),
+            'posted': '2026-01-01T00:00:00+00:00',
+            'seller': {'id': rng.randint(1, 10 ** 6), 'company': 'Company', 'logo': None},
+        })
+    return json.dumps(orders).encode('utf-8')
+
+
+def measure(session, decoder, assume_sorted, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = get_market_data(session, 'bench://market', 0, return_order_detail=True,
+                                 decoder=decoder, assume_sorted=assume_sorted)
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    get_market_data(session, 'bench://market', 0, return_order_detail=True,
+                    decoder=decoder, assume_sorted=assume_sorted)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+    # get_market_data logs every request at INFO; keep that formatting out of the timed loops
+    logging.getLogger('market_utils').setLevel(logging.WARNING)
+
+    variants = [
+        ('standard', 'standard', False),
+        ('fast' + ('' if orjson else ' (orjson missing)'), 'fast', False),
+        ('stream+sorted', 'stream', True),
+    ]
+    print(f"{'orders':>8} {'payload':>10} {'decoder':<24} {'best ms':>9} {'peak KiB':>10}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        payload = build_payload(size)
+        session = FakeSession(payload)
+        reference = None
+        for label, decoder, assume_sorted in variants:
+            seconds, peak, result = measure(session, decoder, assume_sorted, args.repeat)
+            summary = (result['lowest_order'], result.get('second_lowest_price'))
+            if reference is None:
+                reference = summary
+            elif summary != reference:
+                print(f"!! {label} disagrees with standard decoder: {summary} != {reference}")
+            print(f"{size:>8} {len(payload) / 1024:>9.0f}K {label:<24} {seconds * 1000:>9.2f} {peak / 1024:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+"""Scan hot-path benchmark: market parsing and buy-decision cost per product.
+
+Covers synthetic books from 10 to 100k orders with mixed qualities and a
+share of malformed rows, for each market decoder. Reports parse time,
+decision time, tracemalloc peak and retained memory per product, then
+compares the per-product decision loop with the vectorized catalog
+evaluation. Results can be recorded as or compared against a JSON baseline.
+
+Usage:
+    python benchmarks/bench_scan_path.py [--sizes 10,100,1000,10000,100000] [--repeat 5]
+    python benchmarks/bench_scan_path.py --record benchmarks/baselines.json
+    python benchmarks/bench_scan_path.py --compare benchmarks/baselines.json [--tolerance 0.5]
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_market_parse import FakeSession  # noqa: E402
+from decision import DecisionCatalog  # noqa: E402
+from market_utils import get_market_data, orjson  # noqa: E402
+
+DECODERS = (
+    ('standard', 'standard', False),
+    ('fast', 'fast', False),
+    ('stream+sorted', 'stream', True),
+)
+# Metrics compared against the baseline; memory is deterministic, times get the tolerance.
+TIME_METRICS = ('parse_ms', 'decide_us')
+MEMORY_METRICS = ('peak_kib',)
+
+
+def build_book(order_count, malformed_ratio=0.02, seed=11):
+    """Price-ascending book with mixed qualities and a share of malformed rows."""
+    rng = random.Random(seed)
+    price = 1.0
+    orders = []
+    for order_id in range(order_count):
+        price += rng.choice((0.0, 0.001, 0.01))
+        order = {
+            'id': order_id,
+            'kind': 1,
+            'quality': rng.choice((0, 0, 1, 2, 3, 5)),
+            'price': round(price, 3),
+            'quantity': rng.randint(1, 50000),
+            'posted': '2026-01-01T00:00:00+00:00',
+            'seller': {'id': rng.randint(1, 10 ** 6), 'company': 'Company', 'logo': None},
+        }
+        if order_id > 1 and rng.random() < malformed_ratio:
+            defect = rng.choice(('no_price', 'text_price', 'null_quantity', 'not_a_dict', 'no_id'))
+            if defect == 'no_price':
+                del order['price']
+            elif defect == 'text_price':
+                order['price'] = 'n/a'
+            elif defect == 'null_quantity':
+                order['quantity'] = None
+            elif defect == 'not_a_dict':
+                order = [order_id, price]
+            else:
+                del order['id']
+        orders.append(order)
+    return json.dumps(orders).encode('utf-8')
+
+
+def decide(market_data, threshold=0.94, max_buy_quantity=10_000_000, max_total_cost=50_000_000,
+           available_cash=100_000_000, min_cash_reserve=5_000_000):
+    """The per-product buy rule and quantity caps applied by AutoBuyer."""
+    lowest_order = market_data['lowest_order']
+    second_lowest_price = market_data.get('second_lowest_price')
+    if second_lowest_price is None:
+        return 0
+    price = lowest_order['price']
+    buy_threshold_price = second_lowest_price * threshold
+    if not price < buy_threshold_price:
+        return 0
+    order_book = market_data.get('order_book')
+    if order_book is not None:
+        order_book.depth_below(buy_threshold_price)
+    buy_quantity = min(lowest_order['quantity'], max_buy_quantity)
+    buy_quantity = min(buy_quantity, int(max_total_cost // price))
+    return min(buy_quantity, int(max(0, available_cash - min_cash_reserve) // price))
+
+
+def dip_market_data(market_data):
+    """Copy of ``market_data`` whose lowest order meets the threshold, so every cap is exercised."""
+    dipped = dict(market_data)
+    dipped['lowest_order'] = dict(market_data['lowest_order'], price=market_data['second_lowest_price'] * 0.5)
+    return dipped
+
+
+def run_case(payload, decoder, assume_sorted, repeat):
+    session = FakeSession(payload)
+    parse_best = float('inf')
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = get_market_data(session, 'bench://market', 0, return_order_detail=True,
+                                 decoder=decoder, assume_sorted=assume_sorted)
+        parse_best = min(parse_best, time.perf_counter() - started)
+
+    tracemalloc.start()
+    retained = get_market_data(session, 'bench://market', 0, return_order_detail=True,
+                               decoder=decoder, assume_sorted=assume_sorted)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del retained
+
+    dipped = dip_market_data(result)
+    loops = max(1, 2000 // repeat)
+    decide_best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(loops):
+            decide(dipped)
+        decide_best = min(decide_best, (time.perf_counter() - started) / loops)
+
+    return {
+        'parse_ms': round(parse_best * 1000, 4),
+        'decide_us': round(decide_best * 1e6, 3),
+        'peak_kib': round(peak / 1024, 1),
+        'retained_kib': round(current / 1024, 1),
+        'valid_orders': len(result['order_book']),
+        'lowest_price': result['lowest_order']['price'],
+        'second_lowest_price': result['second_lowest_price'],
+    }
+
+
+def build_scan_results(product_count, seed=5):
+    """Fake ``scan_market_data`` output for a catalog; roughly 5% of products trigger."""
+    rng = random.Random(seed)
+    results = {}
+    for index in range(product_count):
+        second = rng.uniform(1, 1000)
+        lowest = second * (rng.uniform(0.5, 0.93) if rng.random() < 0.05 else rng.uniform(0.95, 1.0))
+        results[f"product-{index}"] = ({
+            'lowest_order': {'id': index, 'price': lowest, 'quantity': rng.randint(1, 50000)},
+            'second_lowest_price': second,
+        }, {})
+    return results
+
+
+def run_catalog_case(product_count, repeat):
+    results = build_scan_results(product_count)
+    catalog = DecisionCatalog(results, {}, {}, {})
+    scalar_best = vector_best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        scalar = {name: decide(data) for name, (data, _) in results.items()}
+        scalar_best = min(scalar_best, time.perf_counter() - started)
+        started = time.perf_counter()
+        decision = catalog.evaluate(results, available_cash=100_000_000, min_cash_reserve=5_000_000)
+        decision.opportunities()
+        vector_best = min(vector_best, time.perf_counter() - started)
+    vector = dict(zip(decision.names, decision.buy_quantities.tolist()))
+    mismatches = sum(1 for name in scalar if scalar[name] != vector.get(name, 0))
+    return {
+        'scalar_us': round(scalar_best * 1e6, 1),
+        'decide_us': round(vector_best * 1e6, 1),
+        'actionable': int((decision.buy_quantities > 0).sum()),
+        'mismatches': mismatches,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return human-readable regressions of ``results`` against ``baseline``."""
+    regressions = []
+    for key, metrics in results.items():
+        reference = baseline.get('results', {}).get(key)
+        if not reference:
+            continue
+        for metric in TIME_METRICS + MEMORY_METRICS:
+            old, new = reference.get(metric), metrics.get(metric)
+            if old and new is not None and new > old * (1 + tolerance):
+                regressions.append(f"{key} {metric}: {old} -> {new} (+{(new / old - 1) * 100:.0f}%)")
+        for metric in ('lowest_price', 'second_lowest_price', 'valid_orders', 'actionable', 'mismatches'):
+            if metric in reference and reference[metric] != metrics.get(metric):
+                regressions.append(f"{key} {metric} changed: {reference[metric]} -> {metrics.get(metric)}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10,100,1000,10000,100000')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--malformed', type=float, default=0.02, help='Share of malformed rows')
+    parser.add_argument('--products', type=int, default=56, help='Catalog size for the per-cycle estimate')
+    parser.add_argument('--catalog-sizes', default='56,500,5000', help='Catalog sizes for the decision comparison')
+    parser.add_argument('--record', metavar='PATH', help='Write results as the new baseline')
+    parser.add_argument('--compare', metavar='PATH', help='Fail if results regress past the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='Allowed relative slowdown for timings')
+    args = parser.parse_args(argv)
+    # get_market_data logs every request at INFO; keep that formatting out of the timed loops
+    logging.getLogger('market_utils').setLevel(logging.WARNING)
+
+    results = {}
+    print(f"{'orders':>8} {'decoder':<14} {'parse ms':>10} {'decide us':>10} {'peak KiB':>10} "
+          f"{'kept KiB':>9} {'valid':>7} {'cycle ms':>9}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        payload = build_book(size, args.malformed)
+        for label, decoder, assume_sorted in DECODERS:
+            if decoder == 'fast' and orjson is None:
+                label += ' (no orjson)'
+            metrics = run_case(payload, decoder, assume_sorted, args.repeat)
+            results[f"{size}/{label}"] = metrics
+            cycle_ms = args.products * (metrics['parse_ms'] + metrics['decide_us'] / 1000)
+            print(f"{size:>8} {label:<14} {metrics['parse_ms']:>10.3f} {metrics['decide_us']:>10.2f} "
+                  f"{metrics['peak_kib']:>10.0f} {metrics['retained_kib']:>9.0f} {metrics['valid_orders']:>7} "
+                  f"{cycle_ms:>9.1f}")
+    print(f"(cycle ms = {args.products} products x (parse + decide), excluding network time)")
+
+    print(f"\n{'products':>8} {'per-product us':>15} {'vectorized us':>14} {'actionable':>11} {'mismatches':>11}")
+    for product_count in (int(s) for s in args.catalog_sizes.split(',')):
+        metrics = run_catalog_case(product_count, args.repeat)
+        results[f"catalog/{product_count}"] = metrics
+        print(f"{product_count:>8} {metrics['scalar_us']:>15.1f} {metrics['decide_us']:>14.1f} "
+              f"{metrics['actionable']:>11} {metrics['mismatches']:>11}")
+
+    if args.record:
+        with open(args.record, 'w', encoding='utf-8') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'machine': platform.platform(),
+                'orjson': orjson is not None,
+                'malformed_ratio': args.malformed,
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Baseline written to {args.record}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"No regressions against {args.compare} (tolerance {args.tolerance:.0%}).")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+import logging
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Balance fields tried in order; the sim server answers ``{"money": ...}``.
+BALANCE_KEYS = ('money', 'cash', 'balance')
+
+
+def parse_cash_payload(payload):
+    """Extract the account balance from a cashflow API response, or None.
+
+    Accepts an object carrying one of ``BALANCE_KEYS`` or a list of cashflow
+    entries (most recent first) whose first entry carries one.
+    """
+    if isinstance(payload, list):
+        payload = next((entry for entry in payload if isinstance(entry, dict)), None)
+    if not isinstance(payload, dict):
+        return None
+    for key in BALANCE_KEYS:
+        value = payload.get(key)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+    return None
+
+
+class CashService:
+    """Account cash read from the cashflow API and cached for ``ttl`` seconds.
+
+    ``debit`` lowers the cached balance right after a confirmed purchase, so
+    reserve checks stay correct until the next refresh. A refresh that was
+    already in flight when a debit happened keeps the lower of the two
+    values, since the server may not have booked the trade yet.
+    """
+
+    def __init__(self, session, url, ttl=60, timeout=15, clock=time.monotonic):
+        self.session = session
+        self.url = url
+        self.ttl = ttl
+        self.timeout = timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._balance = None
+        self._fetched_at = None
+        self._last_debit_at = None
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.last_error = None
+
+    def cached(self):
+        """Cached balance while it is younger than ``ttl``, else None. Never touches the network."""
+        with self._lock:
+            if self._balance is None or self._clock() - self._fetched_at > self.ttl:
+                return None
+            return self._balance
+
+    def balance(self):
+        """Current balance, refreshed over HTTP when the cache has expired. None if unavailable."""
+        balance = self.cached()
+        if balance is None:
+            balance = self.refresh()
+        return balance
+
+    def refresh(self):
+        """Fetch the balance now. Returns it, or None on failure (the old cache is kept)."""
+        started_at = self._clock()
+        try:
+            response = self.session.get(self.url, timeout=self.timeout)
+            response.raise_for_status()
+            balance = parse_cash_payload(response.json())
+            if balance is None:
+                raise ValueError("no balance field in cashflow response")
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            logger.warning(f"Could not refresh cash balance from {self.url}: {self.last_error}")
+            return None
+        with self._lock:
+            if self._last_debit_at is not None and self._last_debit_at >= started_at and self._balance is not None:
+                balance = min(balance, self._balance)
+            self._balance = balance
+            self._fetched_at = self._clock()
+            self.last_error = None
+        return balance
+
+    def debit(self, amount):
+        """Subtract a confirmed purchase from the cached balance."""
+        with self._lock:
+            self._last_debit_at = self._clock()
+            if self._balance is not None:
+                self._balance -= amount
+
+    def invalidate(self):
+        """Force the next ``balance()`` to fetch, e.g. after a purchase with an unknown outcome."""
+        with self._lock:
+            self._balance = None
+            self._fetched_at = None
+
+    def start(self, interval):
+        """Refresh in a daemon thread every ``interval`` seconds."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+
+        def run():
+            while not self._stop_event.is_set():
+                self.refresh()
+                self._stop_event.wait(interval)
+
+        self._thread = threading.Thread(target=run, name="cash-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.timeout + 1)
+            self._thread = None
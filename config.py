@@ -9,7 +9,9 @@ load_dotenv()
 DEFAULT_MAX_TOTAL_COST = float(os.getenv("DEFAULT_MAX_TOTAL_COST", "50000000"))
 
 # --- API URLs ---
-CASH_API_URL = "https://www.simcompanies.com/api/v2/companies/me/cashflow/recent/"
+# Point at a local stand-in (e.g. http://127.0.0.1:8765 from sim_server.py) for offline runs.
+SIMCOMPANIES_BASE_URL = os.getenv("SIMCOMPANIES_BASE_URL", "https://www.simcompanies.com").rstrip("/")
+CASH_API_URL = f"{SIMCOMPANIES_BASE_URL}/api/v2/companies/me/cashflow/recent/"
 
 POWER_PLANT_PATHS = [
     "/b/40253730/", "/b/39825683/", "/b/39888395/", "/b/39915579/",
@@ -22,7 +24,7 @@ POWER_PLANT_PATHS = [
 PRODUCT_CONFIGS = [
     {
         "name": "Power",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/1/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/1/",
         "quality": 0,
         "max_buy_quantity": 10000000,
         "buy_threshold_percentage": 0.94,
@@ -30,332 +32,332 @@ PRODUCT_CONFIGS = [
     },
     {
         "name": "Water",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/2/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/2/",
         "quality": 0,
         "max_buy_quantity": 10000000
     },
     {
         "name": "Transport",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/13/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/13/",
         "quality": 0,
         "max_buy_quantity": 100000000
     },
     {
         "name": "MiningResearch",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/31/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/31/",
         "quality": 0,
         "max_buy_quantity": 500
     },
     {
         "name": "EnergyResearch",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/30/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/30/",
         "quality": 0,
         "max_buy_quantity": 500
     },
     {
         "name":"MaterialsResearch",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/113/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/113/",
         "quality": 0,
         "max_buy_quantity": 1000
     },
     {
        "name":"Chemicals",
-       "api_url": "https://www.simcompanies.com/api/v3/market/0/17/",
+       "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/17/",
        "quality": 0,
        "max_buy_quantity": 10000
     },
     {
         "name": "Minerals",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/14/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/14/",
         "quality": 0,
         "max_buy_quantity": 50000
     },
     {
         "name": "Bauxite",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/15/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/15/",
         "quality": 0,
         "max_buy_quantity": 50000
     },
     {
         "name": "Aluminium",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/18/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/18/",
         "quality": 0,
         "max_buy_quantity": 50000
     },
     {
         "name": "Plastic",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/19/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/19/",
         "quality": 0,
         "max_buy_quantity": 50000
     },
     {
         "name": "IronOre",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/42/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/42/",
         "quality": 0,
         "max_buy_quantity": 50000
     },
     {
         "name": "Steel",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/43/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/43/",
         "quality": 0,
         "max_buy_quantity": 50000
     },
     {
         "name": "Sand",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/44/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/44/",
         "quality": 0,
         "max_buy_quantity": 50000
     },
     {
         "name": "Glass",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/45/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/45/",
         "quality": 0,
         "max_buy_quantity": 50000
     },
     {
         "name": "GoldOre",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/68/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/68/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "GoldenBars",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/69/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/69/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "CarbonFibers",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/75/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/75/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "CarbonComposite",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/76/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/76/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "Electronicsresearch",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/32/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/32/",
         "quality": 0,
         "max_buy_quantity": 500
     },
     {
          "name": "Silicon",
-         "api_url": "https://www.simcompanies.com/api/v3/market/0/16/",
+         "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/16/",
          "quality": 0,
          "max_buy_quantity": 50000
     },
 
     {
         "name": "PlantResearch",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/29/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/29/",
         "quality": 0,
         "max_buy_quantity": 500
     },
     {
         "name": "BreedingResearch",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/33/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/33/",
         "quality": 0,
         "max_buy_quantity": 500
     },
     {
         "name": "ChemistryResearch",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/34/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/34/",
         "quality": 0,
         "max_buy_quantity": 500
     },
     {
         "name": "Software",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/35/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/35/",
         "quality": 0,
         "max_buy_quantity": 1000
     },
     {
         "name": "AutomotiveResearch",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/58/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/58/",
         "quality": 0,
         "max_buy_quantity": 500
     },
     {
         "name": "FashionResearch",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/59/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/59/",
         "quality": 0,
         "max_buy_quantity": 500
     },
     {
         "name": "AerospaceResearch",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/100/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/100/",
         "quality": 0,
         "max_buy_quantity": 500
     },
     {
         "name": "Recipes",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/145/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/145/",
         "quality": 0,
         "max_buy_quantity": 1000
     },
     {
         "name": "Dough",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/137/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/137/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "Sauce",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/138/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/138/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "Steak",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/7/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/7/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "Sausages",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/8/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/8/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "Eggs",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/9/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/9/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "Milk",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/117/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/117/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "CoffeePowder",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/119/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/119/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "Flour",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/133/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/133/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "Bread",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/121/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/121/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "ApplePie",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/123/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/123/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "OrangeJuice",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/124/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/124/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "AppleCider",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/125/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/125/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "GingerBeer",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/126/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/126/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "FrozenPizza",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/127/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/127/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "Pasta",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/128/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/128/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "Butter",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/134/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/134/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "Cheese",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/122/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/122/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "Chocolate",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/140/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/140/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "Sugar",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/135/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/135/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "Hamburger",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/129/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/129/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "Lasagna",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/130/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/130/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "MeatBalls",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/131/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/131/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "Cocktails",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/132/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/132/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "VegetableOil",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/141/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/141/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "Salad",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/142/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/142/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "Samosa",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/143/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/143/",
         "quality": 0,
         "max_buy_quantity": 10000
     },
     {
         "name": "PumpkinSoup",
-        "api_url": "https://www.simcompanies.com/api/v3/market/0/149/",
+        "api_url": f"{SIMCOMPANIES_BASE_URL}/api/v3/market/0/149/",
         "quality": 0,
         "max_buy_quantity": 10000
     }
@@ -382,6 +384,13 @@ MAX_TOTAL_COST = {
     for config in PRODUCT_CONFIGS
 }
 
+# Optional "max_daily_spend" per product; products without it are capped only by AUTOBUY_MAX_DAILY_SPEND.
+MAX_DAILY_SPEND = {
+    config["name"]: config["max_daily_spend"]
+    for config in PRODUCT_CONFIGS
+    if config.get("max_daily_spend")
+}
+
 # --- Request Parameters ---
 MARKET_HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
@@ -405,6 +414,165 @@ AUTOBUY_PRODUCT_DELAY_MAX_SECONDS = float(os.getenv("AUTOBUY_PRODUCT_DELAY_MAX_S
 AUTOBUY_RATE_LIMIT_BASE_DELAY_SECONDS = int(os.getenv("AUTOBUY_RATE_LIMIT_BASE_DELAY_SECONDS", "300"))
 PURCHASE_WAIT_MULTIPLIER = 1.5
 
+# --- Market Scan Mode ---
+# "sequential" checks one product at a time with jitter sleeps (original behaviour).
+# "concurrent" fetches all products at once through a shared token bucket.
+AUTOBUY_SCAN_MODE = os.getenv("AUTOBUY_SCAN_MODE", "sequential").strip().lower()
+AUTOBUY_SCAN_MAX_WORKERS = int(os.getenv("AUTOBUY_SCAN_MAX_WORKERS", "8"))
+# Default refill rate matches the average sequential pace (one request per mean product delay).
+AUTOBUY_SCAN_RATE_PER_SECOND = float(os.getenv(
+    "AUTOBUY_SCAN_RATE_PER_SECOND",
+    str(round(2 / max(AUTOBUY_PRODUCT_DELAY_MIN_SECONDS + AUTOBUY_PRODUCT_DELAY_MAX_SECONDS, 0.001), 3))
+))
+# Default burst is one request per worker; set it to the catalog size to let a whole sweep go out at once.
+AUTOBUY_SCAN_BURST = int(os.getenv("AUTOBUY_SCAN_BURST", str(max(1, AUTOBUY_SCAN_MAX_WORKERS))))
+
+# --- Polling Scheduler ---
+# "fixed" polls every product once per cycle in random order (original behaviour).
+# "adaptive" gives each product its own next-poll time from a shared request budget.
+AUTOBUY_SCHEDULER = os.getenv("AUTOBUY_SCHEDULER", "fixed").strip().lower()
+# Default budget matches the average request rate of fixed mode.
+_FIXED_CYCLE_SECONDS = (
+    len(PRODUCT_CONFIGS) * (AUTOBUY_PRODUCT_DELAY_MIN_SECONDS + AUTOBUY_PRODUCT_DELAY_MAX_SECONDS) / 2
+    + DEFAULT_CHECK_INTERVAL_SECONDS * (0.8 + 2.5) / 2
+)
+AUTOBUY_SCHEDULER_BUDGET_PER_HOUR = float(os.getenv(
+    "AUTOBUY_SCHEDULER_BUDGET_PER_HOUR", str(round(len(PRODUCT_CONFIGS) * 3600 / _FIXED_CYCLE_SECONDS, 1))
+))
+AUTOBUY_SCHEDULER_MIN_INTERVAL_SECONDS = float(os.getenv("AUTOBUY_SCHEDULER_MIN_INTERVAL_SECONDS", "60"))
+AUTOBUY_SCHEDULER_MAX_INTERVAL_SECONDS = float(os.getenv("AUTOBUY_SCHEDULER_MAX_INTERVAL_SECONDS", "3600"))
+AUTOBUY_SCHEDULER_BURST_INTERVAL_SECONDS = float(os.getenv("AUTOBUY_SCHEDULER_BURST_INTERVAL_SECONDS", "20"))
+# Burst polling starts when the lowest price is within this fraction above the buy threshold price.
+AUTOBUY_SCHEDULER_BURST_MARGIN = float(os.getenv("AUTOBUY_SCHEDULER_BURST_MARGIN", "0.02"))
+
+# --- Market Response Decoding ---
+# "standard" uses response.json(), "fast" uses orjson when installed,
+# "stream" parses response.raw incrementally (early stop needs MARKET_ORDERS_SORTED_BY_PRICE).
+MARKET_JSON_DECODER = os.getenv("MARKET_JSON_DECODER", "standard").strip().lower()
+# Set to true only if the market API lists orders by ascending price.
+MARKET_ORDERS_SORTED_BY_PRICE = os.getenv("MARKET_ORDERS_SORTED_BY_PRICE", "false").strip().lower() in ("1", "true", "yes")
+
+# --- HTTP Response Cache ---
+# Revalidates market books with ETag/Last-Modified, fingerprints bodies so unchanged
+# books skip threshold evaluation, and serves snapshots during an HTTP 429 backoff.
+HTTP_CACHE_ENABLED = os.getenv("HTTP_CACHE_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+HTTP_CACHE_STALE_SECONDS = float(os.getenv("HTTP_CACHE_STALE_SECONDS", "120"))
+
+# --- HTTP Client ---
+# Kept-alive connections per host; at least the scan concurrency so workers never reconnect.
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", str(max(1, AUTOBUY_SCAN_MAX_WORKERS))))
+# Re-open pooled connections right before each cycle (idle ones are closed by the server during the sleep).
+HTTP_WARMUP_ENABLED = os.getenv("HTTP_WARMUP_ENABLED", "false").strip().lower() in ("1", "true", "yes")
+
+# --- Price History Store ---
+# Fixed-size memory-mapped ring files per product: raw snapshots, then 1-minute and 1-hour downsamples.
+PRICE_HISTORY_ENABLED = os.getenv("PRICE_HISTORY_ENABLED", "false").strip().lower() in ("1", "true", "yes")
+PRICE_HISTORY_DIR = os.getenv("PRICE_HISTORY_DIR", os.path.join("record", "price_history"))
+PRICE_HISTORY_RAW_ROWS = int(os.getenv("PRICE_HISTORY_RAW_ROWS", "172800"))  # 2 days at one write per second
+PRICE_HISTORY_MINUTE_ROWS = int(os.getenv("PRICE_HISTORY_MINUTE_ROWS", "129600"))  # 90 days
+PRICE_HISTORY_HOUR_ROWS = int(os.getenv("PRICE_HISTORY_HOUR_ROWS", "87600"))  # 10 years
+
+# --- Cross-Process Rate Governor ---
+# One token bucket in a SQLite file shared by every AutoBuyer/TradeMonitor process on this host,
+# including the pause after an HTTP 429. Clients idle for RATE_GOVERNOR_IDLE_SECONDS yield their share.
+RATE_GOVERNOR_ENABLED = os.getenv("RATE_GOVERNOR_ENABLED", "false").strip().lower() in ("1", "true", "yes")
+RATE_GOVERNOR_PATH = os.getenv("RATE_GOVERNOR_PATH", os.path.join("record", "rate_governor.sqlite3"))
+RATE_GOVERNOR_RATE_PER_SECOND = float(os.getenv("RATE_GOVERNOR_RATE_PER_SECOND", str(AUTOBUY_SCAN_RATE_PER_SECOND)))
+RATE_GOVERNOR_BURST = int(os.getenv("RATE_GOVERNOR_BURST", str(AUTOBUY_SCAN_BURST)))
+RATE_GOVERNOR_IDLE_SECONDS = float(os.getenv("RATE_GOVERNOR_IDLE_SECONDS", "60"))
+
+# --- AIMD Pacing ---
+# Learns the rate the server tolerates instead of the static delays above: each successful response adds
+# AUTOBUY_AIMD_INCREASE requests/second, an HTTP 429 or a response slower than AUTOBUY_AIMD_SLOW_SECONDS
+# multiplies the rate by AUTOBUY_AIMD_DECREASE. The learned rate survives restarts in AUTOBUY_AIMD_STATE_PATH.
+AUTOBUY_AIMD_ENABLED = os.getenv("AUTOBUY_AIMD_ENABLED", "false").strip().lower() in ("1", "true", "yes")
+AUTOBUY_AIMD_MIN_RATE_PER_SECOND = float(os.getenv("AUTOBUY_AIMD_MIN_RATE_PER_SECOND", "0.02"))
+AUTOBUY_AIMD_MAX_RATE_PER_SECOND = float(os.getenv("AUTOBUY_AIMD_MAX_RATE_PER_SECOND", "2"))
+AUTOBUY_AIMD_INCREASE = float(os.getenv("AUTOBUY_AIMD_INCREASE", "0.002"))
+AUTOBUY_AIMD_DECREASE = float(os.getenv("AUTOBUY_AIMD_DECREASE", "0.5"))
+AUTOBUY_AIMD_SLOW_SECONDS = float(os.getenv("AUTOBUY_AIMD_SLOW_SECONDS", "5"))
+AUTOBUY_AIMD_STATE_PATH = os.getenv("AUTOBUY_AIMD_STATE_PATH", os.path.join("record", "aimd_state.json"))
+
+# --- Warm WebDriver ---
+# Keep AutoBuyer's Chrome open between cycles instead of starting it when a threshold triggers.
+# It is health-checked before each use and recycled after the idle/maximum-age limits below.
+AUTOBUY_WARM_DRIVER = os.getenv("AUTOBUY_WARM_DRIVER", "false").strip().lower() in ("1", "true", "yes")
+AUTOBUY_WARM_DRIVER_IDLE_SECONDS = float(os.getenv("AUTOBUY_WARM_DRIVER_IDLE_SECONDS", "1800"))
+AUTOBUY_WARM_DRIVER_MAX_AGE_SECONDS = float(os.getenv("AUTOBUY_WARM_DRIVER_MAX_AGE_SECONDS", "21600"))
+
+# --- Cash Service ---
+# Read the balance from CASH_API_URL instead of loading /landscape/ in Selenium before each purchase.
+# The value is cached for CASH_CACHE_TTL_SECONDS, lowered locally after confirmed trades and refreshed
+# in the background every CASH_REFRESH_INTERVAL_SECONDS. Selenium is still used if the API fails.
+CASH_SERVICE_ENABLED = os.getenv("CASH_SERVICE_ENABLED", "false").strip().lower() in ("1", "true", "yes")
+CASH_CACHE_TTL_SECONDS = float(os.getenv("CASH_CACHE_TTL_SECONDS", "120"))
+CASH_REFRESH_INTERVAL_SECONDS = float(os.getenv("CASH_REFRESH_INTERVAL_SECONDS", "60"))
+
+# --- Cookie Bridge ---
+# Load the session cookies of the USER_DATA_DIR_autobuy Chrome profile (or of the open warm browser)
+# into AutoBuyer's HTTP sessions, so authenticated API calls do not need a hand-copied SESSIONID.
+COOKIE_BRIDGE_ENABLED = os.getenv("COOKIE_BRIDGE_ENABLED", "false").strip().lower() in ("1", "true", "yes")
+COOKIE_BRIDGE_REFRESH_SECONDS = float(os.getenv("COOKIE_BRIDGE_REFRESH_SECONDS", "300"))
+
+# --- Purchase Backend ---
+# "selenium" fills the market page form (original behaviour). "http" posts the order to PURCHASE_API_URL
+# over the authenticated session in one request, and falls back to Selenium when the endpoint or the
+# session is not accepted. Products can override it with "purchase_backend" in PRODUCT_CONFIGS.
+# HTTP purchases check MIN_CASH_RESERVE through the cash service (CASH_SERVICE_ENABLED).
+PURCHASE_BACKEND = os.getenv("PURCHASE_BACKEND", "selenium").strip().lower()
+PURCHASE_API_URL = os.getenv("PURCHASE_API_URL", f"{SIMCOMPANIES_BASE_URL}/api/v2/market-order/take/")
+PURCHASE_BACKENDS = {
+    config["name"]: config.get("purchase_backend", PURCHASE_BACKEND)
+    for config in PRODUCT_CONFIGS
+}
+
+# --- Scan/Execute Pipeline ---
+# When enabled, the scan loop queues triggered orders and a separate worker thread buys them, largest
+# expected saving first, so a slow browser purchase no longer delays the rest of the scan. Queued
+# opportunities expire after AUTOBUY_PIPELINE_OPPORTUNITY_TTL_SECONDS and are de-duplicated by order ID.
+AUTOBUY_PIPELINE_ENABLED = os.getenv("AUTOBUY_PIPELINE_ENABLED", "false").strip().lower() in ("1", "true", "yes")
+AUTOBUY_PIPELINE_QUEUE_SIZE = int(os.getenv("AUTOBUY_PIPELINE_QUEUE_SIZE", "16"))
+AUTOBUY_PIPELINE_OPPORTUNITY_TTL_SECONDS = float(os.getenv("AUTOBUY_PIPELINE_OPPORTUNITY_TTL_SECONDS", "60"))
+
+# --- Batch Purchase ---
+# When several products trigger in one cycle (or are waiting together in the pipeline queue), the browser
+# opens one tab per order so the market pages load in parallel, submits every order, then collects the
+# results. AUTOBUY_BATCH_MAX_TABS limits how many tabs are open at once.
+AUTOBUY_BATCH_PURCHASE_ENABLED = os.getenv("AUTOBUY_BATCH_PURCHASE_ENABLED", "false").strip().lower() in ("1", "true", "yes")
+AUTOBUY_BATCH_MAX_TABS = max(1, int(os.getenv("AUTOBUY_BATCH_MAX_TABS", "4")))
+
+# --- Login State Cache ---
+# A passed login check is trusted for LOGIN_STATE_TTL_SECONDS, so purchases and monitor start-ups skip the
+# navigation made only to check it. Any 401/403 or redirect to the sign-in page invalidates it at once.
+# The state is stored per browser profile under LOGIN_STATE_DIR and shared by processes using that profile.
+LOGIN_STATE_CACHE_ENABLED = os.getenv("LOGIN_STATE_CACHE_ENABLED", "false").strip().lower() in ("1", "true", "yes")
+LOGIN_STATE_TTL_SECONDS = float(os.getenv("LOGIN_STATE_TTL_SECONDS", "900"))
+LOGIN_STATE_DIR = os.getenv("LOGIN_STATE_DIR", os.path.join("record", "login_state"))
+
+# --- Trade Ledger ---
+# Trade events are stored in a SQLite database (WAL mode) instead of record/trade_events.txt and
+# record/successful_trade.txt; existing text logs are imported on start. Set TRADE_LOG_TEXT_FILES=true
+# to keep writing the text files as well. AUTOBUY_MAX_DAILY_SPEND (0 = no limit) caps confirmed spend per
+# day across all products, checked against the ledger before each purchase.
+TRADE_LEDGER_ENABLED = os.getenv("TRADE_LEDGER_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+TRADE_LEDGER_PATH = os.getenv("TRADE_LEDGER_PATH", os.path.join("record", "trade_ledger.sqlite3"))
+TRADE_LOG_TEXT_FILES = os.getenv("TRADE_LOG_TEXT_FILES", "false").strip().lower() in ("1", "true", "yes")
+AUTOBUY_MAX_DAILY_SPEND = float(os.getenv("AUTOBUY_MAX_DAILY_SPEND", "0"))
+
+# --- Pre-Purchase Price Re-check ---
+# Right before a browser purchase the live price is re-read with a fresh market API request (never answered
+# from the response cache), started while the market page loads. The first row of the page is only parsed
+# if that request fails. Set PRICE_RECHECK_API_ENABLED=false to always read the page.
+PRICE_RECHECK_API_ENABLED = os.getenv("PRICE_RECHECK_API_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+PRICE_RECHECK_TIMEOUT_SECONDS = float(os.getenv("PRICE_RECHECK_TIMEOUT_SECONDS", "5"))
+
+# --- Logging ---
+# Console and log files are written by a background thread, so log I/O never blocks the scan or a
+# purchase. LOG_LEVEL applies to every module; LOG_LEVELS overrides it per module (logger name), e.g.
+# "market_utils=WARNING,AutoBuyer=DEBUG,production_monitor.oilrig=DEBUG".
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").strip().upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+
 # --- Request Timeouts (seconds) ---
 MARKET_REQUEST_TIMEOUT = 20
 BUY_REQUEST_TIMEOUT = 30
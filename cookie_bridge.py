@@ -0,0 +1,214 @@
+import base64
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    from cryptography.hazmat.primitives import hashes, padding
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+except ImportError:  # Encrypted profile cookies need the optional cryptography package
+    AESGCM = None
+
+logger = logging.getLogger(__name__)
+
+SESSION_COOKIE = 'sessionid'
+DEFAULT_DOMAIN = 'simcompanies.com'
+
+
+def cookies_from_driver(driver, domain=DEFAULT_DOMAIN):
+    """Cookies for ``domain`` from a live WebDriver as ``{name: value}``."""
+    cookies = {}
+    for cookie in driver.get_cookies():
+        if domain is None or cookie.get('domain', '').lstrip('.').endswith(domain):
+            cookies[cookie['name']] = cookie['value']
+    return cookies
+
+
+def _cookie_db_path(user_data_dir, profile_dir):
+    for relative in (os.path.join(profile_dir, 'Network', 'Cookies'), os.path.join(profile_dir, 'Cookies')):
+        path = os.path.join(user_data_dir, relative)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _dpapi_unprotect(data):
+    import ctypes
+    from ctypes import wintypes
+
+    class DataBlob(ctypes.Structure):
+        _fields_ = [('cbData', wintypes.DWORD), ('pbData', ctypes.POINTER(ctypes.c_char))]
+
+    buffer = ctypes.create_string_buffer(data, len(data))
+    blob_in = DataBlob(len(data), ctypes.cast(buffer, ctypes.POINTER(ctypes.c_char)))
+    blob_out = DataBlob()
+    if not ctypes.windll.crypt32.CryptUnprotectData(ctypes.byref(blob_in), None, None, None, None, 0,
+                                                    ctypes.byref(blob_out)):
+        raise OSError("CryptUnprotectData failed")
+    try:
+        return ctypes.string_at(blob_out.pbData, blob_out.cbData)
+    finally:
+        ctypes.windll.kernel32.LocalFree(blob_out.pbData)
+
+
+class _CookieDecryptor:
+    """Decrypts Chrome ``encrypted_value`` blobs (Windows DPAPI/AES-GCM and Linux ``v10``)."""
+
+    def __init__(self, user_data_dir):
+        self.user_data_dir = user_data_dir
+        self._key = None
+
+    def _windows_key(self):
+        if self._key is None:
+            with open(os.path.join(self.user_data_dir, 'Local State'), encoding='utf-8') as f:
+                encrypted_key = base64.b64decode(json.load(f)['os_crypt']['encrypted_key'])
+            if not encrypted_key.startswith(b'DPAPI'):
+                raise ValueError("unsupported Local State key format")
+            self._key = _dpapi_unprotect(encrypted_key[len(b'DPAPI'):])
+        return self._key
+
+    def decrypt(self, encrypted_value):
+        prefix = encrypted_value[:3]
+        if AESGCM is None:
+            raise RuntimeError("install the cryptography package to read encrypted profile cookies")
+        if prefix == b'v20':
+            raise ValueError("app-bound encrypted cookie (v20) cannot be read outside Chrome; use the driver source")
+        if sys.platform == 'win32' and prefix in (b'v10', b'v11'):
+            nonce, payload = encrypted_value[3:15], encrypted_value[15:]
+            return AESGCM(self._windows_key()).decrypt(nonce, payload, None)
+        if prefix == b'v10':  # Linux without a keyring: fixed password
+            key = PBKDF2HMAC(algorithm=hashes.SHA1(), length=16, salt=b'saltysalt', iterations=1).derive(b'peanuts')
+            decryptor = Cipher(algorithms.AES(key), modes.CBC(b' ' * 16)).decryptor()
+            padded = decryptor.update(encrypted_value[3:]) + decryptor.finalize()
+            unpadder = padding.PKCS7(128).unpadder()
+            return unpadder.update(padded) + unpadder.finalize()
+        raise ValueError(f"unsupported cookie encryption {prefix!r}")
+
+
+def cookies_from_profile(user_data_dir, profile_dir='Default', domain=DEFAULT_DOMAIN):
+    """Cookies for ``domain`` from a Chrome profile's cookie database as ``{name: value}``.
+
+    The database is copied first because a running Chrome keeps it locked.
+    Encrypted values are decrypted where the platform allows it; cookies
+    that cannot be decrypted are skipped with a warning.
+    """
+    db_path = _cookie_db_path(user_data_dir, profile_dir)
+    if db_path is None:
+        logger.warning(f"No cookie database found in {os.path.join(user_data_dir, profile_dir)}")
+        return {}
+    decryptor = _CookieDecryptor(user_data_dir)
+    cookies = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        copy_path = os.path.join(tmp, 'Cookies')
+        shutil.copyfile(db_path, copy_path)
+        conn = sqlite3.connect(copy_path)
+        try:
+            version_row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            version = int(version_row[0]) if version_row else 0
+            rows = conn.execute(
+                "SELECT host_key, name, value, encrypted_value FROM cookies WHERE host_key LIKE ? ORDER BY expires_utc",
+                (f"%{domain}",)
+            ).fetchall()
+        finally:
+            conn.close()
+    for host_key, name, value, encrypted_value in rows:
+        if not value and encrypted_value:
+            try:
+                plaintext = decryptor.decrypt(encrypted_value)
+            except Exception as e:
+                logger.warning(f"Could not decrypt cookie {name} for {host_key}: {type(e).__name__}: {e}")
+                continue
+            if version >= 24:
+                plaintext = plaintext[32:]  # Newer databases prefix the SHA-256 of the host key
+            value = plaintext.decode('utf-8')
+        if value:
+            cookies[name] = value
+    return cookies
+
+
+class CookieBridge:
+    """Keeps ``requests`` sessions logged in with the browser profile's cookies.
+
+    Cookies are read from ``driver_provider()`` when it returns a live driver,
+    otherwise from the profile in ``user_data_dir``. They are re-read every
+    ``refresh_interval`` seconds, and right away after a session sees HTTP 401
+    or 403, so a rotated ``sessionid`` is picked up without a restart.
+    """
+
+    def __init__(self, user_data_dir=None, profile_dir='Default', domain=DEFAULT_DOMAIN, driver_provider=None,
+                 refresh_interval=300, clock=time.monotonic):
+        self.user_data_dir = user_data_dir
+        self.profile_dir = profile_dir
+        self.domain = domain
+        self.driver_provider = driver_provider
+        self.refresh_interval = refresh_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._sessions = []
+        self.cookies = {}
+        self.source = None
+        self.refreshed_at = None
+        self.stale = True
+
+    def attach(self, session):
+        """Load the current cookies into ``session`` and keep it updated."""
+        with self._lock:
+            self._sessions.append(session)
+            cookies = dict(self.cookies)
+        session.hooks['response'].append(self._on_response)
+        self._apply(session, cookies)
+        return session
+
+    def _apply(self, session, cookies):
+        for name, value in cookies.items():
+            session.cookies.set(name, value, domain=f".{self.domain}", path='/')
+
+    def _on_response(self, response, *args, **kwargs):
+        if response.status_code in (401, 403):
+            self.stale = True
+        return response
+
+    def _read(self, driver=None):
+        driver = driver or (self.driver_provider() if self.driver_provider else None)
+        if driver is not None:
+            try:
+                return cookies_from_driver(driver, self.domain), 'driver'
+            except Exception as e:
+                logger.warning(f"Could not read cookies from WebDriver: {type(e).__name__}: {e}")
+        if self.user_data_dir:
+            try:
+                return cookies_from_profile(self.user_data_dir, self.profile_dir, self.domain), 'profile'
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"Could not read cookies from profile {self.user_data_dir}: {type(e).__name__}: {e}")
+        return {}, None
+
+    def refresh(self, driver=None):
+        """Re-read the cookies and push them to every attached session. Returns True if ``sessionid`` changed."""
+        cookies, source = self._read(driver)
+        with self._lock:
+            self.refreshed_at = self._clock()
+            if SESSION_COOKIE not in cookies:
+                logger.warning(f"No {SESSION_COOKIE} cookie for {self.domain} found (source: {source or 'none'}).")
+                return False
+            rotated = cookies.get(SESSION_COOKIE) != self.cookies.get(SESSION_COOKIE)
+            self.cookies, self.source, self.stale = cookies, source, False
+            sessions = list(self._sessions)
+        for session in sessions:
+            self._apply(session, cookies)
+        if rotated:
+            logger.info(f"Session cookies loaded from {source} ({len(cookies)} cookies).")
+        return rotated
+
+    def ensure_fresh(self):
+        """Refresh when the cookies are older than ``refresh_interval`` or a request was rejected."""
+        if self.stale or self.refreshed_at is None or self._clock() - self.refreshed_at > self.refresh_interval:
+            self.refresh()
+        return self.cookies.get(SESSION_COOKIE) is not None
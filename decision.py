@@ -0,0 +1,221 @@
+import itertools
+import math
+
+import numpy as np
+
+
+class CatalogDecision:
+    """Buy-rule results for a whole catalog, one array element per product.
+
+    Produced by :func:`evaluate_catalog`. ``buy_quantities`` is zero for
+    products that did not trigger or whose caps leave nothing to buy.
+    """
+
+    __slots__ = ('names', 'lowest_prices', 'second_lowest_prices', 'lowest_quantities', 'order_ids',
+                 'threshold_prices', 'triggered', 'buy_quantities', 'costs', 'savings', '_positions')
+
+    def __init__(self, names, lowest_prices, second_lowest_prices, lowest_quantities, order_ids,
+                 threshold_prices, triggered, buy_quantities, costs, savings):
+        self.names = names
+        self.lowest_prices = lowest_prices
+        self.second_lowest_prices = second_lowest_prices
+        self.lowest_quantities = lowest_quantities
+        self.order_ids = order_ids
+        self.threshold_prices = threshold_prices
+        self.triggered = triggered
+        self.buy_quantities = buy_quantities
+        self.costs = costs
+        self.savings = savings
+        self._positions = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def index_of(self, name):
+        """Row of product ``name``, or None if it was not evaluated."""
+        if self._positions is None:
+            self._positions = {product: i for i, product in enumerate(self.names)}
+        return self._positions.get(name)
+
+    def ranking(self):
+        """Indices of actionable products, largest expected saving first."""
+        actionable = np.flatnonzero(self.buy_quantities > 0)
+        return actionable[np.argsort(-self.savings[actionable], kind='stable')]
+
+    def opportunities(self):
+        """Ranked list of actionable products as dicts."""
+        return [
+            {
+                'name': self.names[i],
+                'order_id': int(self.order_ids[i]),
+                'price': float(self.lowest_prices[i]),
+                'second_lowest_price': float(self.second_lowest_prices[i]),
+                'threshold_price': float(self.threshold_prices[i]),
+                'quantity': int(self.buy_quantities[i]),
+                'cost': float(self.costs[i]),
+                'expected_savings': float(self.savings[i]),
+            }
+            for i in self.ranking()
+        ]
+
+
+class DepthFill:
+    """Planned fill across one or more price levels: units, total cost, highest price taken and levels used."""
+
+    __slots__ = ('quantity', 'cost', 'max_price', 'levels')
+
+    def __init__(self, quantity=0, cost=0.0, max_price=None, levels=0):
+        self.quantity = quantity
+        self.cost = cost
+        self.max_price = max_price
+        self.levels = levels
+
+    @property
+    def vwap(self):
+        return self.cost / self.quantity if self.quantity else None
+
+    def __repr__(self):
+        return f"DepthFill(quantity={self.quantity}, cost={self.cost:.3f}, max_price={self.max_price}, levels={self.levels})"
+
+
+def walk_depth(orders, max_quantity=float('inf'), max_cost=float('inf')):
+    """Fill from ``orders`` cheapest first, up to ``max_quantity`` units and ``max_cost`` spent.
+
+    ``orders`` are ``{'price', 'quantity'}`` dicts such as the
+    ``orders_below_threshold`` of ``get_market_data``. The last level taken
+    may be partial; the walk stops at the first level not even one unit of
+    fits the remaining budget, as the market fills cheapest first.
+    """
+    fill = DepthFill()
+    remaining_cost = max_cost
+    for order in sorted(orders, key=lambda order: order['price']):
+        remaining_quantity = max_quantity - fill.quantity
+        if remaining_quantity <= 0:
+            break
+        price = order['price']
+        take = min(order['quantity'], remaining_quantity)
+        if math.isfinite(remaining_cost):  # inf // price is NaN
+            take = min(take, remaining_cost // price)
+        if take <= 0:
+            break
+        take = int(take)
+        fill.quantity += take
+        fill.cost += take * price
+        fill.max_price = price
+        fill.levels += 1
+        remaining_cost -= take * price
+    return fill
+
+
+def evaluate_catalog(names, lowest_prices, second_lowest_prices, lowest_quantities, thresholds,
+                     max_buy_quantities, max_total_costs, available_cash=None, min_cash_reserve=0.0,
+                     order_ids=None, depth_orders=None):
+    """Apply AutoBuyer's buy rule and quantity caps to every product at once.
+
+    A product triggers when ``lowest < second_lowest * threshold``; missing
+    second-lowest prices are passed as NaN and never trigger. The quantity is
+    the lowest order's quantity capped by ``max_buy_quantities``, by
+    ``max_total_costs // price`` (a cap of 0 or NaN means no cost cap) and,
+    when ``available_cash`` is given, by ``(available_cash - min_cash_reserve) // price``.
+    Cash is checked per product, as AutoBuyer re-reads it before each purchase.
+    Expected savings are ``quantity * second_lowest - cost``.
+
+    ``depth_orders`` optionally gives, per product, the orders the purchase may
+    fill (``orders_below_threshold``). Triggered products with more than one
+    such order are planned with :func:`walk_depth` under the same caps, as
+    AutoBuyer plans the purchase itself, so quantity, cost and saving match it
+    (daily spend caps are only applied when the purchase runs).
+    """
+    lowest = np.asarray(lowest_prices, dtype=np.float64)
+    second = np.asarray(second_lowest_prices, dtype=np.float64)
+    quantities = np.asarray(lowest_quantities, dtype=np.float64)
+    count = len(lowest)
+    thresholds = np.broadcast_to(np.asarray(thresholds, dtype=np.float64), (count,))
+    max_buy = np.broadcast_to(np.asarray(max_buy_quantities, dtype=np.float64), (count,))
+    max_cost = np.broadcast_to(np.asarray(max_total_costs, dtype=np.float64), (count,))
+
+    threshold_prices = second * thresholds
+    valid_price = lowest > 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        triggered = valid_price & (lowest < threshold_prices)  # NaN comparisons are False
+        buy = np.minimum(quantities, max_buy)
+        has_cost_cap = np.nan_to_num(max_cost) > 0
+        buy = np.where(has_cost_cap, np.minimum(buy, np.floor_divide(max_cost, lowest)), buy)
+        if available_cash is not None:
+            spendable = max(0.0, available_cash - min_cash_reserve)
+            buy = np.minimum(buy, np.floor_divide(spendable, lowest))
+    buy = np.where(triggered & np.isfinite(buy), np.maximum(buy, 0), 0).astype(np.int64)
+    costs = buy * lowest
+    savings = np.where(buy > 0, buy * (second - lowest), 0.0)
+    if depth_orders is not None:
+        for i in np.flatnonzero(triggered).tolist():
+            orders = depth_orders[i]
+            if not orders or len(orders) < 2:
+                continue
+            cost_cap = max_cost[i] if has_cost_cap[i] else np.inf
+            if available_cash is not None:
+                cost_cap = min(cost_cap, spendable)
+            fill = walk_depth(orders, max_buy[i], cost_cap)
+            buy[i] = fill.quantity
+            costs[i] = fill.cost
+            savings[i] = fill.quantity * second[i] - fill.cost if fill.quantity else 0.0
+
+    if order_ids is None:
+        order_ids = np.full(count, -1, dtype=np.int64)
+    return CatalogDecision(list(names), lowest, second, quantities.astype(np.int64),
+                           np.asarray(order_ids, dtype=np.int64), threshold_prices, triggered, buy, costs, savings)
+
+
+class DecisionCatalog:
+    """Per-product settings laid out as arrays once, so each scan only gathers prices.
+
+    ``thresholds``, ``max_buy_quantities`` and ``max_total_costs`` are dicts
+    keyed by product name, as in ``config``.
+    """
+
+    def __init__(self, names, thresholds, max_buy_quantities, max_total_costs, default_threshold=0.94):
+        self.names = list(names)
+        self.thresholds = np.array([thresholds.get(name, default_threshold) for name in self.names], dtype=np.float64)
+        self.max_buy_quantities = np.array([max_buy_quantities.get(name, np.inf) for name in self.names],
+                                           dtype=np.float64)
+        self.max_total_costs = np.array([max_total_costs.get(name) or 0.0 for name in self.names], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.names)
+
+    def evaluate(self, results, available_cash=None, min_cash_reserve=0.0):
+        """Vectorized decision over ``scan_market_data`` output (``{name: (data, error_details)}``).
+
+        Products that were not fetched, failed, or have no lowest order are
+        left out of the returned :class:`CatalogDecision`. When the scan
+        carries ``orders_below_threshold``, the purchase is planned across
+        them with :func:`walk_depth`, as AutoBuyer does.
+        """
+        nan = np.nan
+        rows = []
+        order_ids = []
+        depths = []
+        present = []
+        for index, name in enumerate(self.names):
+            entry = results.get(name)
+            data = entry[0] if entry else None
+            order = data.get('lowest_order') if data else None
+            if order is None:
+                continue
+            rows.append((order['price'], data.get('second_lowest_price', nan), order['quantity']))
+            order_ids.append(order['id'])
+            depths.append(data.get('orders_below_threshold'))
+            present.append(index)
+        # fromiter over the flattened rows is noticeably cheaper than np.array(list_of_tuples)
+        table = np.fromiter(itertools.chain.from_iterable(rows), dtype=np.float64, count=3 * len(rows)).reshape(-1, 3)
+        return evaluate_catalog(
+            [self.names[i] for i in present], table[:, 0], table[:, 1], table[:, 2],
+            thresholds=self.thresholds[present],
+            max_buy_quantities=self.max_buy_quantities[present],
+            max_total_costs=self.max_total_costs[present],
+            available_cash=available_cash,
+            min_cash_reserve=min_cash_reserve,
+            order_ids=np.fromiter(order_ids, dtype=np.int64, count=len(order_ids)),
+            depth_orders=depths,
+        )
+
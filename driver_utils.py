@@ -1,14 +1,18 @@
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service as ChromeService
 from webdriver_manager.chrome import ChromeDriverManager
+import logging
 import os
 from dotenv import load_dotenv # Import load_dotenv
 from filelock import FileLock
 import re
 import subprocess
+import time
 
 load_dotenv() # Load environment variables from .env file
 
+logger = logging.getLogger(__name__)
+
 def get_installed_chrome_version():
     try:
         # Use reg query to get Chrome version from registry
@@ -72,20 +76,20 @@ def initialize_driver(user_data_dir=None, user_data_dir_env_var="USER_DATA_DIR",
                 # If you want truly separate profiles, ensure user-data-dir itself is unique per instance.
                 if profile_dir != "Default": # Only add if not default, and ensure user_data_dir is distinct
                     options.add_argument(f"--profile-directory={profile_dir}")
-                print(f"[資訊] 嘗試使用 User Data Directory: {effective_user_data_dir} 和 Profile: {profile_dir} 啟動 Chrome。")
+                logger.info(f"嘗試使用 User Data Directory: {effective_user_data_dir} 和 Profile: {profile_dir} 啟動 Chrome。")
                 
                 chrome_version = get_installed_chrome_version()
                 if chrome_version:
-                    print(f"[資訊] 偵測到 Chrome 版本: {chrome_version}。使用此版本對應的 ChromeDriver。")
+                    logger.info(f"偵測到 Chrome 版本: {chrome_version}。使用此版本對應的 ChromeDriver。")
                     driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager(driver_version=chrome_version).install()), options=options)
                 else:
-                    print("[警告] 未偵測到已安裝的 Chrome 版本。嘗試使用最新版 ChromeDriver。")
+                    logger.warning("未偵測到已安裝的 Chrome 版本。嘗試使用最新版 ChromeDriver。")
                     driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), options=options)
-                print("[資訊] Chrome 使用指定的 User Data Directory 啟動成功。")
+                logger.info("Chrome 使用指定的 User Data Directory 啟動成功。")
                 return driver
             except Exception as e:
-                print(f"[警告] 使用 user-data-dir ({effective_user_data_dir}) 啟動 Chrome 失敗: {e}")
-                print("[資訊] 將改用預設 (臨時) profile 啟動 Chrome。")
+                logger.warning(f"使用 user-data-dir ({effective_user_data_dir}) 啟動 Chrome 失敗: {e}")
+                logger.info("將改用預設 (臨時) profile 啟動 Chrome。")
                 # Reset options for a clean default profile attempt
                 options = webdriver.ChromeOptions()
                 options.add_argument('--no-sandbox')
@@ -99,20 +103,20 @@ def initialize_driver(user_data_dir=None, user_data_dir_env_var="USER_DATA_DIR",
 
                 chrome_version = get_installed_chrome_version()
                 if chrome_version:
-                    print(f"[資訊] (Fallback) 偵測到 Chrome 版本: {chrome_version}。使用此版本對應的 ChromeDriver。")
+                    logger.info(f"(Fallback) 偵測到 Chrome 版本: {chrome_version}。使用此版本對應的 ChromeDriver。")
                     driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager(driver_version=chrome_version).install()), options=options)
                 else:
-                    print("[警告] (Fallback) 未偵測到已安裝的 Chrome 版本。嘗試使用最新版 ChromeDriver。")
+                    logger.warning("(Fallback) 未偵測到已安裝的 Chrome 版本。嘗試使用最新版 ChromeDriver。")
                     driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), options=options)
-                print("[資訊] Chrome 已使用預設 (臨時) profile 啟動。")
+                logger.info("Chrome 已使用預設 (臨時) profile 啟動。")
                 return driver
         else:
             if not effective_user_data_dir:
-                print(f"[警告] 未指定 user_data_dir 且環境變數 {user_data_dir_env_var} 未設置或為空。")
+                logger.warning(f"未指定 user_data_dir 且環境變數 {user_data_dir_env_var} 未設置或為空。")
             elif not os.path.exists(effective_user_data_dir):
-                print(f"[警告] 指定的 USER_DATA_DIR 路徑不存在: {effective_user_data_dir}")
+                logger.warning(f"指定的 USER_DATA_DIR 路徑不存在: {effective_user_data_dir}")
             
-            print("[資訊] 將使用預設 (臨時) profile 啟動 Chrome。")
+            logger.info("將使用預設 (臨時) profile 啟動 Chrome。")
             # Ensure options are for a default profile
             options = webdriver.ChromeOptions()
             options.add_argument('--no-sandbox')
@@ -126,10 +130,102 @@ def initialize_driver(user_data_dir=None, user_data_dir_env_var="USER_DATA_DIR",
 
             chrome_version = get_installed_chrome_version()
             if chrome_version:
-                print(f"[資訊] (Default) 偵測到 Chrome 版本: {chrome_version}。使用此版本對應的 ChromeDriver。")
+                logger.info(f"(Default) 偵測到 Chrome 版本: {chrome_version}。使用此版本對應的 ChromeDriver。")
                 driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager(driver_version=chrome_version).install()), options=options)
             else:
-                print("[警告] (Default) 未偵測到已安裝的 Chrome 版本。嘗試使用最新版 ChromeDriver。")
+                logger.warning("(Default) 未偵測到已安裝的 Chrome 版本。嘗試使用最新版 ChromeDriver。")
                 driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), options=options)
-            print("[資訊] Chrome 已使用預設 (臨時) profile 啟動。")
+            logger.info("Chrome 已使用預設 (臨時) profile 啟動。")
             return driver
+
+
+class WarmDriver:
+    """Long-lived WebDriver that is kept open between purchase attempts.
+
+    ``get()`` returns a live driver, starting one with ``factory`` (by default
+    :func:`initialize_driver`) when none is running, when the current one
+    fails its health check (crash recovery), or when it has been idle for
+    ``idle_timeout`` seconds or alive for ``max_age`` seconds (recycling, so
+    a long-running Chrome does not accumulate memory). A fresh driver opens
+    ``warm_url`` right away, so the session cookies and page assets are
+    loaded before the first purchase needs them.
+    """
+
+    def __init__(self, user_data_dir=None, user_data_dir_env_var="USER_DATA_DIR", profile_dir="Default",
+                 idle_timeout=1800, max_age=6 * 3600, warm_url=None, factory=None, clock=time.monotonic):
+        self.user_data_dir = user_data_dir
+        self.user_data_dir_env_var = user_data_dir_env_var
+        self.profile_dir = profile_dir
+        self.idle_timeout = idle_timeout
+        self.max_age = max_age
+        self.warm_url = warm_url
+        self._factory = factory or initialize_driver
+        self._clock = clock
+        self.driver = None
+        self.started_at = None
+        self.last_used = None
+        self.restarts = 0
+
+    def is_healthy(self):
+        """True if the browser answers a trivial script call."""
+        if self.driver is None:
+            return False
+        try:
+            return self.driver.execute_script("return document.readyState") is not None
+        except Exception:  # WebDriverException, or connection errors once chromedriver has died
+            return False
+
+    def _expired(self, now):
+        if self.driver is None:
+            return False
+        idle = self.idle_timeout is not None and now - self.last_used > self.idle_timeout
+        old = self.max_age is not None and now - self.started_at > self.max_age
+        return idle or old
+
+    def start(self):
+        """Quit any current driver and launch a new one."""
+        self.quit()
+        logger.info("Starting warm WebDriver...")
+        self.driver = self._factory(user_data_dir=self.user_data_dir,
+                                    user_data_dir_env_var=self.user_data_dir_env_var,
+                                    profile_dir=self.profile_dir)
+        self.started_at = self.last_used = self._clock()
+        if self.warm_url:
+            try:
+                self.driver.get(self.warm_url)
+            except Exception as e:
+                logger.warning(f"Warm WebDriver could not open {self.warm_url}: {type(e).__name__} - {e}")
+        return self.driver
+
+    def get(self):
+        """Return a healthy driver, restarting or recycling it first if needed."""
+        if self.driver is not None and not self.is_healthy():
+            logger.warning("Warm WebDriver failed its health check, restarting it...")
+            self.restarts += 1
+            self.start()
+        elif self.driver is None or self._expired(self._clock()):
+            self.start()
+        self.last_used = self._clock()
+        return self.driver
+
+    def maintain(self):
+        """Between cycles: replace a crashed or expired driver so the next ``get()`` is instant."""
+        if self.driver is None:
+            return
+        if not self.is_healthy():
+            logger.warning("Warm WebDriver is no longer responding, restarting it...")
+            self.restarts += 1
+            self.start()
+        elif self._expired(self._clock()):
+            logger.info("Recycling warm WebDriver...")
+            self.start()
+
+    def quit(self):
+        if self.driver is None:
+            return
+        try:
+            self.driver.quit()
+        except Exception as e:
+            logger.warning(f"Error closing warm WebDriver: {type(e).__name__} - {e}")
+        finally:
+            self.driver = None
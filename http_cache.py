@@ -0,0 +1,196 @@
+import hashlib
+import threading
+import time
+from email.utils import formatdate
+
+from requests import Response
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+CACHE_STATUS_HEADER = 'X-Cache-Status'
+CACHE_AGE_HEADER = 'X-Cache-Age'
+CONTENT_HASH_HEADER = 'X-Content-Hash'
+
+
+class CacheEntry:
+    __slots__ = ('body', 'headers', 'encoding', 'etag', 'last_modified', 'max_age', 'no_cache',
+                 'content_hash', 'stored_at')
+
+    def __init__(self, body, headers, encoding, stored_at):
+        self.body = body
+        self.headers = CaseInsensitiveDict(headers)
+        self.encoding = encoding
+        self.etag = headers.get('ETag')
+        self.last_modified = headers.get('Last-Modified')
+        self.max_age, self.no_cache = parse_cache_control(headers.get('Cache-Control'))
+        self.content_hash = hashlib.sha1(body).hexdigest()
+        self.stored_at = stored_at
+
+    def age(self, now):
+        return max(0.0, now - self.stored_at)
+
+    def is_fresh(self, now):
+        return not self.no_cache and self.max_age is not None and self.age(now) < self.max_age
+
+
+def parse_cache_control(value):
+    """Return ``(max_age, no_cache)`` from a Cache-Control header."""
+    max_age = None
+    no_cache = False
+    if not value:
+        return max_age, no_cache
+    for directive in value.split(','):
+        name, _, argument = directive.strip().partition('=')
+        name = name.lower()
+        if name in ('no-cache', 'no-store'):
+            no_cache = True
+        elif name == 'max-age':
+            try:
+                max_age = max(0, int(argument.strip('"')))
+            except ValueError:
+                pass
+    return max_age, no_cache
+
+
+def parse_retry_after(value, default):
+    """Seconds to wait from a Retry-After header (delta-seconds form only)."""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return default
+
+
+class CachingAdapter(HTTPAdapter):
+    """HTTPAdapter that revalidates GET responses and serves snapshots.
+
+    * Responses still fresh under ``Cache-Control: max-age`` are served
+      without touching the network (``X-Cache-Status: hit``).
+    * Otherwise the request carries ``If-None-Match``/``If-Modified-Since``
+      and a 304 is answered from the cache (``revalidated``).
+    * Every GET response gets an ``X-Content-Hash`` so callers can tell when
+      a book is unchanged even if the server sends no validators.
+    * After an HTTP 429, cached snapshots younger than
+      ``stale_if_rate_limited`` seconds are served (``stale``) until the
+      ``Retry-After`` window ends; uncached URLs get a local 429 instead of
+      another request to the server.
+    * A request sent with ``Cache-Control: no-cache`` is never answered from
+      a fresh or stale snapshot; only a 304 from the server confirms one.
+    * A ``stream=True`` response is passed through unread (``bypass``), so a
+      streaming decoder can stop early; it is neither stored nor hashed.
+    """
+
+    def __init__(self, stale_if_rate_limited=120, default_backoff=60, max_entries=256,
+                 clock=time.time, **kwargs):
+        super().__init__(**kwargs)
+        self.stale_if_rate_limited = stale_if_rate_limited
+        self.default_backoff = default_backoff
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.backoff_until = 0.0
+
+    def send(self, request, **kwargs):
+        if request.method != 'GET':
+            return super().send(request, **kwargs)
+
+        url = request.url
+        now = self._clock()
+        _, must_revalidate = parse_cache_control(request.headers.get('Cache-Control'))
+        with self._lock:
+            entry = self._entries.get(url)
+            backoff_remaining = self.backoff_until - now
+
+        if backoff_remaining > 0:
+            if entry is not None and not must_revalidate and entry.age(now) <= self.stale_if_rate_limited:
+                return self._build_response(request, entry, 'stale', now)
+            return self._build_rate_limited(request, backoff_remaining)
+
+        if entry is not None and not must_revalidate and entry.is_fresh(now):
+            return self._build_response(request, entry, 'hit', now)
+
+        if entry is not None:
+            if entry.etag:
+                request.headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                request.headers['If-Modified-Since'] = entry.last_modified
+
+        response = super().send(request, **kwargs)
+
+        if response.status_code == 304 and entry is not None:
+            response.close()
+            with self._lock:
+                entry.stored_at = self._clock()
+                for header in ('ETag', 'Last-Modified', 'Cache-Control', 'Date'):
+                    if header in response.headers:
+                        entry.headers[header] = response.headers[header]
+                entry.etag = entry.headers.get('ETag')
+                entry.last_modified = entry.headers.get('Last-Modified')
+                entry.max_age, entry.no_cache = parse_cache_control(entry.headers.get('Cache-Control'))
+            return self._build_response(request, entry, 'revalidated', entry.stored_at)
+
+        if response.status_code == 429:
+            backoff = parse_retry_after(response.headers.get('Retry-After'), self.default_backoff)
+            with self._lock:
+                self.backoff_until = max(self.backoff_until, self._clock() + backoff)
+            return response
+
+        if response.status_code == 200 and kwargs.get('stream'):
+            response.headers[CACHE_STATUS_HEADER] = 'bypass'  # Reading the body here would defeat the early stop
+        elif response.status_code == 200:
+            body = response.content  # Buffers the body so it can be hashed and replayed
+            stored = CacheEntry(body, response.headers, response.encoding, self._clock())
+            response.headers[CONTENT_HASH_HEADER] = stored.content_hash
+            response.headers[CACHE_STATUS_HEADER] = 'miss'
+            if not stored.no_cache or stored.etag or stored.last_modified:
+                with self._lock:
+                    self._entries.pop(url, None)
+                    self._entries[url] = stored
+                    while len(self._entries) > self.max_entries:
+                        self._entries.pop(next(iter(self._entries)))
+        return response
+
+    def _build_response(self, request, entry, status, now):
+        response = Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.headers = CaseInsensitiveDict(entry.headers)
+        response.headers[CACHE_STATUS_HEADER] = status
+        response.headers[CACHE_AGE_HEADER] = f"{entry.age(now):.1f}"
+        response.headers[CONTENT_HASH_HEADER] = entry.content_hash
+        response.encoding = entry.encoding
+        response._content = entry.body
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def _build_rate_limited(self, request, remaining):
+        response = Response()
+        response.status_code = 429
+        response.reason = 'Too Many Requests'
+        response.headers = CaseInsensitiveDict({
+            'Retry-After': str(int(remaining + 0.999)),
+            'Date': formatdate(usegmt=True),
+            CACHE_STATUS_HEADER: 'backoff',
+        })
+        response._content = b''
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.backoff_until = 0.0
+
+
+def install_cache(session, prefixes=('https://', 'http://'), **adapter_kwargs):
+    """Mount a CachingAdapter on ``session`` and return it."""
+    adapter = CachingAdapter(**adapter_kwargs)
+    for prefix in prefixes:
+        session.mount(prefix, adapter)
+    return adapter
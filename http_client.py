@@ -0,0 +1,145 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+
+from http_cache import CACHE_STATUS_HEADER, CachingAdapter
+
+
+class RequestTimer:
+    """Response hook that records per-request timings for a session.
+
+    ``response.elapsed`` covers sending the request up to parsing the
+    response headers, so it includes connection setup when the pool had no
+    live connection for the host. HEAD requests (warmup pings) are ignored.
+    """
+
+    def __init__(self, keep_last=256):
+        self.keep_last = keep_last
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.records = []
+            self.count = 0
+            self.total_seconds = 0.0
+            self.max_seconds = 0.0
+
+    def __call__(self, response, *args, **kwargs):
+        method = response.request.method if response.request is not None else None
+        if method == 'HEAD':
+            return response
+        seconds = response.elapsed.total_seconds()
+        record = {
+            'method': method,
+            'url': response.url,
+            'status_code': response.status_code,
+            'seconds': seconds,
+            'cache_status': response.headers.get(CACHE_STATUS_HEADER),
+        }
+        with self._lock:
+            self.records.append(record)
+            if len(self.records) > self.keep_last:
+                del self.records[0]
+            self.count += 1
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+        return response
+
+    def summary(self):
+        with self._lock:
+            if not self.count:
+                return "no requests"
+            return (f"{self.count} requests, avg {self.total_seconds / self.count * 1000:.0f} ms, "
+                    f"max {self.max_seconds * 1000:.0f} ms")
+
+
+def accept_encoding():
+    """Accept-Encoding value for every codec urllib3 can decode here (gzip, deflate, plus br/zstd if installed)."""
+    return make_headers(accept_encoding=True)['accept-encoding']
+
+
+def create_session(headers=None, cookies=None, pool_maxsize=10, pool_connections=4, cache=False,
+                   timer=True, **cache_kwargs):
+    """Build a ``requests.Session`` with an explicitly sized connection pool.
+
+    ``pool_maxsize`` is the number of kept-alive connections per host; set it
+    to at least the scan concurrency, otherwise urllib3 discards connections
+    returned by concurrent workers and the next request reconnects.
+    With ``cache=True`` the adapter is a :class:`CachingAdapter` configured
+    by ``cache_kwargs``. With ``timer=True`` a :class:`RequestTimer` is
+    attached as ``session.timer``.
+    """
+    session = requests.Session()
+    session.headers['Accept-Encoding'] = accept_encoding()
+    if headers:
+        session.headers.update(headers)
+    if cookies:
+        session.cookies.update(cookies)
+
+    pool_kwargs = {'pool_connections': pool_connections, 'pool_maxsize': pool_maxsize}
+    adapter = CachingAdapter(**cache_kwargs, **pool_kwargs) if cache else HTTPAdapter(**pool_kwargs)
+    for prefix in ('https://', 'http://'):
+        session.mount(prefix, adapter)
+
+    session.timer = None
+    if timer:
+        session.timer = RequestTimer()
+        session.hooks['response'].append(session.timer)
+    return session
+
+
+def warm_up(session, urls, connections=1, timeout=10, rate_limiter=None):
+    """Open ``connections`` keep-alive connections to the origin of each URL.
+
+    Sends concurrent ``HEAD /`` requests so DNS, TCP and TLS setup happen
+    before a scan instead of during its first fetches. Servers drop idle
+    connections long before the 10-40 minute cycle sleep ends, so call this
+    right before each cycle. Each ping takes a token from ``rate_limiter``
+    when one is given, like any other request to the server. Returns
+    ``{origin: seconds or error string}`` for the slowest request per origin.
+    """
+    origins = []
+    for url in urls:
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        if parts.scheme in ('http', 'https') and origin not in origins:
+            origins.append(origin)
+
+    jobs = [origin for origin in origins for _ in range(max(1, connections))]
+    if not jobs:
+        return {}
+    # Each ping holds its connection until every ping has one, so the pool ends up with
+    # ``connections`` distinct sockets instead of reusing one that was returned early.
+    barrier = threading.Barrier(len(jobs))
+
+    def ping(origin):
+        response = None
+        try:
+            if rate_limiter is not None and not rate_limiter.acquire(timeout=timeout):
+                return origin, f"no rate limiter token within {timeout}s"
+            response = session.head(f"{origin}/", timeout=timeout, allow_redirects=False, stream=True)
+            return origin, response.elapsed.total_seconds()
+        except requests.exceptions.RequestException as e:
+            return origin, f"{type(e).__name__}: {e}"
+        finally:
+            try:
+                barrier.wait(timeout)
+            except threading.BrokenBarrierError:
+                pass
+            if response is not None:
+                response.content  # Reads the empty body, which returns the connection to the pool
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+        for origin, outcome in executor.map(ping, jobs):
+            previous = results.get(origin)
+            if isinstance(previous, str):
+                continue  # Keep the first error for the origin
+            if isinstance(outcome, str) or previous is None or outcome > previous:
+                results[origin] = outcome
+    return results
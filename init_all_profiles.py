@@ -14,7 +14,7 @@ PROFILE_KEYS = [
     "USER_DATA_DIR_oiirig",
 ]
 
-LOGIN_URL = "https://www.simcompanies.com/signin/"
+LOGIN_URL = os.getenv("SIMCOMPANIES_BASE_URL", "https://www.simcompanies.com").rstrip("/") + "/signin/"
 
 for key in PROFILE_KEYS:
     profile = os.getenv(key)
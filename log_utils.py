@@ -0,0 +1,134 @@
+import atexit
+import logging
+import os
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+
+_lock = threading.Lock()
+_listeners = {}  # destination key -> (QueueHandler, QueueListener)
+_attached = []  # (logger, QueueHandler) pairs added by configure_logging and setup_logger
+
+
+def parse_module_levels(spec):
+    """``"market_utils=WARNING,AutoBuyer=DEBUG"`` -> ``{'market_utils': 'WARNING', 'AutoBuyer': 'DEBUG'}``."""
+    levels = {}
+    for item in (spec or '').split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def level_for(name, module_levels, default):
+    """Level of the most specific ``module_levels`` entry for logger ``name`` (``a`` covers ``a.b``)."""
+    while name:
+        if name in module_levels:
+            return module_levels[name]
+        name = name.rpartition('.')[0]
+    return default
+
+
+def _queued(key, make_handlers):
+    """A QueueHandler feeding ``make_handlers()`` from one background thread per destination.
+
+    Records are only put on an unbounded queue by the calling thread, so
+    console and file I/O never block the scan or a purchase.
+    """
+    with _lock:
+        if key not in _listeners:
+            log_queue = queue.SimpleQueue()
+            listener = QueueListener(log_queue, *make_handlers(), respect_handler_level=True)
+            listener.start()
+            _listeners[key] = (QueueHandler(log_queue), listener)
+        return _listeners[key][0]
+
+
+def _console_handler(formatter):
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(formatter)
+    return handler
+
+
+def _file_handler(log_filename, formatter):
+    log_path = os.path.join('record', log_filename)
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    handler = RotatingFileHandler(log_path, maxBytes=5 * 1024 * 1024, backupCount=5, encoding='utf-8')
+    handler.setFormatter(formatter)
+    return handler
+
+
+def _attach(logger, handler):
+    with _lock:
+        if (logger, handler) not in _attached:
+            _attached.append((logger, handler))
+    logger.addHandler(handler)
+
+
+def stop_logging():
+    """Write out queued records and stop the writer threads (also runs at exit).
+
+    The queue handlers are detached and ``setup_logger`` loggers propagate
+    again, so later records reach any remaining handlers (or Python's
+    last-resort stderr handler) instead of a queue nobody reads.
+    ``configure_logging`` and ``setup_logger`` start new writers.
+    """
+    with _lock:
+        listeners = list(_listeners.values())
+        _listeners.clear()
+        attached = _attached[:]
+        _attached.clear()
+    for logger, handler in attached:
+        logger.removeHandler(handler)
+        if logger is not logging.getLogger():
+            logger.propagate = True
+    for _, listener in listeners:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+atexit.register(stop_logging)
+
+
+def configure_logging(level=None, module_levels=None):
+    """Send module loggers (``AutoBuyer``, ``market_utils``, ...) to the console through a background writer.
+
+    ``level`` and ``module_levels`` default to ``LOG_LEVEL`` and ``LOG_LEVELS``
+    from config. Safe to call more than once.
+    """
+    if level is None or module_levels is None:
+        from config import LOG_LEVEL, LOG_LEVELS
+        level = LOG_LEVEL if level is None else level
+        module_levels = parse_module_levels(LOG_LEVELS) if module_levels is None else module_levels
+    root = logging.getLogger()
+    handler = _queued('console', lambda: [_console_handler(logging.Formatter(LOG_FORMAT))])
+    if handler not in root.handlers:
+        _attach(root, handler)
+    root.setLevel(level)
+    for name, module_level in module_levels.items():
+        logging.getLogger(name).setLevel(module_level)
+    return root
+
+
+def setup_logger(name, log_filename, console=True, fmt=LOG_FORMAT):
+    """Logger writing to ``record/<log_filename>`` (rotated at 5 MB) and the console through a background writer."""
+    from config import LOG_LEVELS
+    logger = logging.getLogger(name)
+    logger.setLevel(level_for(name, parse_module_levels(LOG_LEVELS), logging.INFO))
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+    formatter = logging.Formatter(fmt)
+
+    def make_handlers():
+        handlers = [_file_handler(log_filename, formatter)]
+        if console:
+            handlers.append(_console_handler(formatter))
+        return handlers
+
+    _attach(logger, _queued((log_filename, console, fmt), make_handlers))
+    logger.propagate = False  # Already written above; the root console would print it twice
+    return logger
@@ -0,0 +1,104 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+SIGN_IN_PATH = re.compile(r'/(signin|login)(/|$)')
+
+
+def is_sign_in_url(url):
+    """True if ``url`` points at the sign-in page."""
+    return bool(url) and bool(SIGN_IN_PATH.search(urlsplit(url).path))
+
+
+def state_path_for_profile(directory, user_data_dir):
+    """One state file per browser profile, so processes sharing a profile share its login state."""
+    name = os.path.basename(os.path.normpath(user_data_dir)) if user_data_dir else 'default'
+    return os.path.join(directory, f"{re.sub(r'[^A-Za-z0-9_.-]', '_', name)}.json")
+
+
+class LoginState:
+    """When the browser session was last seen logged in, trusted for ``ttl`` seconds.
+
+    ``mark_verified`` records a positive login check; ``mark_stale`` drops
+    it. Used as a ``requests`` response hook, any 401, 403 or redirect to
+    the sign-in page marks the state stale. With ``path`` the state is
+    kept in a JSON file and re-read on every check, so a stale mark from
+    another process using the same profile is seen too.
+    """
+
+    def __init__(self, path=None, ttl=900, clock=time.time):
+        self.path = path
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.verified_at = None
+        self.stale_reason = None
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                state = json.load(f)
+            self.verified_at = state.get('verified_at')
+            self.stale_reason = state.get('stale_reason')
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable login state {self.path}: {e}")
+
+    def _save(self):
+        if not self.path:
+            return
+        state = {'verified_at': self.verified_at, 'stale_reason': self.stale_reason}
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save login state to {self.path}: {e}")
+
+    def is_fresh(self):
+        """True if a login check passed less than ``ttl`` seconds ago and nothing has contradicted it since."""
+        with self._lock:
+            self._load()
+            return (self.verified_at is not None and self.stale_reason is None
+                    and self._clock() - self.verified_at < self.ttl)
+
+    def mark_verified(self):
+        with self._lock:
+            self.verified_at = self._clock()
+            self.stale_reason = None
+            self._save()
+
+    def mark_stale(self, reason):
+        with self._lock:
+            if self.stale_reason is None:
+                logger.info(f"Login state marked stale: {reason}")
+            self.stale_reason = reason
+            self._save()
+
+    def observe_url(self, url):
+        """Mark the state stale if the browser ended up on the sign-in page. Returns True if it did."""
+        if is_sign_in_url(url):
+            self.mark_stale(f"redirected to {url}")
+            return True
+        return False
+
+    def __call__(self, response, *args, **kwargs):
+        if response.status_code in (401, 403):
+            self.mark_stale(f"HTTP {response.status_code} from {response.url}")
+        elif response.is_redirect and is_sign_in_url(response.headers.get('Location')):
+            self.mark_stale(f"redirect to sign-in from {response.url}")
+        elif is_sign_in_url(response.url):
+            self.mark_stale(f"request ended on {response.url}")
+        return response
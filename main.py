@@ -13,7 +13,8 @@ from production_monitor import (
 )
 from config import (
     TARGET_PRODUCTS, MAX_BUY_QUANTITY, # Import TARGET_PRODUCTS
-    MARKET_HEADERS, POWER_PLANT_PATHS # Import MARKET_HEADERS
+    MARKET_HEADERS, POWER_PLANT_PATHS, # Import MARKET_HEADERS
+    SIMCOMPANIES_BASE_URL
 )
 
 def run_auto_buyer():
@@ -43,7 +44,7 @@ def login_to_game():
     try:
         # Consider using initialize_driver from driver_utils for consistency
         driver = webdriver.Chrome()  # Use Chrome browser
-        driver.get("https://www.simcompanies.com/signin/")  # Replace with the game's login page URL
+        driver.get(f"{SIMCOMPANIES_BASE_URL}/signin/")  # Replace with the game's login page URL
 
         print("Please log in to the game manually in the browser...")
         # A more robust way might involve checking cookies or a specific element
@@ -1,12 +1,289 @@
 import requests
 import json
-import traceback
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 import re
+import codecs
+import itertools
+from array import array
+import numpy as np
+from http_cache import CACHE_STATUS_HEADER, CONTENT_HASH_HEADER, parse_retry_after
 
-def get_market_data(session, api_url, target_quality, timeout=20, return_order_detail=False, error_details=None):
+logger = logging.getLogger(__name__)
+
+MISSING_ORDER_ID = -1
+
+try:
+    import orjson
+except ImportError:  # Optional fast decoder
+    orjson = None
+
+MARKET_DECODERS = ('standard', 'fast', 'stream')
+STREAM_CHUNK_SIZE = 16 * 1024
+_JSON_WHITESPACE = ' \t\r\n'
+_RAW_DECODER = json.JSONDecoder()
+
+
+def fast_json_loads(data):
+    """Decode JSON with orjson when installed, otherwise with the standard library."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class NotAJSONArrayError(ValueError):
+    """The streamed payload is valid JSON so far but not a top-level array."""
+
+
+def iter_json_array(chunks):
+    """Yield the items of a top-level JSON array as byte chunks arrive.
+
+    Each item is decoded with ``JSONDecoder.raw_decode`` once its bytes are
+    buffered, so only the current item (plus one chunk) is held in memory.
+    Raises ``NotAJSONArrayError`` or ``json.JSONDecodeError`` on bad input.
+    """
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    chunk_iter = iter(chunks)
+    buffer = ''
+    pos = 0
+    state = 'start'
+    exhausted = False
+    while True:
+        while pos < len(buffer) and buffer[pos] in _JSON_WHITESPACE:
+            pos += 1
+        item = end = None
+        if pos < len(buffer):
+            char = buffer[pos]
+            if state == 'start':
+                if char != '[':
+                    raise NotAJSONArrayError("JSON payload is not an array")
+                pos += 1
+                state = 'first'
+                continue
+            if state == 'separator':
+                if char == ']':
+                    return
+                if char != ',':
+                    raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+                pos += 1
+                state = 'item'
+                continue
+            if state == 'first' and char == ']':
+                return
+            try:
+                item, end = _RAW_DECODER.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if exhausted:
+                    raise
+        elif exhausted:
+            raise json.JSONDecodeError("Unexpected end of JSON array", buffer, pos)
+        if end is not None:
+            yield item
+            pos = end
+            state = 'separator'
+            continue
+        # Item incomplete (or buffer empty): drop consumed text and read the next chunk.
+        chunk = next(chunk_iter, None)
+        if chunk is None:
+            exhausted = True
+            buffer = buffer[pos:] + text_decoder.decode(b'', final=True)
+        else:
+            buffer = buffer[pos:] + text_decoder.decode(chunk)
+        pos = 0
+
+
+def _parse_order(order, min_quality=0, require_id=False):
+    """Return ``(order_id, price, quantity)`` for a usable sell order, else None."""
+    if not isinstance(order, dict):
+        return None
+    quality = order.get('quality')
+    price = order.get('price')
+    quantity = order.get('quantity')
+    if quality is None or price is None or quantity is None:
+        return None
+    try:
+        quality = int(quality)
+        price = float(price)
+        quantity = int(quantity)
+    except (ValueError, TypeError):
+        return None
+    if quality < min_quality or not price > 0 or quantity <= 0:
+        return None
+    order_id = order.get('id')
+    try:
+        order_id = int(order_id) if order_id is not None else MISSING_ORDER_ID
+    except (ValueError, TypeError):
+        order_id = MISSING_ORDER_ID
+    if require_id and order_id == MISSING_ORDER_ID:
+        return None
+    return order_id, price, quantity
+
+
+def take_until_price_levels_known(orders, min_quality=0, require_id=False, stats=None):
+    """Yield price-ascending orders until the two cheapest qualifying levels are known.
+
+    Stops at the first order priced above the second qualifying level, so
+    the remainder of the payload is never read. If the stream turns out not
+    to be sorted by price, every order is passed through instead.
+    """
+    lowest = second = last_price = None
+    in_order = True
+    for order in orders:
+        try:
+            price = float(order.get('price')) if isinstance(order, dict) else None
+        except (ValueError, TypeError):
+            price = None
+        if in_order and price is not None:
+            if last_price is not None and price < last_price:
+                in_order = False
+            elif second is not None and price > second:
+                if stats is not None:
+                    stats['stopped_early'] = True
+                return
+            else:
+                last_price = price
+        yield order
+        if in_order and price is not None and _parse_order(order, min_quality, require_id) is not None:
+            if lowest is None:
+                lowest = price
+            elif second is None and price > lowest:
+                second = price
+    if stats is not None:
+        stats['in_order'] = in_order
+
+
+class OrderBook:
+    """Compact sell-side order book backed by NumPy arrays.
+
+    Orders keep their API order; queries use linear scans or partial
+    selection (``np.argpartition``) instead of sorting the whole book.
+    """
+
+    __slots__ = ('ids', 'prices', 'quantities')
+
+    def __init__(self, ids, prices, quantities):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.prices = np.asarray(prices, dtype=np.float64)
+        self.quantities = np.asarray(quantities, dtype=np.int64)
+
+    @classmethod
+    def from_orders(cls, orders, min_quality=0, require_id=False):
+        """Build a book from API order dicts, skipping malformed or low-quality rows."""
+        ids = array('q')
+        prices = array('d')
+        quantities = array('q')
+        for order in orders:
+            parsed = _parse_order(order, min_quality, require_id)
+            if parsed is None:
+                continue
+            order_id, price, quantity = parsed
+            ids.append(order_id)
+            prices.append(price)
+            quantities.append(quantity)
+        return cls(
+            np.frombuffer(ids, dtype=np.int64) if ids else np.empty(0, dtype=np.int64),
+            np.frombuffer(prices, dtype=np.float64) if prices else np.empty(0, dtype=np.float64),
+            np.frombuffer(quantities, dtype=np.int64) if quantities else np.empty(0, dtype=np.int64),
+        )
+
+    def __len__(self):
+        return int(self.prices.size)
+
+    def lowest_price(self):
+        if not self.prices.size:
+            return None
+        return float(self.prices.min())
+
+    def _order(self, index):
+        order_id = int(self.ids[index])
+        return {
+            'id': None if order_id == MISSING_ORDER_ID else order_id,
+            'price': float(self.prices[index]),
+            'quantity': int(self.quantities[index]),
+        }
+
+    def lowest_order(self):
+        """Return the first listed order at the lowest price as ``{'id', 'price', 'quantity'}``."""
+        if not self.prices.size:
+            return None
+        return self._order(int(np.argmin(self.prices)))
+
+    def orders_below(self, price):
+        """Orders priced below ``price`` as ``lowest_order``-style dicts, cheapest first (listing order within a price)."""
+        indices = np.flatnonzero(self.prices < price)
+        indices = indices[np.argsort(self.prices[indices], kind='stable')]
+        return [self._order(int(index)) for index in indices]
+
+    def next_distinct_price(self, above=None):
+        """Return the cheapest price strictly above ``above`` (default: the lowest price)."""
+        if above is None:
+            above = self.lowest_price()
+            if above is None:
+                return None
+        higher = self.prices[self.prices > above]
+        if not higher.size:
+            return None
+        return float(higher.min())
+
+    def depth_below(self, price, inclusive=False):
+        """Total quantity offered below ``price`` (or at/below it when ``inclusive``)."""
+        mask = self.prices <= price if inclusive else self.prices < price
+        return int(self.quantities[mask].sum())
+
+    def cheapest_orders(self, count):
+        """Indices of the ``count`` cheapest orders in ascending price order."""
+        size = self.prices.size
+        if count <= 0 or not size:
+            return np.empty(0, dtype=np.intp)
+        if count >= size:
+            return np.argsort(self.prices, kind='stable')
+        candidates = np.argpartition(self.prices, count - 1)[:count]
+        return candidates[np.argsort(self.prices[candidates], kind='stable')]
+
+    def cost_for_quantity(self, quantity):
+        """Walk the cheapest levels to fill ``quantity`` units.
+
+        Returns ``(filled_quantity, total_cost, vwap)``; ``vwap`` is None when
+        nothing can be filled. Only the cheapest orders needed are selected,
+        doubling the selection window until it covers ``quantity``.
+        """
+        if quantity <= 0 or not self.prices.size:
+            return 0, 0.0, None
+        size = self.prices.size
+        window = min(size, 16)
+        while True:
+            indices = self.cheapest_orders(window)
+            cumulative = np.cumsum(self.quantities[indices])
+            if cumulative[-1] >= quantity or window == size:
+                break
+            window = min(size, window * 2)
+        take = np.minimum(self.quantities[indices], np.maximum(quantity - (cumulative - self.quantities[indices]), 0))
+        filled = int(take.sum())
+        total_cost = float(np.dot(take, self.prices[indices]))
+        return filled, total_cost, (total_cost / filled if filled else None)
+
+
+def get_market_data(session, api_url, target_quality, timeout=20, return_order_detail=False, error_details=None,
+                    decoder='standard', assume_sorted=False, buy_threshold=None, headers=None):
+    """Fetch one product's market book and summarise its cheapest levels.
+
+    ``decoder`` selects how the payload is parsed: ``'standard'`` uses
+    ``response.json()``, ``'fast'`` uses orjson when installed, and
+    ``'stream'`` decodes ``response.raw`` incrementally. When the API is
+    known to list orders by ascending price (``assume_sorted``), streaming
+    stops reading once the two cheapest qualifying levels are known and the
+    returned ``order_book`` only holds orders up to the second level.
+    Without that guarantee ``'stream'`` falls back to the fast decoder.
+
+    With ``return_order_detail`` and a ``buy_threshold`` (fraction of the
+    second-lowest price), ``orders_below_threshold`` lists every order
+    priced under ``second_lowest_price * buy_threshold``, cheapest first.
+    ``headers`` are sent with this request only, e.g. ``Cache-Control: no-cache``.
+    """
     if error_details is not None:
         error_details.clear()
 
@@ -19,92 +296,173 @@ def get_market_data(session, api_url, target_quality, timeout=20, return_order_d
                 'retry_after': retry_after,
             })
 
-    print(f"--- Start processing Q{target_quality} market data (API: {api_url}) ---")
+    logger.info(f"--- Start processing Q{target_quality} market data (API: {api_url}) ---")
     try:
-        response = session.get(api_url, timeout=timeout)
+        streaming = decoder == 'stream' and assume_sorted
+        if streaming:
+            response = session.get(api_url, timeout=timeout, stream=True, headers=headers)
+        else:
+            response = session.get(api_url, timeout=timeout, headers=headers)
         if response.status_code == 429:
             retry_after = response.headers.get('Retry-After')
             set_error('rate_limited', 'HTTP 429 Too Many Requests', 429, retry_after)
         response.raise_for_status()
-        try:
-            orders = response.json()
-        except json.JSONDecodeError:
-            set_error('invalid_json', 'API response was not valid JSON', response.status_code)
-            print("Error: Unable to parse JSON data from API response.")
-            print(f"Response content: {response.text[:500]}...")
-            return None
-        if not isinstance(orders, list):
-            set_error('invalid_response', 'API response was not a list', response.status_code)
-            print("Error: API response format is not the expected list.")
-            return None
-        if not orders:
-            set_error('empty_market', 'API returned no market orders', response.status_code)
-            print("Warning: No order data found in API response.")
-            return None
-        filtered = []
-        for i, order in enumerate(orders):
-            quality = order.get('quality')
-            price = order.get('price')
-            quantity = order.get('quantity')
-            order_id = order.get('id')
-            if quality is None or price is None or quantity is None:
-                continue
+        if streaming:
+            stream_stats = {}
             try:
-                quality = int(quality)
-                price = float(price)
-                quantity = int(quantity)
-            except (ValueError, TypeError):
-                continue
-            if quality >= target_quality and price > 0 and quantity > 0:
-                if return_order_detail and order_id is not None:
-                    filtered.append({'id': order_id, 'price': price, 'quantity': quantity})
+                orders = take_until_price_levels_known(
+                    iter_json_array(response.iter_content(chunk_size=STREAM_CHUNK_SIZE)),
+                    min_quality=target_quality,
+                    require_id=return_order_detail,
+                    stats=stream_stats
+                )
+                first_order = next(orders, None)
+                if first_order is None:
+                    set_error('empty_market', 'API returned no market orders', response.status_code)
+                    logger.warning("No order data found in API response.")
+                    return None
+                book = OrderBook.from_orders(
+                    itertools.chain((first_order,), orders),
+                    min_quality=target_quality,
+                    require_id=return_order_detail
+                )
+            except NotAJSONArrayError:
+                set_error('invalid_response', 'API response was not a list', response.status_code)
+                logger.error("API response format is not the expected list.")
+                return None
+            except json.JSONDecodeError as e:
+                set_error('invalid_json', 'API response was not valid JSON', response.status_code)
+                logger.error("Unable to parse JSON data from API response.")
+                logger.error(f"Response content near error: {e.doc[max(0, e.pos - 250):e.pos + 250]}...")
+                return None
+            finally:
+                # Releases the connection even when the rest of the body was never read.
+                response.close()
+            if stream_stats.get('stopped_early'):
+                logger.info(f"Streaming parse stopped early after {len(book)} qualifying orders.")
+        else:
+            try:
+                if decoder in ('fast', 'stream'):
+                    orders = fast_json_loads(response.content)
                 else:
-                    filtered.append(price)
-        if not filtered:
+                    orders = response.json()
+            except json.JSONDecodeError:
+                set_error('invalid_json', 'API response was not valid JSON', response.status_code)
+                logger.error("Unable to parse JSON data from API response.")
+                logger.info(f"Response content: {response.text[:500]}...")
+                return None
+            if not isinstance(orders, list):
+                set_error('invalid_response', 'API response was not a list', response.status_code)
+                logger.error("API response format is not the expected list.")
+                return None
+            if not orders:
+                set_error('empty_market', 'API returned no market orders', response.status_code)
+                logger.warning("No order data found in API response.")
+                return None
+            book = OrderBook.from_orders(orders, min_quality=target_quality, require_id=return_order_detail)
+        if not len(book):
             set_error('no_valid_orders', f'No valid Q{target_quality} sell orders', response.status_code)
-            print(f"Warning: No valid Q{target_quality} sell orders found.")
+            logger.warning(f"No valid Q{target_quality} sell orders found.")
             return None
+        second_lowest_price = book.next_distinct_price()
         if return_order_detail:
-            filtered.sort(key=lambda x: x['price'])
-            lowest_order = filtered[0]
-            lowest_price = lowest_order['price']
-            second_lowest_price = None
-            for o in filtered:
-                if o['price'] > lowest_price:
-                    second_lowest_price = o['price']
-                    break
-            result = {'lowest_order': lowest_order}
-            if second_lowest_price is not None:
-                result['second_lowest_price'] = second_lowest_price
-            return result
+            result = {'lowest_order': book.lowest_order()}
         else:
-            distinct_prices = sorted(list(set(filtered)))
-            if len(distinct_prices) >= 2:
-                return {'lowest_price': distinct_prices[0], 'second_lowest_price': distinct_prices[1]}
-            elif len(distinct_prices) == 1:
-                return {'lowest_price': distinct_prices[0]}
-            else:
-                return None
+            result = {'lowest_price': book.lowest_price()}
+        if second_lowest_price is not None:
+            result['second_lowest_price'] = second_lowest_price
+            if return_order_detail and buy_threshold is not None:
+                result['orders_below_threshold'] = book.orders_below(second_lowest_price * buy_threshold)
+        result['order_book'] = book
+        if streaming and stream_stats.get('stopped_early'):
+            result['partial_book'] = True  # Only the cheapest price levels were read
+        # Set by http_cache.CachingAdapter when it is mounted on the session
+        result['content_hash'] = response.headers.get(CONTENT_HASH_HEADER)
+        result['cache_status'] = response.headers.get(CACHE_STATUS_HEADER)
+        return result
     except requests.exceptions.Timeout:
         set_error('timeout', f'Request timed out after {timeout}s')
-        print(f"Error: Request to API {api_url} timed out.")
+        logger.error(f"Request to API {api_url} timed out.")
         return None
     except requests.exceptions.RequestException as e:
         status_code = e.response.status_code if e.response is not None else None
         if status_code != 429:
             kind = 'server_error' if status_code and status_code >= 500 else 'http_error'
             set_error(kind, str(e), status_code)
-        print(f"Error: Request to API {api_url} failed: {e}")
+        logger.error(f"Request to API {api_url} failed: {e}")
         return None
     except Exception as e:
         set_error('unexpected_error', f'{type(e).__name__}: {e}')
-        print(f"Error: Unexpected error occurred while processing market data:")
-        traceback.print_exc()
+        logger.exception("Unexpected error occurred while processing market data")
         return None
 
-def get_current_money(driver, landscape_url="https://www.simcompanies.com/landscape/"):
+def scan_market_data(session, products, rate_limiter=None, max_workers=8, timeout=20, return_order_detail=False,
+                     decoder='standard', assume_sorted=False, buy_thresholds=None):
+    """Fetch many products concurrently while sharing one rate limiter.
+
+    ``products`` maps product names to ``{'url': ..., 'quality': ...}`` like
+    ``config.TARGET_PRODUCTS``. Returns ``{name: (data, error_details)}``.
+    ``buy_thresholds`` maps product names to ``get_market_data``'s ``buy_threshold``.
+    After the first HTTP 429 the limiter is drained (and paused for the
+    ``Retry-After`` delay) and requests that have not started yet are
+    cancelled with ``kind='cancelled'``.
+    """
+    stop_event = threading.Event()
+
+    def fetch(product_name, product_info):
+        error_details = {}
+        acquired = rate_limiter is None or rate_limiter.acquire(stop_event=stop_event)
+        if not acquired or stop_event.is_set():
+            error_details.update({
+                'kind': 'cancelled',
+                'message': 'Scan cancelled after an earlier HTTP 429',
+                'status_code': None,
+                'retry_after': None,
+            })
+            return None, error_details
+        data = get_market_data(
+            session,
+            product_info['url'],
+            product_info['quality'],
+            timeout=timeout,
+            return_order_detail=return_order_detail,
+            error_details=error_details,
+            decoder=decoder,
+            assume_sorted=assume_sorted,
+            buy_threshold=(buy_thresholds or {}).get(product_name)
+        )
+        if error_details.get('kind') == 'rate_limited':
+            stop_event.set()
+            if rate_limiter is not None:
+                rate_limiter.backoff(parse_retry_after(error_details.get('retry_after'), 0))
+        return data, error_details
+
+    results = {}
+    worker_count = max(1, min(max_workers, len(products)))
+    with ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix="market-scan") as executor:
+        futures = {
+            executor.submit(fetch, product_name, product_info): product_name
+            for product_name, product_info in products.items()
+        }
+        for future in as_completed(futures):
+            product_name = futures[future]
+            try:
+                results[product_name] = future.result()
+            except Exception as e:
+                results[product_name] = (None, {
+                    'kind': 'unexpected_error',
+                    'message': f'{type(e).__name__}: {e}',
+                    'status_code': None,
+                    'retry_after': None,
+                })
+    return results
+
+def get_current_money(driver, landscape_url=None):
+    if landscape_url is None:
+        from config import SIMCOMPANIES_BASE_URL
+        landscape_url = f"{SIMCOMPANIES_BASE_URL}/landscape/"
     try:
-        print(f"Navigating to {landscape_url}...")
+        logger.info(f"Navigating to {landscape_url}...")
         driver.get(landscape_url)
         # Wait for the money element to be present and visible
         money_element = WebDriverWait(driver, 20).until(
@@ -116,13 +474,12 @@ def get_current_money(driver, landscape_url="https://www.simcompanies.com/landsc
         if match:
             cash_value_str = match.group(1).replace(",", "")
             cash_value = float(cash_value_str)
-            print(f"Account cash obtained (Selenium): {cash_value}")
+            logger.info(f"Account cash obtained (Selenium): {cash_value}")
             return cash_value
         else:
-            print("Warning: Could not extract cash value from element.")
-            print(f"Element text: {money_text}")
+            logger.warning("Could not extract cash value from element.")
+            logger.info(f"Element text: {money_text}")
             return None
     except Exception as e:
-        print(f"Unexpected error occurred while obtaining account cash via Selenium:")
-        traceback.print_exc()
+        logger.exception("Unexpected error occurred while obtaining account cash via Selenium")
         return None
@@ -0,0 +1,217 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Opportunity:
+    """A buy signal from one scan: the product, its lowest order and the expected saving used as priority."""
+
+    __slots__ = ('product_name', 'order_id', 'priority', 'payload', 'created_at', 'expires_at')
+
+    def __init__(self, product_name, order_id, priority, payload=None, created_at=None, expires_at=None):
+        self.product_name = product_name
+        self.order_id = order_id
+        self.priority = priority
+        self.payload = payload
+        self.created_at = created_at
+        self.expires_at = expires_at
+
+    def __repr__(self):
+        return f"Opportunity({self.product_name!r}, order_id={self.order_id}, priority={self.priority:.2f})"
+
+
+class OpportunityQueue:
+    """Bounded priority queue between the market scanner and the purchase executor.
+
+    ``get`` returns the queued opportunity with the highest priority. Entries
+    older than ``ttl`` seconds are dropped instead of returned, since the
+    order they describe has probably been taken or repriced. Opportunities
+    are de-duplicated by order ID: a newer snapshot of a queued order
+    replaces it, and one already being executed is ignored. A newer
+    snapshot of the same product also replaces queued entries for its
+    other orders. When the queue is full the lowest-priority entry is
+    evicted, or the new one rejected if it ranks lowest.
+    """
+
+    def __init__(self, maxsize=16, ttl=60, clock=time.monotonic):
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._counter = itertools.count()
+        self._heap = []
+        self._queued = {}  # order_id -> heap entry; entry[2] is None once removed
+        self._in_flight = set()
+        self._closed = False
+        self.stats = {'queued': 0, 'replaced': 0, 'duplicate': 0, 'evicted': 0, 'rejected': 0, 'expired': 0}
+
+    def __len__(self):
+        with self._cond:
+            return len(self._queued)
+
+    def _remove(self, order_id):
+        entry = self._queued.pop(order_id)
+        entry[2] = None
+
+    def _expire(self, now):
+        for order_id, entry in list(self._queued.items()):
+            if entry[2].expires_at <= now:
+                self._remove(order_id)
+                self.stats['expired'] += 1
+
+    def put(self, opportunity):
+        """Queue ``opportunity``. Returns False if it was a duplicate of an in-flight order or ranked too low."""
+        now = self._clock()
+        if opportunity.created_at is None:
+            opportunity.created_at = now
+        if opportunity.expires_at is None:
+            opportunity.expires_at = opportunity.created_at + self.ttl
+        with self._cond:
+            if opportunity.order_id in self._in_flight:
+                self.stats['duplicate'] += 1
+                return False
+            for order_id, entry in list(self._queued.items()):
+                if order_id == opportunity.order_id or entry[2].product_name == opportunity.product_name:
+                    self._remove(order_id)
+                    self.stats['replaced'] += 1
+            self._expire(now)
+            if len(self._queued) >= self.maxsize:
+                lowest_id = min(self._queued, key=lambda order_id: -self._queued[order_id][0])
+                if -self._queued[lowest_id][0] >= opportunity.priority:
+                    self.stats['rejected'] += 1
+                    return False
+                self._remove(lowest_id)
+                self.stats['evicted'] += 1
+            entry = [-opportunity.priority, next(self._counter), opportunity]
+            self._queued[opportunity.order_id] = entry
+            heapq.heappush(self._heap, entry)
+            self.stats['queued'] += 1
+            self._cond.notify()
+        return True
+
+    def get(self, timeout=None):
+        """Highest-priority live opportunity, marked in flight until ``done``. None on timeout or after ``close``."""
+        deadline = None if timeout is None else self._clock() + timeout
+        with self._cond:
+            while True:
+                now = self._clock()
+                while self._heap:
+                    _, _, opportunity = heapq.heappop(self._heap)
+                    if opportunity is None:
+                        continue  # Replaced, evicted or expired earlier
+                    del self._queued[opportunity.order_id]
+                    if opportunity.expires_at <= now:
+                        self.stats['expired'] += 1
+                        continue
+                    self._in_flight.add(opportunity.order_id)
+                    return opportunity
+                if self._closed:
+                    return None
+                remaining = None if deadline is None else deadline - now
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def done(self, order_id):
+        """Mark an opportunity returned by ``get`` as finished."""
+        with self._cond:
+            self._in_flight.discard(order_id)
+            self._cond.notify_all()
+
+    def idle(self):
+        """True when nothing is queued or in flight."""
+        with self._cond:
+            return not self._queued and not self._in_flight
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def close(self):
+        """Discard queued entries and make every ``get`` return None."""
+        with self._cond:
+            self._closed = True
+            for order_id in list(self._queued):
+                self._remove(order_id)
+            self._cond.notify_all()
+
+    def summary(self):
+        with self._cond:
+            return ", ".join(f"{key} {value}" for key, value in self.stats.items())
+
+
+class PipelineWorker:
+    """Daemon thread that executes opportunities from an :class:`OpportunityQueue`.
+
+    ``handler(opportunity)`` runs for each one; exceptions are logged and
+    the worker continues. With ``batch_size`` above 1, opportunities that
+    are queued together are taken at once (up to ``batch_size``) and passed
+    to ``batch_handler(list)``. ``on_idle()`` runs whenever the queue has
+    been drained, e.g. to release resources held between purchases.
+    """
+
+    def __init__(self, queue, handler, on_idle=None, poll_interval=1.0, name="purchase-executor",
+                 batch_handler=None, batch_size=1):
+        self.queue = queue
+        self.handler = handler
+        self.batch_handler = batch_handler
+        self.batch_size = max(1, batch_size) if batch_handler is not None else 1
+        self.on_idle = on_idle
+        self.poll_interval = poll_interval
+        self.name = name
+        self.handled = 0
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        busy = False
+        while True:
+            opportunity = self.queue.get(timeout=self.poll_interval)
+            if opportunity is None:
+                if busy and self.on_idle is not None:
+                    self._call(self.on_idle)
+                busy = False
+                if self.queue.closed:
+                    return
+                continue
+            busy = True
+            batch = [opportunity]
+            while len(batch) < self.batch_size:
+                extra = self.queue.get(timeout=0)
+                if extra is None:
+                    break
+                batch.append(extra)
+            try:
+                if len(batch) > 1:
+                    self._call(self.batch_handler, batch)
+                else:
+                    self._call(self.handler, opportunity)
+                self.handled += len(batch)
+            finally:
+                for item in batch:
+                    self.queue.done(item.order_id)
+            if self.on_idle is not None and self.queue.idle():
+                self._call(self.on_idle)
+                busy = False
+
+    def _call(self, function, *args):
+        try:
+            function(*args)
+        except Exception as e:
+            logger.exception(f"{self.name}: {type(e).__name__} - {e}")
+
+    def stop(self, timeout=None):
+        """Close the queue and wait for the purchase in progress, if any."""
+        self.queue.close()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
@@ -0,0 +1,254 @@
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+# Column name -> dtype. Each column is its own memory-mapped file per tier.
+COLUMNS = (
+    ('timestamp', np.float64),
+    ('lowest', np.float64),
+    ('second_lowest', np.float64),  # NaN when the book had a single price level
+    ('depth_at_lowest', np.int64),
+    ('order_count', np.int64),  # -1 when only part of the book was read (streaming early stop)
+)
+COLUMN_NAMES = tuple(name for name, _ in COLUMNS)
+
+# Meta layout (float64 memmap): rows written so far, then the pending downsample row.
+_META_WRITTEN = 0
+_META_BUCKET = 1
+_META_PENDING = slice(2, 2 + len(COLUMNS))
+_META_SIZE = 2 + len(COLUMNS)
+# Column files start this many rows long and double as rows arrive, up to the tier capacity.
+_INITIAL_ROWS = 1024
+
+
+class _RingTier:
+    """Fixed-capacity ring of columnar memmaps for one product and resolution.
+
+    Column files are grown as rows arrive instead of being allocated at full
+    capacity up front, so a product polled rarely only takes a few KiB.
+    """
+
+    def __init__(self, directory, name, capacity, bucket_seconds):
+        self.directory = directory
+        self.name = name
+        self.capacity = int(capacity)
+        self.bucket_seconds = bucket_seconds
+        os.makedirs(directory, exist_ok=True)
+        self.meta, created = _open_memmap(os.path.join(directory, f"{name}.meta.bin"), np.float64, _META_SIZE)
+        if created:
+            self.meta[_META_BUCKET] = np.nan
+        existing = [os.path.getsize(self._path(column)) // np.dtype(dtype).itemsize
+                    for column, dtype in COLUMNS if os.path.exists(self._path(column))]
+        self.allocated = min(self.capacity, max([self._allocation(len(self))] + existing))
+        self.columns = {
+            column: _open_memmap(self._path(column), dtype, self.allocated, grow=True)[0]
+            for column, dtype in COLUMNS
+        }
+
+    def _path(self, column):
+        return os.path.join(self.directory, f"{self.name}.{column}.bin")
+
+    def _allocation(self, rows):
+        size = _INITIAL_ROWS
+        while size < rows:
+            size *= 2
+        return min(size, self.capacity)
+
+    def _grow(self, rows):
+        self.allocated = self._allocation(rows)
+        for column, dtype in COLUMNS:
+            self.columns[column].flush()
+            self.columns[column] = None  # Unmap before the file is extended, which Windows requires
+            self.columns[column] = _open_memmap(self._path(column), dtype, self.allocated, grow=True)[0]
+
+    @property
+    def written(self):
+        return int(self.meta[_META_WRITTEN])
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    def append(self, row):
+        index = self.written % self.capacity
+        if index >= self.allocated:
+            self._grow(index + 1)
+        for (column, _), value in zip(COLUMNS, row):
+            self.columns[column][index] = value
+        self.meta[_META_WRITTEN] = self.written + 1
+
+    def segments(self):
+        """(start, stop) index ranges of the ring in chronological order."""
+        size = len(self)
+        if size < self.capacity:
+            return [(0, size)]
+        head = self.written % self.capacity
+        return [(head, self.capacity), (0, head)] if head else [(0, self.capacity)]
+
+    def read(self, start=None, end=None):
+        """Copy rows with ``start <= timestamp < end`` into ordinary arrays.
+
+        Timestamps are sorted inside each ring segment, so ``searchsorted``
+        locates the range by touching only a few pages of the memmap.
+        """
+        pieces = {column: [] for column in COLUMN_NAMES}
+        timestamps = self.columns['timestamp']
+        for seg_start, seg_stop in self.segments():
+            segment = timestamps[seg_start:seg_stop]
+            lo = 0 if start is None else int(np.searchsorted(segment, start, side='left'))
+            hi = len(segment) if end is None else int(np.searchsorted(segment, end, side='left'))
+            if hi <= lo:
+                continue
+            for column in COLUMN_NAMES:
+                pieces[column].append(np.array(self.columns[column][seg_start + lo:seg_start + hi]))
+        return {
+            column: np.concatenate(pieces[column]) if pieces[column] else np.empty(0, dtype=dtype)
+            for column, dtype in COLUMNS
+        }
+
+    def oldest_timestamp(self):
+        if not len(self):
+            return None
+        return float(self.columns['timestamp'][self.segments()[0][0]])
+
+    def flush(self):
+        for column in self.columns.values():
+            column.flush()
+        self.meta.flush()
+
+
+def _open_memmap(path, dtype, length, grow=False):
+    """Open ``path`` as a 1-D memmap, recreating it if its size does not match.
+
+    With ``grow`` a shorter file is kept and zero-extended to ``length``.
+    """
+    size = os.path.getsize(path) if os.path.exists(path) else None
+    expected = np.dtype(dtype).itemsize * length
+    reuse = size is not None and (size <= expected if grow else size == expected)
+    return np.memmap(path, dtype=dtype, mode='r+' if reuse else 'w+', shape=(length,)), not reuse
+
+
+class PriceHistoryStore:
+    """Per-product order-book summaries in memory-mapped columnar ring files.
+
+    Rows are written to a raw tier and downsampled into minute and hour tiers.
+    Downsampling keeps, for each bucket, the snapshot with the lowest price
+    (earliest on ties), so spreads and depth stay consistent within a row.
+    Every tier has a fixed capacity, so disk usage is bounded: the oldest
+    rows of a tier are overwritten once it is full. Files grow to that
+    capacity as rows are written.
+    """
+
+    def __init__(self, directory=os.path.join('record', 'price_history'),
+                 raw_rows=172800, minute_rows=129600, hour_rows=87600, clock=time.time):
+        self.directory = directory
+        self.tier_specs = (('raw', raw_rows, None), ('1m', minute_rows, 60), ('1h', hour_rows, 3600))
+        self._clock = clock
+        self._products = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _safe_name(product_name):
+        return re.sub(r'[^A-Za-z0-9_.-]', '_', product_name)
+
+    def _tiers(self, product_name):
+        with self._lock:
+            entry = self._products.get(product_name)
+            if entry is None:
+                product_dir = os.path.join(self.directory, self._safe_name(product_name))
+                tiers = [_RingTier(product_dir, name, capacity, bucket)
+                         for name, capacity, bucket in self.tier_specs]
+                entry = (threading.Lock(), tiers)
+                self._products[product_name] = entry
+            return entry
+
+    def append(self, product_name, lowest, second_lowest=None, depth_at_lowest=0, order_count=0, timestamp=None):
+        """Record one book summary and roll it into the downsampled tiers."""
+        timestamp = self._clock() if timestamp is None else timestamp
+        row = (
+            float(timestamp),
+            float(lowest),
+            np.nan if second_lowest is None else float(second_lowest),
+            int(depth_at_lowest),
+            int(order_count),
+        )
+        lock, tiers = self._tiers(product_name)
+        with lock:
+            tiers[0].append(row)
+            for tier in tiers[1:]:
+                row = self._downsample(tier, row)
+                if row is None:
+                    break
+
+    @staticmethod
+    def _downsample(tier, row):
+        """Fold ``row`` into the tier's pending bucket; return the closed bucket row, if any."""
+        bucket = row[0] // tier.bucket_seconds * tier.bucket_seconds
+        meta = tier.meta
+        pending_bucket = meta[_META_BUCKET]
+        closed = None
+        if np.isnan(pending_bucket) or bucket != pending_bucket:
+            if not np.isnan(pending_bucket):
+                pending = meta[_META_PENDING]
+                closed = (pending_bucket, pending[1], pending[2], int(pending[3]), int(pending[4]))
+                tier.append(closed)
+            meta[_META_BUCKET] = bucket
+            meta[_META_PENDING] = row
+        elif row[1] < meta[_META_PENDING][1]:
+            meta[_META_PENDING] = row
+        return closed
+
+    def query(self, product_name, start=None, end=None, tier=None):
+        """Return ``{column: ndarray}`` for ``start <= timestamp < end``.
+
+        ``tier`` is ``'raw'``, ``'1m'`` or ``'1h'``; by default the finest tier
+        that still covers ``start`` is used.
+        """
+        lock, tiers = self._tiers(product_name)
+        with lock:
+            if tier is not None:
+                chosen = next(t for t in tiers if t.name == tier)
+            else:
+                chosen = tiers[-1]
+                for candidate in tiers:
+                    oldest = candidate.oldest_timestamp()
+                    if oldest is not None and (start is None or oldest <= start):
+                        chosen = candidate
+                        break
+            return chosen.read(start, end)
+
+    def columns(self, product_name, tier='raw'):
+        """Direct memmap views of a tier (ring order, see ``_RingTier.segments``); replaced when the tier grows."""
+        _, tiers = self._tiers(product_name)
+        return next(t for t in tiers if t.name == tier).columns
+
+    def flush(self):
+        with self._lock:
+            entries = list(self._products.values())
+        for lock, tiers in entries:
+            with lock:
+                for tier in tiers:
+                    tier.flush()
+
+
+def summarize_market_data(market_data):
+    """Extract ``(lowest, second_lowest, depth_at_lowest, order_count)`` from get_market_data output.
+
+    ``order_count`` is -1 when the streaming decoder stopped before the end of the book.
+    """
+    if not market_data:
+        return None
+    if 'lowest_order' in market_data:
+        lowest = market_data['lowest_order']['price']
+    elif 'lowest_price' in market_data:
+        lowest = market_data['lowest_price']
+    else:
+        return None
+    book = market_data.get('order_book')
+    depth = book.depth_below(lowest, inclusive=True) if book is not None else 0
+    order_count = len(book) if book is not None else 0
+    if market_data.get('partial_book'):
+        order_count = -1
+    return lowest, market_data.get('second_lowest_price'), depth, order_count
@@ -3,8 +3,6 @@ import time
 import datetime
 import re
 import traceback
-import logging
-from logging.handlers import RotatingFileHandler
 import random
 import json
 from dateutil import parser
@@ -23,30 +21,16 @@ from selenium.common.exceptions import (
 )
 
 from driver_utils import initialize_driver
+from log_utils import setup_logger  # Re-exported for main.py
 from email_utils import send_email_notify
-from config import POWER_PLANT_PATHS
-
-# --- Logging Setup ---
-def setup_logger(name, log_filename):
-    log_path = os.path.join('record', log_filename)
-    os.makedirs(os.path.dirname(log_path), exist_ok=True)
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-    for handler in logger.handlers[:]:
-        logger.removeHandler(handler)
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(name)s - %(message)s')
-    file_handler = RotatingFileHandler(
-        log_path, maxBytes=5 * 1024 * 1024, backupCount=5, encoding='utf-8'
-    )
-    file_handler.setFormatter(formatter)
-    stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-    logger.addHandler(stream_handler)
-    return logger
+from config import (
+    POWER_PLANT_PATHS, SIMCOMPANIES_BASE_URL,
+    LOGIN_STATE_CACHE_ENABLED, LOGIN_STATE_TTL_SECONDS, LOGIN_STATE_DIR
+)
+from login_state import LoginState, state_path_for_profile
 
 # --- Constants ---
-BASE_URL = "https://www.simcompanies.com"
+BASE_URL = SIMCOMPANIES_BASE_URL
 DEFAULT_RETRY_DELAY = 60  # seconds
 LONG_RETRY_DELAY = 100 # seconds 
 CONSTRUCTION_CHECK_BUFFER = 60 # seconds
@@ -66,6 +50,10 @@ class BaseMonitor:
         self.driver = None
         self.logger = logger
         self.user_data_dir = user_data_dir
+        self.login_state = None
+        if LOGIN_STATE_CACHE_ENABLED:  # Shared with other processes using the same profile
+            self.login_state = LoginState(state_path_for_profile(LOGIN_STATE_DIR, user_data_dir),
+                                          ttl=LOGIN_STATE_TTL_SECONDS)
 
     def _is_logged_in(self):
         """Require a positive authenticated-page indicator."""
@@ -77,6 +65,8 @@ class BaseMonitor:
                 By.XPATH,
                 "//*[@id='js-animation-money'] | //a[contains(@href,'/landscape')] | //a[contains(@href,'/company')]"
             )
+            if authenticated_elements and self.login_state is not None:
+                self.login_state.mark_verified()
             return bool(authenticated_elements)
         except Exception as e:
             self.logger.warning(f"[{self.name}] Error checking login status: {e}")
@@ -89,6 +79,9 @@ class BaseMonitor:
 
             if self.driver:
                 self.logger.info(f"[{self.name}] WebDriver initialized for profile: {self.user_data_dir or 'default'}.")
+                if self.login_state is not None and self.login_state.is_fresh():
+                    self.logger.info(f"[{self.name}] Login verified within the last {LOGIN_STATE_TTL_SECONDS:.0f}s, skipping the login check navigation.")
+                    return True
                 self.logger.info(f"[{self.name}] Navigating to {self.base_url} for initial login check.")
                 try:
                     self.driver.get(self.base_url)
@@ -100,6 +93,8 @@ class BaseMonitor:
                             "Press Enter in this console to continue..."
                         )
                         self.logger.info(f"[{self.name}] User confirmed login check. Proceeding.")
+                        if self.login_state is not None:
+                            self.login_state.mark_verified()
                     else:
                         self.logger.info(f"[{self.name}] Detected already logged in, proceeding automatically.")
                     return True
@@ -149,6 +144,8 @@ class BaseMonitor:
             )
             current_url = self.driver.current_url
             self.logger.warning(f"[{self.name}] Login required detected (URL: {current_url}).")
+            if self.login_state is not None:
+                self.login_state.mark_stale(f"login form at {current_url}")
             send_email_notify(
                 subject=f"SimCompany {self.name} Monitoring Requires Login",
                 body=f"The script detected a login requirement when trying to access {check_url} (URL: {current_url}).\n"
@@ -1123,9 +1120,9 @@ class OilRigMonitor(BaseMonitor):
         try:
             if self.driver:
                 self.driver.save_screenshot(path)
-                print(f"[{self.name}] Screenshot saved to: {path}")
+                self.logger.info(f"[{self.name}] Screenshot saved to: {path}")
         except Exception as e:
-            print(f"[{self.name}] Failed to save screenshot: {e}")
+            self.logger.error(f"[{self.name}] Failed to save screenshot: {e}")
 
 # --- Electronics Factory (Batteries) Producer ---
 class BatteryProducer(BaseMonitor):
@@ -0,0 +1,97 @@
+import time
+
+import requests
+
+
+class PurchaseResult:
+    """Outcome of one purchase request.
+
+    ``status`` is ``'confirmed'``, ``'rejected'`` or ``'unknown'`` (the order
+    may have been executed, e.g. after a read timeout). ``fallback`` is True
+    only when the request certainly did not execute and the Selenium flow may
+    be tried instead (endpoint missing, session not accepted, connection never
+    established).
+    """
+
+    __slots__ = ('status', 'filled', 'cost', 'detail', 'status_code', 'seconds', 'fallback')
+
+    def __init__(self, status, filled=0, cost=0.0, detail="", status_code=None, seconds=0.0, fallback=False):
+        self.status = status
+        self.filled = filled
+        self.cost = cost
+        self.detail = detail
+        self.status_code = status_code
+        self.seconds = seconds
+        self.fallback = fallback
+
+    def __repr__(self):
+        return (f"PurchaseResult({self.status!r}, filled={self.filled}, cost={self.cost:.3f}, "
+                f"detail={self.detail!r}, status_code={self.status_code})")
+
+
+class HttpPurchaseExecutor:
+    """Submits market purchases to the JSON endpoint behind the market page's buy form.
+
+    The request body is ``{"resource", "quality", "quantity", "maxPrice"}``,
+    sent with the session's cookies, its ``csrftoken`` cookie as
+    ``X-CSRFToken`` and the market page as ``Referer``. A 2xx answer must
+    report ``filled`` (and ``cost``); anything else is mapped to a
+    :class:`PurchaseResult` without raising.
+    """
+
+    FALLBACK_STATUSES = (401, 403, 404, 405)
+
+    def __init__(self, session, api_url, market_page_template, timeout=30):
+        self.session = session
+        self.api_url = api_url
+        self.market_page_template = market_page_template
+        self.timeout = timeout
+
+    def buy(self, resource_id, quality, quantity, max_price):
+        headers = {
+            'Content-Type': 'application/json',
+            'Accept': 'application/json',
+            'Referer': self.market_page_template.format(resource_id=resource_id),
+        }
+        csrf_token = self.session.cookies.get('csrftoken')
+        if csrf_token:
+            headers['X-CSRFToken'] = csrf_token
+        payload = {'resource': resource_id, 'quality': quality, 'quantity': quantity, 'maxPrice': max_price}
+
+        started_at = time.perf_counter()
+        try:
+            response = self.session.post(self.api_url, json=payload, headers=headers, timeout=self.timeout,
+                                         allow_redirects=False)
+        except requests.exceptions.ConnectTimeout as e:
+            return PurchaseResult('rejected', detail=f"ConnectTimeout: {e}",
+                                  seconds=time.perf_counter() - started_at, fallback=True)
+        except requests.exceptions.RequestException as e:
+            # The order may have reached the server; never retry it through another backend.
+            return PurchaseResult('unknown', detail=f"{type(e).__name__}: {e}", seconds=time.perf_counter() - started_at)
+        seconds = time.perf_counter() - started_at
+
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        if not isinstance(body, dict):
+            body = {}
+        detail = str(body.get('detail') or body.get('message') or response.reason or '')
+
+        if 200 <= response.status_code < 300:
+            filled = body.get('filled')
+            if not isinstance(filled, (int, float)):
+                return PurchaseResult('unknown', detail=f"No fill information in response: {response.text[:200]}",
+                                      status_code=response.status_code, seconds=seconds)
+            cost = float(body.get('cost') or filled * max_price)
+            status = 'confirmed' if filled > 0 else 'rejected'
+            return PurchaseResult(status, int(filled), cost, detail or f"filled {int(filled)} for ${cost:,.3f}",
+                                  response.status_code, seconds)
+        if response.status_code in self.FALLBACK_STATUSES or 300 <= response.status_code < 400:
+            return PurchaseResult('rejected', detail=detail or f"HTTP {response.status_code}",
+                                  status_code=response.status_code, seconds=seconds, fallback=True)
+        if response.status_code >= 500:
+            return PurchaseResult('unknown', detail=detail or f"HTTP {response.status_code}",
+                                  status_code=response.status_code, seconds=seconds)
+        return PurchaseResult('rejected', detail=detail or f"HTTP {response.status_code}",
+                              status_code=response.status_code, seconds=seconds)
@@ -0,0 +1,398 @@
+import contextlib
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from http_cache import CACHE_STATUS_HEADER
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Thread-safe token bucket that caps the average request rate.
+
+    Tokens refill continuously at ``rate_per_second`` up to ``capacity``.
+    A full bucket lets a scan burst through ``capacity`` requests at once,
+    while the long-run rate never exceeds ``rate_per_second``.
+    """
+
+    def __init__(self, rate_per_second, capacity, clock=time.monotonic, sleep=time.sleep):
+        if rate_per_second <= 0:
+            raise ValueError("rate_per_second must be positive")
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.rate_per_second = float(rate_per_second)
+        self.capacity = float(capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(capacity)
+        self._updated_at = clock()
+        self._blocked_until = self._updated_at
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        elapsed = max(0.0, now - self._updated_at)
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate_per_second)
+        self._updated_at = now
+
+    @property
+    def available(self):
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def try_acquire(self, tokens=1):
+        """Take tokens without waiting. Returns True on success."""
+        with self._lock:
+            self._refill()
+            if self._updated_at >= self._blocked_until and self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1, timeout=None, stop_event=None):
+        """Block until tokens are available.
+
+        Returns False if ``timeout`` elapses or ``stop_event`` is set first.
+        """
+        if tokens > self.capacity:
+            raise ValueError("Cannot acquire more tokens than the bucket capacity")
+        deadline = None if timeout is None else self._clock() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                blocked = self._blocked_until - self._updated_at
+                if blocked <= 0 and self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = max(blocked, (tokens - self._tokens) / self.rate_per_second)
+            if stop_event is not None and stop_event.is_set():
+                return False
+            if deadline is not None:
+                remaining = deadline - self._clock()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            # Wake up periodically so a stop request is noticed promptly.
+            self._sleep(min(wait, 1.0))
+
+    def drain(self):
+        """Empty the bucket, e.g. after the server answered HTTP 429."""
+        with self._lock:
+            self._refill()
+            self._tokens = 0.0
+
+    def backoff(self, seconds):
+        """Drain the bucket and hand out nothing for ``seconds`` (a ``Retry-After`` delay)."""
+        with self._lock:
+            self._refill()
+            self._tokens = 0.0
+            self._blocked_until = max(self._blocked_until, self._updated_at + seconds)
+
+    def blocked_for(self):
+        """Seconds left in the current ``backoff`` pause."""
+        with self._lock:
+            return max(0.0, self._blocked_until - self._clock())
+
+    def set_rate(self, rate_per_second):
+        """Change the refill rate; tokens earned so far are kept."""
+        with self._lock:
+            self._refill()
+            self.rate_per_second = float(rate_per_second)
+
+
+class SharedTokenBucket:
+    """Token bucket shared by every process on the host through a SQLite file.
+
+    Drop-in replacement for :class:`TokenBucket`: all AutoBuyer and
+    TradeMonitor processes pointing at the same ``path`` draw from one budget,
+    so their combined rate stays under ``rate_per_second``. A ``backoff``
+    after an HTTP 429 pauses every process until the ``Retry-After`` delay
+    has passed, instead of each one running into its own 429. ``set_rate``
+    (used by AIMD pacing) can lower this process's refill rate but never
+    raise it above ``rate_per_second``.
+
+    Each process registers as a client and refreshes its heartbeat while it
+    requests tokens. Clients silent for ``idle_after`` seconds yield their
+    share. An active client may use its fair share of the burst
+    (``capacity / active clients``, measured as usage decaying over one
+    bucket refill time) freely; beyond that it borrows, and must leave one
+    token per other active client in the bucket so nobody is starved.
+    """
+
+    def __init__(self, path, rate_per_second, capacity, client_name=None, idle_after=60.0,
+                 clock=time.time, sleep=time.sleep, timeout=10.0):
+        if rate_per_second <= 0:
+            raise ValueError("rate_per_second must be positive")
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.path = path
+        self.rate_per_second = float(rate_per_second)
+        self.max_rate_per_second = self.rate_per_second  # Host-wide cap; set_rate never goes above it
+        self.capacity = float(capacity)
+        self.client_name = client_name or f"pid-{os.getpid()}"
+        self.idle_after = idle_after
+        self._clock = clock  # Wall clock: monotonic clocks are not comparable across processes
+        self._sleep = sleep
+        self._timeout = timeout
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS bucket ("
+                         "id INTEGER PRIMARY KEY CHECK (id = 1), tokens REAL, updated_at REAL, blocked_until REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS clients ("
+                         "name TEXT PRIMARY KEY, last_seen REAL, usage REAL, usage_at REAL)")
+            now = self._clock()
+            conn.execute("INSERT OR IGNORE INTO bucket VALUES (1, ?, ?, 0)", (self.capacity, now))
+            conn.execute("DELETE FROM clients WHERE last_seen < ?", (now - 24 * 3600,))
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit mode so transactions are opened explicitly with BEGIN IMMEDIATE.
+            conn = sqlite3.connect(self.path, timeout=self._timeout, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")  # Takes the write lock up front
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _refilled(self, conn, now):
+        tokens, updated_at, blocked_until = conn.execute(
+            "SELECT tokens, updated_at, blocked_until FROM bucket WHERE id = 1").fetchone()
+        tokens = min(self.capacity, tokens + max(0.0, now - updated_at) * self.rate_per_second)
+        return tokens, blocked_until
+
+    def _take(self, tokens):
+        """One locked attempt. Returns ``(granted, seconds to wait before retrying)``."""
+        with self._transaction() as conn:
+            now = self._clock()
+            available, blocked_until = self._refilled(conn, now)
+            row = conn.execute("SELECT usage, usage_at FROM clients WHERE name = ?", (self.client_name,)).fetchone()
+            usage = 0.0
+            if row is not None:
+                usage = row[0] * math.exp(-max(0.0, now - row[1]) * self.rate_per_second / self.capacity)
+            others = conn.execute("SELECT COUNT(*) FROM clients WHERE name != ? AND last_seen >= ?",
+                                  (self.client_name, now - self.idle_after)).fetchone()[0]
+            reserve = others if usage >= self.capacity / (others + 1) else 0
+
+            granted = blocked_until <= now and available - tokens >= reserve
+            if granted:
+                available -= tokens
+                usage += tokens
+                wait = 0.0
+            elif blocked_until > now:
+                wait = blocked_until - now
+            else:
+                wait = (tokens + reserve - available) / self.rate_per_second
+            conn.execute("UPDATE bucket SET tokens = ?, updated_at = ? WHERE id = 1", (available, now))
+            conn.execute("INSERT OR REPLACE INTO clients VALUES (?, ?, ?, ?)", (self.client_name, now, usage, now))
+            return granted, wait
+
+    @property
+    def available(self):
+        with self._transaction() as conn:
+            return self._refilled(conn, self._clock())[0]
+
+    def blocked_for(self):
+        """Seconds left in a ``backoff`` pause set by any process."""
+        with self._transaction() as conn:
+            blocked_until = conn.execute("SELECT blocked_until FROM bucket WHERE id = 1").fetchone()[0]
+        return max(0.0, blocked_until - self._clock())
+
+    def active_clients(self):
+        """Names of the clients that requested tokens within ``idle_after`` seconds."""
+        with self._transaction() as conn:
+            rows = conn.execute("SELECT name FROM clients WHERE last_seen >= ? ORDER BY name",
+                                (self._clock() - self.idle_after,)).fetchall()
+        return [name for name, in rows]
+
+    def try_acquire(self, tokens=1):
+        """Take tokens without waiting. Returns True on success."""
+        return self._take(tokens)[0]
+
+    def acquire(self, tokens=1, timeout=None, stop_event=None):
+        """Block until tokens are available.
+
+        Returns False if ``timeout`` elapses or ``stop_event`` is set first.
+        """
+        if tokens > self.capacity:
+            raise ValueError("Cannot acquire more tokens than the bucket capacity")
+        deadline = None if timeout is None else self._clock() + timeout
+        while True:
+            granted, wait = self._take(tokens)
+            if granted:
+                return True
+            if stop_event is not None and stop_event.is_set():
+                return False
+            if deadline is not None:
+                remaining = deadline - self._clock()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            # Other processes change the bucket too, so re-check at least once a second.
+            self._sleep(min(wait, 1.0))
+
+    def drain(self):
+        """Empty the shared bucket, e.g. after the server answered HTTP 429."""
+        self.backoff(0)
+
+    def backoff(self, seconds):
+        """Drain the shared bucket and pause every process for ``seconds``."""
+        with self._transaction() as conn:
+            now = self._clock()
+            conn.execute("UPDATE bucket SET tokens = 0, updated_at = ?, blocked_until = MAX(blocked_until, ?) "
+                         "WHERE id = 1", (now, now + seconds))
+
+    def set_rate(self, rate_per_second):
+        """Change the refill rate this process applies to the shared bucket, up to the host-wide rate."""
+        self.rate_per_second = min(self.max_rate_per_second, float(rate_per_second))
+
+    def close(self):
+        """Unregister this client so its share is released immediately."""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM clients WHERE name = ?", (self.client_name,))
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class AimdController:
+    """Additive-increase/multiplicative-decrease pacing that learns the server's rate limit.
+
+    Attach it to a session as a response hook. Every successful server
+    response adds ``increase`` requests per second to :attr:`rate`; an HTTP
+    429 or a response slower than ``slow_seconds`` multiplies it by
+    ``decrease``, at most once per ``cooldown`` seconds so one burst of 429s
+    counts once. The rate at the last 429 is kept as ``limit_rate``; above
+    90% of it the increase is quartered, so the known ceiling is probed
+    slowly. Responses answered by the local cache are ignored.
+
+    ``limiter`` (a token bucket) follows the rate through ``set_rate``.
+    The learned state is loaded from and saved to ``state_path`` (JSON).
+    """
+
+    def __init__(self, initial_rate, min_rate, max_rate, increase=0.002, decrease=0.5, slow_seconds=5.0,
+                 cooldown=10.0, state_path=None, limiter=None, clock=time.monotonic):
+        if not 0 < min_rate <= max_rate:
+            raise ValueError("Expected 0 < min_rate <= max_rate")
+        if not 0 < decrease < 1:
+            raise ValueError("decrease must be between 0 and 1")
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.increase = float(increase)
+        self.decrease = float(decrease)
+        self.slow_seconds = slow_seconds
+        self.cooldown = cooldown
+        self.state_path = state_path
+        self.limiter = limiter
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._last_decrease = None
+        self.limit_rate = None
+        self.successes = 0
+        self.rate_limits = 0
+        self.slow_responses = 0
+        self.rate = self._clamp(initial_rate)
+        if state_path and os.path.exists(state_path):
+            try:
+                with open(state_path, encoding='utf-8') as f:
+                    state = json.load(f)
+                self.rate = self._clamp(state['rate'])
+                self.limit_rate = state.get('limit_rate')
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logger.warning(f"Ignoring unreadable pacing state {state_path}: {e}")
+        self._apply()
+
+    def _clamp(self, rate):
+        return min(self.max_rate, max(self.min_rate, float(rate)))
+
+    def _apply(self):
+        if self.limiter is not None:
+            self.limiter.set_rate(self.rate)
+
+    def __call__(self, response, *args, **kwargs):
+        request = response.request
+        if response.headers.get(CACHE_STATUS_HEADER) in ('hit', 'stale', 'backoff'):
+            return response  # Served locally; says nothing about the server's limit
+        if response.status_code == 429:
+            self.on_rate_limited()
+        elif request is not None and request.method == 'HEAD':
+            return response  # Warm-up pings count against the limit but their latency is not a fetch's
+        elif response.status_code < 500:
+            self.on_response(response.elapsed.total_seconds())
+        return response
+
+    def on_response(self, seconds):
+        """Record a completed request: additive increase, or a decrease if it was slow."""
+        if self.slow_seconds is not None and seconds > self.slow_seconds:
+            with self._lock:
+                self.slow_responses += 1
+            self._decrease()
+            return
+        with self._lock:
+            self.successes += 1
+            step = self.increase
+            if self.limit_rate is not None and self.rate >= 0.9 * self.limit_rate:
+                step /= 4
+            self.rate = self._clamp(self.rate + step)
+            self._apply()
+
+    def on_rate_limited(self):
+        """Record an HTTP 429: remember the rate as the limit and cut it."""
+        with self._lock:
+            self.rate_limits += 1
+            if not self._cooling_down():
+                self.limit_rate = self.rate
+        self._decrease()
+
+    def _cooling_down(self):
+        return self._last_decrease is not None and self._clock() - self._last_decrease < self.cooldown
+
+    def _decrease(self):
+        with self._lock:
+            if self._cooling_down():
+                return
+            self._last_decrease = self._clock()
+            self.rate = self._clamp(self.rate * self.decrease)
+            self._apply()
+        self.save()
+
+    def summary(self):
+        with self._lock:
+            limit = f"{self.limit_rate:.3f}/s" if self.limit_rate else "unknown"
+            return (f"rate {self.rate:.3f}/s (last 429 at {limit}); {self.successes} ok, "
+                    f"{self.rate_limits} rate-limited, {self.slow_responses} slow")
+
+    def save(self):
+        """Write the learned rate to ``state_path`` atomically."""
+        if not self.state_path:
+            return
+        with self._lock:
+            state = {'rate': self.rate, 'limit_rate': self.limit_rate, 'saved_at': time.time()}
+        try:
+            directory = os.path.dirname(self.state_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = f"{self.state_path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(temp_path, self.state_path)
+        except OSError as e:
+            logger.warning(f"Could not save pacing state to {self.state_path}: {e}")
@@ -0,0 +1,130 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+class ProductStats:
+    __slots__ = ('last_price', 'volatility', 'hit_rate', 'gap', 'observations', 'next_poll')
+
+    def __init__(self, next_poll):
+        self.last_price = None
+        self.volatility = 0.0  # EWMA of |relative change| of the lowest price between polls
+        self.hit_rate = 0.0  # EWMA of "lowest price was below the buy threshold"
+        self.gap = None  # lowest / threshold price - 1; <= 0 means the condition is met
+        self.observations = 0
+        self.next_poll = next_poll
+
+
+class PollScheduler:
+    """Per-product next-poll times drawn from a shared request budget.
+
+    Each product gets a priority from three signals:
+
+    * volatility of its lowest price (``volatility_reference`` is the
+      relative move per poll that adds 1 to the priority),
+    * how often it has met the buy condition (``hit_weight``),
+    * how close the lowest price is to the buy threshold price
+      (up to ``proximity_weight`` within ``proximity_band``).
+
+    The budget (polls per second across all products) is split in proportion
+    to priority and turned into an interval clamped to
+    ``[min_interval, max_interval]``. A product whose lowest price is within
+    ``burst_margin`` of the threshold, or below it, is polled every
+    ``burst_interval`` seconds. Burst polls come out of the same budget: when
+    too many products burst at once their interval is stretched so they
+    share the whole budget, and the other products share what is left.
+    """
+
+    def __init__(self, product_names, budget_per_second, min_interval=60, max_interval=3600,
+                 burst_interval=20, burst_margin=0.02, retry_interval=None,
+                 volatility_reference=0.02, hit_weight=4.0, proximity_band=0.10, proximity_weight=3.0,
+                 smoothing=0.3, clock=time.monotonic):
+        self.budget_per_second = budget_per_second
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.burst_interval = burst_interval
+        self.burst_margin = burst_margin
+        self.retry_interval = min_interval if retry_interval is None else retry_interval
+        self.volatility_reference = volatility_reference
+        self.hit_weight = hit_weight
+        self.proximity_band = proximity_band
+        self.proximity_weight = proximity_weight
+        self.smoothing = smoothing
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        self._heap = []
+        now = clock()
+        self.stats = {}
+        for name in product_names:
+            self.stats[name] = ProductStats(now)
+            self._push(name, now)
+
+    def _push(self, name, when):
+        self.stats[name].next_poll = when
+        heapq.heappush(self._heap, (when, next(self._counter), name))
+
+    def priority(self, name):
+        stats = self.stats[name]
+        priority = 1.0 + stats.volatility / self.volatility_reference + self.hit_weight * stats.hit_rate
+        if stats.gap is not None and stats.gap < self.proximity_band:
+            priority += self.proximity_weight * (1.0 - max(stats.gap, 0.0) / self.proximity_band)
+        return priority
+
+    def _bursting(self, name):
+        gap = self.stats[name].gap
+        return gap is not None and gap <= self.burst_margin
+
+    def interval(self, name):
+        bursting = [other for other in self.stats if self._bursting(other)]
+        burst_rate = min(self.budget_per_second, len(bursting) / self.burst_interval)
+        if name in bursting:
+            return len(bursting) / burst_rate if burst_rate > 0 else self.max_interval
+        total = sum(self.priority(other) for other in self.stats if other not in bursting)
+        rate = (self.budget_per_second - burst_rate) * self.priority(name) / total
+        interval = 1.0 / rate if rate > 0 else self.max_interval
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def due(self, now=None):
+        """Pop and return the products whose poll time has come, most overdue first.
+
+        Returned products are provisionally rescheduled ``retry_interval``
+        ahead, so a product whose fetch fails without ``observe`` being called
+        is retried rather than dropped.
+        """
+        now = self._clock() if now is None else now
+        names = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                when, _, name = heapq.heappop(self._heap)
+                if when != self.stats[name].next_poll or name in names:
+                    continue  # Superseded by a later reschedule
+                names.append(name)
+            for name in names:
+                self._push(name, now + self.retry_interval)
+        return names
+
+    def observe(self, name, lowest_price, threshold_price=None, now=None):
+        """Update the product's signals from a fetched book and schedule its next poll."""
+        now = self._clock() if now is None else now
+        with self._lock:
+            stats = self.stats[name]
+            alpha = self.smoothing
+            if stats.last_price:
+                change = abs(lowest_price - stats.last_price) / stats.last_price
+                stats.volatility += alpha * (change - stats.volatility)
+            stats.last_price = lowest_price
+            if threshold_price:
+                stats.gap = lowest_price / threshold_price - 1.0
+                stats.hit_rate += alpha * ((1.0 if stats.gap < 0 else 0.0) - stats.hit_rate)
+            stats.observations += 1
+            interval = self.interval(name)
+            self._push(name, now + interval)
+            return interval
+
+    def seconds_until_next(self, now=None):
+        now = self._clock() if now is None else now
+        with self._lock:
+            upcoming = min((stats.next_poll for stats in self.stats.values()), default=now)
+        return max(0.0, upcoming - now)
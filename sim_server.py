@@ -0,0 +1,462 @@
+"""Local stand-in for the SimCompanies endpoints this project talks to.
+
+Serves the market API, the cashflow API, the purchase API and minimal HTML for the market,
+landscape, building and sign-in pages, with configurable latency, HTTP 429
+injection and generated order books. Point the bots at it with
+``SIMCOMPANIES_BASE_URL=http://127.0.0.1:8765``.
+
+Usage: python sim_server.py [--port 8765] [--orders 200] [--latency 0.05]
+                            [--rate-limit-probability 0.02] [--dip 0.1]
+"""
+import argparse
+import datetime
+import html
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+MARKET_API_RE = re.compile(r'^/api/v3/market/(\d+)/(\d+)/?$')
+MARKET_PAGE_RE = re.compile(r'^/market/resource/(\d+)/?$')
+MARKET_BUY_RE = re.compile(r'^/market/resource/(\d+)/buy/?$')
+BUILDING_PAGE_RE = re.compile(r'^/b/(\d+)/?$')
+BUILDING_ACTION_RE = re.compile(r'^/b/(\d+)/(produce|rebuild)/?$')
+CASHFLOW_PATH = '/api/v2/companies/me/cashflow/recent/'
+PURCHASE_PATH = '/api/v2/market-order/take/'
+
+
+def generate_book(resource_id, count=200, base_price=None, tick=0.001, qualities=(0, 0, 0, 1, 2, 3),
+                  dip=0.0, shuffled=False, seed=None):
+    """Price-ascending list of market orders shaped like ``/api/v3/market/0/<id>/``.
+
+    ``dip`` puts the cheapest order that fraction below the next price level,
+    which is enough to meet the default buy threshold when ``dip > 0.06``.
+    ``shuffled`` returns the orders in random order instead.
+    """
+    rng = random.Random(resource_id if seed is None else seed)
+    price = base_price if base_price is not None else round(rng.uniform(0.5, 500), 3)
+    orders = []
+    for index in range(count):
+        if index:
+            price += tick * rng.choice((0, 1, 1, 2, 5))
+        orders.append({
+            'id': resource_id * 1_000_000 + index,
+            'kind': resource_id,
+            'quality': rng.choice(qualities),
+            'price': round(price, 3),
+            'quantity': rng.randint(1, 20000),
+            'posted': '2026-01-01T00:00:00+00:00',
+            'seller': {'id': rng.randint(1, 10 ** 6), 'company': f"Seller {index}", 'logo': None},
+        })
+    if dip and len(orders) > 1:
+        orders[0]['price'] = round(orders[1]['price'] * (1 - dip), 3)
+        orders[0]['quality'] = 0
+    if shuffled:
+        rng.shuffle(orders)
+    return orders
+
+
+class SimState:
+    """Mutable world shared by all request handlers (guarded by ``lock``)."""
+
+    def __init__(self, orders_per_book=200, dip=0.0, shuffled=False, latency=0.0, jitter=0.0,
+                 rate_limit_every=0, rate_limit_probability=0.0, retry_after=30, churn=0.0,
+                 cash=10_000_000.0, require_session=False, seed=1):
+        self.lock = threading.Lock()
+        self.rng = random.Random(seed)
+        self.orders_per_book = orders_per_book
+        self.dip = dip
+        self.shuffled = shuffled
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_every = rate_limit_every
+        self.rate_limit_probability = rate_limit_probability
+        self.retry_after = retry_after
+        self.churn = churn
+        self.cash = cash
+        self.require_session = require_session
+        self.books = {}
+        self.versions = {}
+        self.buildings = {}
+        self.counters = {'requests': 0, 'api_requests': 0, 'rate_limited': 0, 'not_modified': 0, 'purchases': 0}
+
+    def configure(self, **settings):
+        with self.lock:
+            for key, value in settings.items():
+                if key == 'books':
+                    for resource_id, orders in value.items():
+                        self.set_book(int(resource_id), orders)
+                elif key == 'buildings':
+                    for building_id, building in value.items():
+                        self.building(int(building_id)).update(building)
+                elif key in ('counters', 'lock', 'rng', 'versions') or not hasattr(self, key):
+                    raise KeyError(f"Unknown setting: {key}")
+                else:
+                    setattr(self, key, value)
+
+    def set_book(self, resource_id, orders):
+        self.books[resource_id] = list(orders)
+        self.versions[resource_id] = self.versions.get(resource_id, 0) + 1
+
+    def book(self, resource_id):
+        if resource_id not in self.books:
+            self.set_book(resource_id, generate_book(resource_id, self.orders_per_book, dip=self.dip,
+                                                     shuffled=self.shuffled))
+        return self.books[resource_id]
+
+    def maybe_churn(self, resource_id):
+        """Randomly post a new order near the top of the book (simulated market activity)."""
+        if self.churn and self.rng.random() < self.churn:
+            orders = self.book(resource_id)
+            top = min((order['price'] for order in orders), default=1.0)
+            new_order = dict(orders[0]) if orders else {'kind': resource_id, 'quality': 0, 'seller': {}}
+            new_order.update(id=self.rng.randint(10 ** 9, 10 ** 10), price=round(top * self.rng.uniform(0.97, 1.03), 3),
+                             quantity=self.rng.randint(1, 20000))
+            orders.append(new_order)
+            orders.sort(key=lambda order: order['price'])
+            self.set_book(resource_id, orders)
+
+    def should_rate_limit(self):
+        self.counters['api_requests'] += 1
+        if self.rate_limit_every and self.counters['api_requests'] % self.rate_limit_every == 0:
+            return True
+        return bool(self.rate_limit_probability) and self.rng.random() < self.rate_limit_probability
+
+    def buy(self, resource_id, quantity, max_price=None):
+        """Fill ``quantity`` from the cheapest orders; return ``(filled, cost, error)``.
+
+        With ``max_price`` only orders at or below that price are taken.
+        """
+        orders = sorted(self.book(resource_id), key=lambda order: order['price'])
+        if not orders:
+            return 0, 0.0, "No orders available"
+        if max_price is not None:
+            orders = [order for order in orders if order['price'] <= max_price]
+            if not orders:
+                return 0, 0.0, "Price changed"
+        remaining = quantity
+        cost = 0.0
+        fills = []
+        for order in orders:
+            if remaining <= 0:
+                break
+            take = min(remaining, order['quantity'])
+            fills.append((order, take))
+            cost += take * order['price']
+            remaining -= take
+        if cost > self.cash:
+            return 0, 0.0, "Not enough money"
+        for order, take in fills:
+            order['quantity'] -= take
+        self.set_book(resource_id, [order for order in orders if order['quantity'] > 0])
+        self.cash -= cost
+        self.counters['purchases'] += 1
+        return quantity - remaining, cost, None
+
+    def building(self, building_id):
+        """Building state; unknown IDs become idle power plants on first visit."""
+        return self.buildings.setdefault(building_id, {
+            'kind': 'Power plant', 'finishes_at': None, 'crude_abundance': 97.5, 'methane_abundance': 98.0,
+        })
+
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title} - SimCompanies (local)</title></head>
+<body>
+<nav>{nav}</nav>
+<main>
+{body}
+</main>
+</body></html>
+"""
+
+
+class SimRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'SimCompaniesStandIn/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    # --- Plumbing ---
+    def _delay(self):
+        with self.state.lock:
+            latency, jitter = self.state.latency, self.state.jitter
+            self.state.counters['requests'] += 1
+        if latency or jitter:
+            time.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+
+    def _send(self, status, body, content_type='application/json', headers=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type if status != 304 else 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _send_json(self, payload, status=200, headers=None):
+        self._send(status, json.dumps(payload), headers=headers)
+
+    def _redirect(self, location):
+        self._send(303, b'', 'text/plain', {'Location': location})
+
+    def _page(self, title, body, status=200):
+        with self.state.lock:
+            cash = self.state.cash
+        nav = (f'<a href="/landscape/">Landscape</a> <a href="/company/">Company</a> '
+               f'<span id="js-animation-money">${cash:,.2f}</span>')
+        self._send(status, PAGE_TEMPLATE.format(title=html.escape(title), nav=nav, body=body), 'text/html; charset=utf-8')
+
+    def _has_session(self):
+        return 'sessionid=' in (self.headers.get('Cookie') or '')
+
+    def _read_form(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length).decode('utf-8') if length else ''
+        if 'json' in (self.headers.get('Content-Type') or ''):
+            return json.loads(raw or '{}')
+        return {key: values[-1] for key, values in parse_qs(raw).items()}
+
+    # --- Routing ---
+    def do_GET(self):
+        self._delay()
+        path = urlparse(self.path).path
+        if path.startswith('/api/') and self.state.require_session and not self._has_session():
+            return self._send_json({'detail': 'Authentication credentials were not provided.'}, status=401)
+        match = MARKET_API_RE.match(path)
+        if match:
+            return self._market_api(int(match.group(2)))
+        if path == CASHFLOW_PATH:
+            with self.state.lock:
+                cash = self.state.cash
+            return self._send_json({'money': round(cash, 2), 'entries': []})
+        if path == '/_sim/state':
+            with self.state.lock:
+                return self._send_json({'cash': self.state.cash, 'counters': dict(self.state.counters)})
+        if self.state.require_session and not self._has_session() and path != '/signin/':
+            return self._redirect('/signin/')
+        match = MARKET_PAGE_RE.match(path)
+        if match:
+            return self._market_page(int(match.group(1)), parse_qs(urlparse(self.path).query))
+        match = BUILDING_PAGE_RE.match(path)
+        if match:
+            return self._building_page(int(match.group(1)))
+        if path in ('/', '/landscape/', '/company/'):
+            return self._landscape_page()
+        if path == '/signin/':
+            return self._page('Sign in', '<form action="/login" method="post"><input name="email">'
+                                         '<button type="submit">Login</button></form>')
+        return self._send_json({'detail': 'Not found.'}, status=404)
+
+    def do_POST(self):
+        self._delay()
+        path = urlparse(self.path).path
+        form = self._read_form()
+        if path == '/_sim/config':
+            try:
+                self.state.configure(**form)
+            except KeyError as e:
+                return self._send_json({'detail': str(e)}, status=400)
+            return self._send_json({'ok': True})
+        if path == PURCHASE_PATH:
+            return self._purchase_api(form)
+        match = MARKET_BUY_RE.match(path)
+        if match:
+            resource_id = int(match.group(1))
+            try:
+                quantity = int(form.get('quantity', 0))
+            except ValueError:
+                quantity = 0
+            with self.state.lock:
+                filled, cost, error = self.state.buy(resource_id, quantity) if quantity > 0 else (0, 0.0, "Invalid quantity")
+            result = f"error={error}" if error else f"filled={filled}&cost={cost:.3f}"
+            return self._redirect(f"/market/resource/{resource_id}/?{result}")
+        match = BUILDING_ACTION_RE.match(path)
+        if match:
+            building_id, action = int(match.group(1)), match.group(2)
+            with self.state.lock:
+                building = self.state.building(building_id)
+                if action == 'produce':
+                    building['finishes_at'] = datetime.datetime.now().astimezone() + datetime.timedelta(hours=24)
+                else:
+                    building['crude_abundance'] = building['methane_abundance'] = 100.0
+            return self._redirect(f"/b/{building_id}/")
+        return self._send_json({'detail': 'Not found.'}, status=404)
+
+    do_HEAD = do_GET
+
+    # --- Handlers ---
+    def _purchase_api(self, payload):
+        if self.state.require_session and not self._has_session():
+            return self._send_json({'detail': 'Authentication credentials were not provided.'}, status=401)
+        try:
+            resource_id = int(payload['resource'])
+            quantity = int(payload['quantity'])
+            max_price = payload.get('maxPrice')
+            max_price = None if max_price is None else float(max_price)
+        except (KeyError, TypeError, ValueError):
+            return self._send_json({'detail': 'Invalid purchase request.'}, status=400)
+        if quantity <= 0:
+            return self._send_json({'detail': 'Invalid quantity'}, status=400)
+        with self.state.lock:
+            filled, cost, error = self.state.buy(resource_id, quantity, max_price)
+            cash = self.state.cash
+        if error:
+            return self._send_json({'detail': error, 'filled': 0}, status=409 if error == "Price changed" else 400)
+        return self._send_json({'filled': filled, 'cost': round(cost, 3), 'money': round(cash, 2)})
+
+    def _market_api(self, resource_id):
+        with self.state.lock:
+            if self.state.should_rate_limit():
+                self.state.counters['rate_limited'] += 1
+                status, body, headers = 429, json.dumps({'detail': 'Request was throttled.'}), {
+                    'Retry-After': str(self.state.retry_after)}
+            else:
+                self.state.maybe_churn(resource_id)
+                orders = self.state.book(resource_id)
+                etag = f'"{resource_id}-{self.state.versions[resource_id]}"'
+                headers = {'ETag': etag}
+                if self.headers.get('If-None-Match') == etag:
+                    self.state.counters['not_modified'] += 1
+                    status, body = 304, b''
+                else:
+                    status, body = 200, json.dumps(orders)
+        self._send(status, body, headers=headers)
+
+    def _market_page(self, resource_id, query):
+        with self.state.lock:
+            orders = sorted(self.state.book(resource_id), key=lambda order: order['price'])[:20]
+        rows = ''.join(
+            f'<tr aria-label="market order {order["id"]}"><td>{html.escape(order["seller"].get("company", ""))}</td>'
+            f'<td>Q{order["quality"]}</td><td>{order["quantity"]:,}</td><td>${order["price"]:,.3f}</td></tr>'
+            for order in orders
+        )
+        message = ''
+        if 'filled' in query:
+            message = (f'<div class="alert alert-success">Purchased {query["filled"][0]} units '
+                       f'for ${float(query["cost"][0]):,.3f}</div>')
+        elif 'error' in query:
+            message = f'<div class="alert alert-danger">{html.escape(query["error"][0])}</div>'
+        body = (
+            f'{message}<h1>Resource {resource_id}</h1>'
+            f'<table><tbody>{rows}</tbody></table>'
+            f'<form method="post" action="/market/resource/{resource_id}/buy">'
+            f'<input name="quantity" type="number" min="1">'
+            f'<button type="submit" class="btn btn-primary">Buy</button></form>'
+        )
+        self._page(f"Market {resource_id}", body)
+
+    def _building_page(self, building_id):
+        with self.state.lock:
+            building = dict(self.state.building(building_id))
+        finishes_at = building['finishes_at']
+        if finishes_at and finishes_at > datetime.datetime.now().astimezone():
+            production = (f'<h3>Production</h3><p>Finishes at {finishes_at.strftime("%Y-%m-%d %H:%M:%S %z")}</p>'
+                          f'<button type="button" class="btn btn-secondary">Cancel Production</button>')
+        else:
+            production = (f'<form method="post" action="/b/{building_id}/produce"><button type="button">24h</button>'
+                          f'<button type="submit" class="btn btn-primary">Produce</button></form>')
+        resources = ''
+        if building['kind'] == 'Oil rig':
+            resources = (
+                f'<div class="row"><img alt="Crude oil"><span>Abundance: {building["crude_abundance"]}</span></div>'
+                f'<div class="row"><img alt="Methane"><span>Abundance: {building["methane_abundance"]}</span></div>'
+                f'<form method="post" action="/b/{building_id}/rebuild">'
+                f'<button type="submit" class="btn btn-danger">Rebuild</button></form>'
+            )
+        self._page(f"{building['kind']} {building_id}", f'<h2>{building["kind"]}</h2>{resources}{production}')
+
+    def _landscape_page(self):
+        with self.state.lock:
+            buildings = dict(self.state.buildings)
+        links = ''.join(
+            f'<a href="/b/{building_id}/"><img alt="{building["kind"]}"><span>{building["kind"]}</span></a>'
+            for building_id, building in sorted(buildings.items())
+        )
+        self._page('Landscape', f'<div class="landscape">{links}</div>')
+
+
+class SimServer:
+    """Runs the stand-in on a background thread; ``port=0`` picks a free port."""
+
+    def __init__(self, host='127.0.0.1', port=0, verbose=False, **state_settings):
+        self.state = SimState(**state_settings)
+        self.httpd = ThreadingHTTPServer((host, port), SimRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.state = self.state
+        self.httpd.verbose = verbose
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def market_url(self, resource_id, realm=0):
+        return f"{self.base_url}/api/v3/market/{realm}/{resource_id}/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='sim-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--orders', type=int, default=200, help='Orders per generated book')
+    parser.add_argument('--dip', type=float, default=0.0, help='Cheapest order this fraction below the next level')
+    parser.add_argument('--shuffled', action='store_true', help='Serve books in random order')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--rate-limit-every', type=int, default=0, help='Answer every Nth API call with HTTP 429')
+    parser.add_argument('--rate-limit-probability', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=int, default=30)
+    parser.add_argument('--churn', type=float, default=0.0, help='Chance that a market GET posts a new order')
+    parser.add_argument('--cash', type=float, default=10_000_000.0)
+    parser.add_argument('--require-session', action='store_true', help='Reject requests without a sessionid cookie')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    server = SimServer(
+        args.host, args.port, verbose=args.verbose, orders_per_book=args.orders, dip=args.dip,
+        shuffled=args.shuffled, latency=args.latency, jitter=args.jitter,
+        rate_limit_every=args.rate_limit_every, rate_limit_probability=args.rate_limit_probability,
+        retry_after=args.retry_after, churn=args.churn, cash=args.cash, require_session=args.require_session,
+    )
+    print(f"SimCompanies stand-in listening on {server.base_url} (set SIMCOMPANIES_BASE_URL to this)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping stand-in server.")
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,16 @@
 from market_utils import get_current_money
 from driver_utils import initialize_driver
+from cash_service import CashService
+from http_client import create_session
+from config import CASH_API_URL, MARKET_HEADERS, COOKIES
+
+def check_cash_api():
+    cash = CashService(create_session(headers=MARKET_HEADERS, cookies=COOKIES, timer=False), CASH_API_URL)
+    balance = cash.refresh()
+    if balance is not None:
+        print(f"Successfully obtained cash value from the cashflow API: {balance}")
+    else:
+        print(f"Unable to obtain cash value from {CASH_API_URL}: {cash.last_error}")
 
 def test_get_current_money():
     driver = None  # Initialize driver to None for the finally block
@@ -17,4 +28,5 @@ def test_get_current_money():
             driver.quit() # Ensure the driver is closed
 
 if __name__ == "__main__":
+    check_cash_api()
     test_get_current_money()
\ No newline at end of file
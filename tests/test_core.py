@@ -1,11 +1,47 @@
 import datetime
+import io
+import json
 import logging
+import os
+import sqlite3
+import tempfile
+import time
 import unittest
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+import AutoBuyer as AutoBuyer_config
 from AutoBuyer import AutoBuyer
-from market_utils import get_market_data
+from backtest import Timeline, run_backtest
+from cash_service import CashService, parse_cash_payload
+from cookie_bridge import CookieBridge, cookies_from_profile
+from decision import DecisionCatalog, evaluate_catalog, walk_depth
+from driver_utils import WarmDriver
+from http_client import create_session, warm_up
+from http_cache import CACHE_STATUS_HEADER, CONTENT_HASH_HEADER, install_cache, parse_retry_after
+from log_utils import level_for, parse_module_levels, setup_logger, stop_logging
+from login_state import LoginState, is_sign_in_url
+from market_utils import OrderBook, get_market_data, iter_json_array, scan_market_data
+from pipeline import Opportunity, OpportunityQueue, PipelineWorker
+from price_history import PriceHistoryStore, summarize_market_data
 from production_monitor import PowerPlantProducer
+from purchase_executor import HttpPurchaseExecutor, PurchaseResult
+from rate_limiter import AimdController, SharedTokenBucket, TokenBucket
+from scheduler import PollScheduler
+from sim_server import SimServer, generate_book
+from trade_ledger import TradeLedger, parse_text_log_line
+
+
+def make_response(orders, status_code=200, headers=None):
+    response = Mock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    response.raise_for_status.return_value = None
+    response.json.return_value = orders
+    return response
 
 
 class MarketDataTests(unittest.TestCase):
@@ -25,19 +61,1036 @@ class MarketDataTests(unittest.TestCase):
         self.assertEqual(result["lowest_order"]["id"], 1)
         self.assertEqual(result["second_lowest_price"], 12)
 
+    def test_lists_every_order_below_threshold(self):
+        orders = [
+            {"id": 4, "quality": 0, "price": 20, "quantity": 1},
+            {"id": 3, "quality": 0, "price": 12, "quantity": 9},
+            {"id": 1, "quality": 0, "price": 10, "quantity": 5},
+            {"id": 2, "quality": 0, "price": 10, "quantity": 7},
+        ]
+        session = Mock()
+        session.get.return_value = make_response(orders)
+
+        result = get_market_data(session, "https://example.test", 0, return_order_detail=True, buy_threshold=1.5)
+
+        self.assertEqual([order["id"] for order in result["orders_below_threshold"]], [1, 2, 3])
+        self.assertNotIn("orders_below_threshold", get_market_data(session, "https://example.test", 0))
+
+
+class StreamingDecodeTests(unittest.TestCase):
+    @staticmethod
+    def streaming_session(orders, chunk_size=7):
+        payload = json.dumps(orders).encode()
+        chunks_served = []
+
+        def iter_content(**kwargs):
+            for start in range(0, len(payload), chunk_size):
+                chunks_served.append(start)
+                yield payload[start:start + chunk_size]
+
+        response = make_response(orders)
+        response.iter_content.side_effect = iter_content
+        session = Mock()
+        session.get.return_value = response
+        return session, chunks_served, len(payload)
+
+    def test_iter_json_array_handles_split_items(self):
+        chunks = [b' [{"id": 1, "na', b'me": "\xc3', b'\xa9"}, {"id"', b': 2} ]']
+        self.assertEqual(list(iter_json_array(chunks)), [{"id": 1, "name": "é"}, {"id": 2}])
+
+    def test_stream_stops_after_second_price_level(self):
+        orders = [{"id": i, "quality": 0, "price": 10 + i // 3, "quantity": 1} for i in range(300)]
+        session, chunks_served, payload_size = self.streaming_session(orders)
+
+        result = get_market_data(session, "https://example.test", 0, return_order_detail=True,
+                                 decoder="stream", assume_sorted=True)
+
+        self.assertEqual(result["lowest_order"]["id"], 0)
+        self.assertEqual(result["second_lowest_price"], 11)
+        self.assertEqual(len(result["order_book"]), 6)
+        self.assertTrue(result["partial_book"])
+        self.assertLess(len(chunks_served) * 7, payload_size // 10)
+        session.get.return_value.close.assert_called_once()
+
+    def test_stream_reads_everything_when_not_sorted(self):
+        orders = [
+            {"id": 1, "quality": 0, "price": 10, "quantity": 1},
+            {"id": 2, "quality": 0, "price": 12, "quantity": 1},
+            {"id": 3, "quality": 0, "price": 11, "quantity": 1},
+            {"id": 4, "quality": 0, "price": 20, "quantity": 1},
+            {"id": 5, "quality": 0, "price": 10.5, "quantity": 1},
+        ]
+        session, _, _ = self.streaming_session(orders)
+
+        result = get_market_data(session, "https://example.test", 0, decoder="stream", assume_sorted=True)
+
+        self.assertEqual(result["second_lowest_price"], 10.5)
+        self.assertEqual(len(result["order_book"]), 5)
+
+    def test_stream_reports_invalid_payloads(self):
+        error_details = {}
+        session, _, _ = self.streaming_session({"detail": "oops"})
+        self.assertIsNone(get_market_data(session, "https://example.test", 0, error_details=error_details,
+                                          decoder="stream", assume_sorted=True))
+        self.assertEqual(error_details["kind"], "invalid_response")
+
+    def test_fast_decoder_matches_standard(self):
+        response = make_response(None)
+        response.content = b'[{"id": 1, "quality": 0, "price": 3, "quantity": 2}, {"id": 2, "quality": 0, "price": 4, "quantity": 2}]'
+        session = Mock()
+        session.get.return_value = response
+
+        result = get_market_data(session, "https://example.test", 0, decoder="fast")
+
+        self.assertEqual((result["lowest_price"], result["second_lowest_price"]), (3, 4))
+        response.json.assert_not_called()
+
+
+class CachingAdapterTests(unittest.TestCase):
+    URL = "https://example.test/api/v3/market/0/1/"
+
+    def setUp(self):
+        self.now = [1000.0]
+        self.sent = []
+        self.replies = []
+        self.session = requests.Session()
+        self.adapter = install_cache(self.session, stale_if_rate_limited=120, default_backoff=60,
+                                     clock=lambda: self.now[0])
+        patcher = patch.object(HTTPAdapter, "send", autospec=True, side_effect=self.fake_send)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fake_send(self, adapter, request, **kwargs):
+        self.sent.append(dict(request.headers))
+        status_code, headers, body = self.replies.pop(0)
+        response = requests.Response()
+        response.status_code = status_code
+        response.headers = requests.structures.CaseInsensitiveDict(headers)
+        if kwargs.get("stream"):
+            response.raw = io.BytesIO(body)
+        else:
+            response._content = body
+            response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        return response
+
+    def test_revalidates_with_etag(self):
+        body = b'[{"id": 1, "quality": 0, "price": 5, "quantity": 1}]'
+        self.replies = [(200, {"ETag": '"v1"'}, body), (304, {"ETag": '"v1"'}, b"")]
+
+        first = self.session.get(self.URL)
+        second = self.session.get(self.URL)
+
+        self.assertEqual(self.sent[1]["If-None-Match"], '"v1"')
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.content, body)
+        self.assertEqual(second.headers[CACHE_STATUS_HEADER], "revalidated")
+        self.assertEqual(first.headers[CONTENT_HASH_HEADER], second.headers[CONTENT_HASH_HEADER])
+
+    def test_fresh_entry_is_served_without_network(self):
+        self.replies = [(200, {"Cache-Control": "max-age=30"}, b"[]")]
+        self.session.get(self.URL)
+        self.now[0] += 10
+        response = self.session.get(self.URL)
+        self.assertEqual(response.headers[CACHE_STATUS_HEADER], "hit")
+        self.assertEqual(len(self.sent), 1)
+
+    def test_no_cache_request_skips_fresh_and_stale_snapshots(self):
+        self.replies = [(200, {"Cache-Control": "max-age=30"}, b"[]"), (200, {}, b"[1]"), (429, {"Retry-After": "30"}, b"")]
+        self.session.get(self.URL)
+        fresh = self.session.get(self.URL, headers={"Cache-Control": "no-cache"})
+        self.assertEqual((fresh.headers[CACHE_STATUS_HEADER], fresh.content), ("miss", b"[1]"))
+        self.session.get(self.URL, headers={"Cache-Control": "no-cache"})  # 429 starts the backoff
+        self.assertEqual(self.session.get(self.URL).headers[CACHE_STATUS_HEADER], "stale")
+        self.assertEqual(self.session.get(self.URL, headers={"Cache-Control": "no-cache"}).status_code, 429)
+        self.assertEqual(len(self.sent), 3)
+
+    def test_streamed_response_is_passed_through_unread(self):
+        self.replies = [(200, {"ETag": '"v1"'}, b"[1, 2]"), (200, {}, b"[]")]
+        streamed = self.session.get(self.URL, stream=True)
+        self.assertEqual(streamed.headers[CACHE_STATUS_HEADER], "bypass")
+        self.assertFalse(streamed._content_consumed)
+        self.assertEqual(b"".join(streamed.iter_content(2)), b"[1, 2]")
+        self.session.get(self.URL)
+        self.assertNotIn("If-None-Match", self.sent[1])
+
+    def test_serves_stale_snapshot_during_rate_limit_backoff(self):
+        self.replies = [(200, {}, b"[]"), (429, {"Retry-After": "30"}, b"")]
+        self.session.get(self.URL)
+        self.assertEqual(self.session.get(self.URL).status_code, 429)
+
+        stale = self.session.get(self.URL)
+        uncached = self.session.get(self.URL + "?other")
+
+        self.assertEqual(stale.headers[CACHE_STATUS_HEADER], "stale")
+        self.assertEqual(uncached.status_code, 429)
+        self.assertEqual(len(self.sent), 2)
+        self.now[0] += 200
+        self.replies = [(200, {}, b"[]")]
+        self.assertEqual(self.session.get(self.URL).headers[CACHE_STATUS_HEADER], "miss")
+
+    def test_market_data_carries_content_hash(self):
+        body = b'[{"id": 1, "quality": 0, "price": 5, "quantity": 1}, {"id": 2, "quality": 0, "price": 6, "quantity": 1}]'
+        self.replies = [(200, {}, body)]
+        result = get_market_data(self.session, self.URL, 0)
+        self.assertEqual(result["cache_status"], "miss")
+        self.assertEqual(len(result["content_hash"]), 40)
+
+
+class OrderBookTests(unittest.TestCase):
+    def setUp(self):
+        self.book = OrderBook.from_orders([
+            {"id": 1, "quality": 0, "price": 12, "quantity": 4},
+            {"id": 2, "quality": 2, "price": 10, "quantity": 5},
+            {"id": 3, "quality": 0, "price": 10, "quantity": 7},
+            {"id": 4, "quality": 0, "price": "bad", "quantity": 1},
+            {"id": 5, "quality": 1, "price": 15, "quantity": 100},
+            {"id": None, "quality": 0, "price": 9, "quantity": 1},
+        ], require_id=True)
+
+    def test_skips_malformed_rows_and_missing_ids(self):
+        self.assertEqual(len(self.book), 4)
+        self.assertEqual(self.book.lowest_order(), {"id": 2, "price": 10.0, "quantity": 5})
+        self.assertEqual(self.book.next_distinct_price(), 12.0)
+
+    def test_quality_filter(self):
+        book = OrderBook.from_orders([
+            {"id": 1, "quality": 0, "price": 5, "quantity": 1},
+            {"id": 2, "quality": 1, "price": 8, "quantity": 1},
+        ], min_quality=1)
+        self.assertEqual(book.lowest_price(), 8.0)
+        self.assertIsNone(book.next_distinct_price())
+
+    def test_depth_below(self):
+        self.assertEqual(self.book.depth_below(12), 12)
+        self.assertEqual(self.book.depth_below(12, inclusive=True), 16)
+
+    def test_cost_for_quantity_walks_cheapest_levels(self):
+        filled, total_cost, vwap = self.book.cost_for_quantity(14)
+        self.assertEqual(filled, 14)
+        self.assertAlmostEqual(total_cost, 12 * 10 + 2 * 12)
+        self.assertAlmostEqual(vwap, total_cost / 14)
+
+    def test_cost_for_quantity_on_large_book_matches_full_sort(self):
+        orders = [{"id": i, "quality": 0, "price": 1000 - (i * 7) % 997, "quantity": 1 + i % 5} for i in range(5000)]
+        book = OrderBook.from_orders(orders)
+        ranked = sorted(orders, key=lambda o: o["price"])
+        remaining, expected = 300, 0.0
+        for order in ranked:
+            take = min(remaining, order["quantity"])
+            expected += take * order["price"]
+            remaining -= take
+            if not remaining:
+                break
+        filled, total_cost, _ = book.cost_for_quantity(300)
+        self.assertEqual(filled, 300)
+        self.assertAlmostEqual(total_cost, expected)
+
+
+class DecisionTests(unittest.TestCase):
+    def test_caps_match_autobuyer_rules(self):
+        decision = evaluate_catalog(
+            ["A", "B", "C", "D"],
+            lowest_prices=[90, 99, 50, 10],
+            second_lowest_prices=[100, 100, 100, float("nan")],
+            lowest_quantities=[1000, 1000, 1000, 1000],
+            thresholds=[0.94, 0.94, 0.94, 0.94],
+            max_buy_quantities=[500, 500, 1_000_000, 500],
+            max_total_costs=[0, 0, 10_000, 0],
+            available_cash=45_000,
+            min_cash_reserve=5_000,
+        )
+        self.assertEqual(decision.triggered.tolist(), [True, False, True, False])
+        self.assertEqual(decision.buy_quantities.tolist(), [444, 0, 200, 0])
+        self.assertEqual([item["name"] for item in decision.opportunities()], ["C", "A"])
+        self.assertAlmostEqual(decision.opportunities()[1]["expected_savings"], 444 * 10)
+
+    def test_catalog_skips_failed_fetches(self):
+        catalog = DecisionCatalog(["Power", "Water", "Seeds"], {"Water": 0.5}, {}, {})
+        results = {
+            "Power": ({"lowest_order": {"id": 2**53 + 1, "price": 1.0, "quantity": 5}, "second_lowest_price": 2.0}, {}),
+            "Water": ({"lowest_order": {"id": 2, "price": 1.0, "quantity": 5}, "second_lowest_price": 1.5}, {}),
+            "Seeds": (None, {"kind": "timeout"}),
+        }
+        decision = catalog.evaluate(results)
+        self.assertEqual(decision.names, ["Power", "Water"])
+        self.assertEqual(decision.opportunities()[0]["order_id"], 2**53 + 1)
+        self.assertEqual(decision.buy_quantities.tolist(), [5, 0])
+        self.assertEqual((decision.index_of("Water"), decision.index_of("Seeds")), (1, None))
+
+    def test_catalog_plans_depth_like_the_purchase(self):
+        orders = [{"id": 1, "price": 9.0, "quantity": 40}, {"id": 2, "price": 10.0, "quantity": 60}]
+        catalog = DecisionCatalog(["Power"], {"Power": 1.2}, {}, {"Power": 700})
+        results = {"Power": ({"lowest_order": orders[0], "second_lowest_price": 10.0,
+                              "orders_below_threshold": orders}, {})}
+        opportunity = catalog.evaluate(results).opportunities()[0]
+        fill = walk_depth(orders, max_cost=700)
+        self.assertEqual((opportunity["quantity"], opportunity["cost"]), (fill.quantity, fill.cost))
+        self.assertEqual(opportunity["expected_savings"], 74 * 10.0 - 700)
+
+    def test_walk_depth_fills_cheapest_levels_within_caps(self):
+        orders = [{"price": 12.0, "quantity": 9}, {"price": 10.0, "quantity": 5}, {"price": 10.0, "quantity": 7}]
+        fill = walk_depth(orders, max_quantity=15)
+        self.assertEqual((fill.quantity, fill.cost, fill.max_price, fill.levels), (15, 156.0, 12.0, 3))
+        fill = walk_depth(orders, max_cost=145)
+        self.assertEqual((fill.quantity, fill.cost, fill.max_price), (14, 144.0, 12.0))
+        self.assertEqual(walk_depth(orders, max_cost=5).quantity, 0)
+        with np.errstate(invalid="raise"):  # An uncapped budget must not divide inf
+            self.assertEqual(walk_depth(orders, np.float64(20), np.float64(np.inf)).quantity, 20)
+
+
+class ScanMarketDataTests(unittest.TestCase):
+    def test_fetches_every_product(self):
+        session = Mock()
+        session.get.return_value = make_response([
+            {"id": 1, "quality": 0, "price": 10, "quantity": 5},
+            {"id": 2, "quality": 0, "price": 12, "quantity": 5},
+        ])
+        products = {f"P{i}": {"url": f"https://example.test/{i}/", "quality": 0} for i in range(5)}
+
+        results = scan_market_data(session, products, rate_limiter=TokenBucket(100, 5), max_workers=3)
+
+        self.assertEqual(set(results), set(products))
+        self.assertTrue(all(data["lowest_price"] == 10 for data, _ in results.values()))
+
+    def test_rate_limit_cancels_pending_requests(self):
+        response = make_response([], status_code=429, headers={"Retry-After": "60"})
+        response.raise_for_status.side_effect = requests.exceptions.HTTPError(response=response)
+        session = Mock()
+        session.get.return_value = response
+        products = {f"P{i}": {"url": f"https://example.test/{i}/", "quality": 0} for i in range(4)}
+
+        results = scan_market_data(session, products, rate_limiter=TokenBucket(0.001, 1), max_workers=1)
+
+        kinds = sorted(error["kind"] for _, error in results.values())
+        self.assertEqual(kinds, ["cancelled", "cancelled", "cancelled", "rate_limited"])
+        self.assertEqual(session.get.call_count, 1)
+
+
+class TokenBucketTests(unittest.TestCase):
+    def test_refills_at_configured_rate(self):
+        now = [0.0]
+        bucket = TokenBucket(2, 4, clock=lambda: now[0])
+        for _ in range(4):
+            self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+        now[0] = 0.5
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+
+    def test_acquire_waits_for_tokens(self):
+        now = [0.0]
+
+        def fake_sleep(seconds):
+            now[0] += seconds
+
+        bucket = TokenBucket(1, 1, clock=lambda: now[0], sleep=fake_sleep)
+        self.assertTrue(bucket.acquire())
+        self.assertTrue(bucket.acquire())
+        self.assertAlmostEqual(now[0], 1.0)
+        self.assertFalse(bucket.acquire(timeout=0.25))
+
+    def test_backoff_blocks_until_retry_after(self):
+        now = [0.0]
+        bucket = TokenBucket(10, 5, clock=lambda: now[0])
+        bucket.backoff(30)
+        now[0] = 29.0
+        self.assertFalse(bucket.try_acquire())
+        now[0] = 30.0
+        self.assertTrue(bucket.try_acquire())
+
+
+class SharedTokenBucketTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.now = [1000.0]
+        self.path = os.path.join(tmp.name, "governor.sqlite3")
+
+    def bucket(self, name):
+        bucket = SharedTokenBucket(self.path, 1, 4, client_name=name, idle_after=60, clock=lambda: self.now[0])
+        self.addCleanup(bucket.close)
+        return bucket
+
+    def test_processes_share_budget_and_borrower_leaves_reserve(self):
+        buyer, monitor = self.bucket("buyer"), self.bucket("monitor")
+        self.assertTrue(monitor.try_acquire())  # Registers the monitor as active
+        granted = 0
+        while buyer.try_acquire():
+            granted += 1
+        self.assertEqual(granted, 2)  # Fair share of 2, then borrows down to one token kept for the monitor
+        self.assertTrue(monitor.try_acquire())
+        self.assertFalse(monitor.try_acquire())
+        self.assertEqual(monitor.active_clients(), ["buyer", "monitor"])
+
+        self.now[0] += 120  # Monitor idle: the buyer may use the whole bucket
+        self.assertEqual(sum(buyer.try_acquire() for _ in range(5)), 4)
+
+    def test_backoff_from_one_process_pauses_the_other(self):
+        buyer, monitor = self.bucket("buyer"), self.bucket("monitor")
+        monitor.backoff(parse_retry_after("30", 0))
+        self.assertAlmostEqual(buyer.blocked_for(), 30)
+        self.assertFalse(buyer.try_acquire())
+        self.now[0] += 30
+        self.assertTrue(buyer.try_acquire())
+
+    def test_aimd_pacing_cannot_raise_the_host_rate(self):
+        buyer = self.bucket("buyer")
+        pacer = AimdController(1, min_rate=0.1, max_rate=2, increase=0.5, limiter=buyer)
+        for _ in range(4):
+            pacer.on_response(0.2)
+        self.assertEqual(pacer.rate, 2)
+        self.assertEqual(buyer.rate_per_second, 1)  # Clamped to the governor rate
+        while buyer.try_acquire():
+            pass
+        self.now[0] += 2
+        self.assertEqual(sum(buyer.try_acquire() for _ in range(4)), 2)
+        pacer.on_rate_limited()
+        self.assertEqual(buyer.rate_per_second, 1)  # Halved to 1, still within the cap
+
+
+class AimdControllerTests(unittest.TestCase):
+    def test_additive_increase_and_one_cut_per_burst_of_429s(self):
+        now = [0.0]
+        bucket = TokenBucket(1, 5)
+        pacer = AimdController(1.0, min_rate=0.1, max_rate=1.05, increase=0.02, cooldown=10,
+                               limiter=bucket, clock=lambda: now[0])
+        for _ in range(5):
+            pacer.on_response(0.2)
+        self.assertAlmostEqual(pacer.rate, 1.05)  # Clamped at max_rate
+        pacer.on_rate_limited()
+        pacer.on_rate_limited()  # Same burst, within the cooldown
+        self.assertAlmostEqual(pacer.rate, 0.525)
+        self.assertAlmostEqual(pacer.limit_rate, 1.05)
+        self.assertAlmostEqual(bucket.rate_per_second, 0.525)
+        now[0] = 11
+        pacer.on_response(30)  # Slow response counts as congestion
+        self.assertAlmostEqual(pacer.rate, 0.2625)
+
+    def test_ignores_cache_served_responses_and_persists_state(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "aimd.json")
+        pacer = AimdController(0.5, min_rate=0.1, max_rate=2, state_path=path)
+        cached = requests.Response()
+        cached.status_code = 429
+        cached.headers[CACHE_STATUS_HEADER] = 'backoff'
+        pacer(cached)
+        self.assertEqual(pacer.rate, 0.5)
+        cached.headers[CACHE_STATUS_HEADER] = 'miss'
+        pacer(cached)
+        self.assertEqual(pacer.rate, 0.25)
+        restarted = AimdController(0.5, min_rate=0.1, max_rate=2, state_path=path)
+        self.assertEqual((restarted.rate, restarted.limit_rate), (0.25, 0.5))
+
+
+class PriceHistoryStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_ring_keeps_latest_rows_in_order(self):
+        store = PriceHistoryStore(self.tmp.name, raw_rows=4, minute_rows=4, hour_rows=4)
+        for second in range(6):
+            store.append("Power", 10 + second, 11 + second, 5, 20, timestamp=1000 + second)
+        rows = store.query("Power", tier="raw")
+        self.assertEqual(rows["timestamp"].tolist(), [1002, 1003, 1004, 1005])
+        self.assertEqual(rows["lowest"].tolist(), [12, 13, 14, 15])
+        window = store.query("Power", start=1003, end=1005, tier="raw")
+        self.assertEqual(window["timestamp"].tolist(), [1003, 1004])
+
+    def test_downsampling_keeps_cheapest_snapshot_and_survives_reopen(self):
+        store = PriceHistoryStore(self.tmp.name, raw_rows=10, minute_rows=10, hour_rows=10)
+        store.append("Water", 5.0, 6.0, 3, 7, timestamp=60)
+        store.append("Water", 4.0, None, 9, 8, timestamp=90)
+        store.flush()
+        reopened = PriceHistoryStore(self.tmp.name, raw_rows=10, minute_rows=10, hour_rows=10)
+        reopened.append("Water", 7.0, 8.0, 1, 2, timestamp=120)
+        minute = reopened.query("Water", tier="1m")
+        self.assertEqual(minute["timestamp"].tolist(), [60])
+        self.assertEqual(minute["lowest"].tolist(), [4.0])
+        self.assertEqual(minute["depth_at_lowest"].tolist(), [9])
+        self.assertTrue(all(value != value for value in minute["second_lowest"]))  # NaN
+
+    def test_files_grow_with_rows_written(self):
+        store = PriceHistoryStore(self.tmp.name, raw_rows=5000, minute_rows=10, hour_rows=10)
+        path = os.path.join(self.tmp.name, "Power", "raw.lowest.bin")
+        store.append("Power", 1.0, timestamp=0)
+        self.assertEqual(os.path.getsize(path), 1024 * 8)
+        for second in range(1, 1500):
+            store.append("Power", 1.0 + second, timestamp=second)
+        self.assertEqual(os.path.getsize(path), 2048 * 8)
+        store.flush()
+        reopened = PriceHistoryStore(self.tmp.name, raw_rows=5000, minute_rows=10, hour_rows=10)
+        self.assertEqual(reopened.query("Power", tier="raw")["lowest"].tolist(), [1.0 + s for s in range(1500)])
+
+    def test_order_count_unknown_for_partial_books(self):
+        book = OrderBook.from_orders([{"id": 1, "quality": 0, "price": 5, "quantity": 2},
+                                      {"id": 2, "quality": 0, "price": 6, "quantity": 1}])
+        market_data = {"lowest_order": book.lowest_order(), "second_lowest_price": 6, "order_book": book}
+        self.assertEqual(summarize_market_data(market_data), (5, 6, 2, 2))
+        self.assertEqual(summarize_market_data(dict(market_data, partial_book=True))[3], -1)
+
+
+class PollSchedulerTests(unittest.TestCase):
+    def make_scheduler(self):
+        return PollScheduler(["Power", "Research"], budget_per_second=0.01, min_interval=10,
+                             max_interval=1000, burst_interval=5, clock=lambda: 0.0)
+
+    def test_budget_follows_proximity_to_threshold(self):
+        scheduler = self.make_scheduler()
+        self.assertEqual(sorted(scheduler.due(now=0)), ["Power", "Research"])
+        research_interval = scheduler.observe("Research", 200, threshold_price=100, now=0)
+        power_interval = scheduler.observe("Power", 105, threshold_price=100, now=0)
+        self.assertLess(power_interval, research_interval)
+        self.assertEqual(scheduler.due(now=power_interval), ["Power"])
+
+    def test_burst_polling_near_threshold(self):
+        scheduler = PollScheduler(["Power", "Research"], budget_per_second=1, min_interval=10,
+                                  max_interval=1000, burst_interval=5, clock=lambda: 0.0)
+        self.assertEqual(scheduler.observe("Power", 101, threshold_price=100, now=0), 5)
+        self.assertEqual(scheduler.observe("Power", 99, threshold_price=100, now=0), 5)
+        self.assertGreater(scheduler.stats["Power"].hit_rate, 0)
+
+    def test_burst_polls_share_the_budget(self):
+        names = [f"P{i}" for i in range(8)]
+        scheduler = PollScheduler(names, budget_per_second=0.5, min_interval=1, max_interval=1000,
+                                  burst_interval=5, clock=lambda: 0.0)
+        self.assertEqual(scheduler.observe("P0", 100.5, threshold_price=100, now=0), 5)
+        intervals = [scheduler.observe(name, 100.5, threshold_price=100, now=0) for name in names[:6]]
+        self.assertEqual(intervals[-1], 12)  # 6 bursting products at 5s would need 1.2 polls/s
+        self.assertEqual(scheduler.observe("P7", 200, threshold_price=100, now=0), 1000)  # Nothing left
+
+    def test_unobserved_product_is_retried(self):
+        scheduler = self.make_scheduler()
+        scheduler.due(now=0)
+        self.assertEqual(sorted(scheduler.due(now=10)), ["Power", "Research"])
+
+
+class OpportunityQueueTests(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.queue = OpportunityQueue(maxsize=2, ttl=30, clock=lambda: self.now)
+
+    def test_highest_saving_first_and_lowest_evicted_when_full(self):
+        self.queue.put(Opportunity("Water", 1, priority=10))
+        self.queue.put(Opportunity("Power", 2, priority=50))
+        self.assertFalse(self.queue.put(Opportunity("Seeds", 3, priority=5)))
+        self.assertTrue(self.queue.put(Opportunity("Steel", 4, priority=20)))
+        self.assertEqual([self.queue.get(timeout=0).order_id for _ in range(2)], [2, 4])
+        self.assertIsNone(self.queue.get(timeout=0))
+        self.assertEqual((self.queue.stats["evicted"], self.queue.stats["rejected"]), (1, 1))
+
+    def test_dedup_by_order_id_and_product(self):
+        self.queue.put(Opportunity("Water", 1, priority=10, payload="old"))
+        self.queue.put(Opportunity("Water", 1, priority=12, payload="new"))
+        self.assertEqual(len(self.queue), 1)
+        taken = self.queue.get(timeout=0)
+        self.assertEqual(taken.payload, "new")
+        self.assertFalse(self.queue.put(Opportunity("Water", 1, priority=12)))  # Being executed
+        self.queue.done(1)
+        self.queue.put(Opportunity("Water", 5, priority=10))
+        self.queue.put(Opportunity("Water", 6, priority=8))  # Newer book: order 5 is stale
+        self.assertEqual(self.queue.get(timeout=0).order_id, 6)
+
+    def test_stale_opportunities_expire(self):
+        self.queue.put(Opportunity("Water", 1, priority=10))
+        self.now = 31
+        self.queue.put(Opportunity("Power", 2, priority=1))
+        self.assertEqual(self.queue.get(timeout=0).order_id, 2)
+        self.assertEqual(self.queue.stats["expired"], 1)
+
+    def test_worker_executes_and_goes_idle(self):
+        queue = OpportunityQueue()
+        handled, idle_calls = [], []
+        worker = PipelineWorker(queue, handled.append, on_idle=lambda: idle_calls.append(True), poll_interval=0.05)
+        worker.start()
+        queue.put(Opportunity("Water", 1, priority=10))
+        for _ in range(100):
+            if idle_calls:
+                break
+            time.sleep(0.01)
+        worker.stop(timeout=1)
+        self.assertEqual([opportunity.order_id for opportunity in handled], [1])
+        self.assertTrue(idle_calls)
+        self.assertTrue(queue.idle())
+
+
+    def test_worker_batches_opportunities_queued_together(self):
+        queue = OpportunityQueue()
+        for order_id in (1, 2, 3):
+            queue.put(Opportunity(f"Product {order_id}", order_id, priority=order_id))
+        batches = []
+        worker = PipelineWorker(queue, handler=lambda opportunity: batches.append([opportunity.order_id]),
+                                batch_handler=lambda batch: batches.append([o.order_id for o in batch]),
+                                batch_size=2, poll_interval=0.05)
+        worker.start()
+        for _ in range(100):
+            if queue.idle():
+                break
+            time.sleep(0.01)
+        worker.stop(timeout=1)
+        self.assertEqual(batches, [[3, 2], [1]])
+
+
+class SimServerTests(unittest.TestCase):
+    def setUp(self):
+        self.server = SimServer(orders_per_book=50, dip=0.1).start()
+        self.addCleanup(self.server.stop)
+        self.session = requests.Session()
+        self.addCleanup(self.session.close)
+
+    def test_market_api_round_trip_with_cache(self):
+        install_cache(self.session)
+        first = get_market_data(self.session, self.server.market_url(1), 0, return_order_detail=True)
+        second = get_market_data(self.session, self.server.market_url(1), 0, return_order_detail=True)
+        expected = generate_book(1, 50, dip=0.1)[0]
+        self.assertEqual(first["lowest_order"]["id"], expected["id"])
+        self.assertEqual(second["cache_status"], "revalidated")
+        self.assertEqual(second["content_hash"], first["content_hash"])
+
+    def test_injected_rate_limit(self):
+        self.server.state.configure(rate_limit_every=1, retry_after=7)
+        error_details = {}
+        self.assertIsNone(get_market_data(self.session, self.server.market_url(1), 0, error_details=error_details))
+        self.assertEqual(error_details["kind"], "rate_limited")
+        self.assertEqual(error_details["retry_after"], "7")
+
+    def test_purchase_consumes_cheapest_order(self):
+        before = generate_book(2, 50, dip=0.1)[0]
+        response = self.session.post(f"{self.server.base_url}/market/resource/2/buy", data={"quantity": "1"})
+        self.assertIn("alert-success", response.text)
+        after = get_market_data(self.session, self.server.market_url(2), 0, return_order_detail=True)
+        if before["quantity"] == 1:
+            self.assertNotEqual(after["lowest_order"]["id"], before["id"])
+        else:
+            self.assertEqual(after["lowest_order"]["quantity"], before["quantity"] - 1)
+
+
+class HttpPurchaseExecutorTests(unittest.TestCase):
+    def setUp(self):
+        self.server = SimServer(orders_per_book=50, dip=0.1, cash=10_000_000).start()
+        self.addCleanup(self.server.stop)
+        self.session = requests.Session()
+        self.addCleanup(self.session.close)
+        self.executor = HttpPurchaseExecutor(self.session, f"{self.server.base_url}/api/v2/market-order/take/",
+                                             f"{self.server.base_url}/market/resource/{{resource_id}}/", timeout=5)
+
+    def test_confirmed_fill_and_price_guard(self):
+        cheapest = generate_book(3, 50, dip=0.1)[0]
+        result = self.executor.buy(3, 0, 1, cheapest["price"])
+        self.assertEqual((result.status, result.filled), ("confirmed", 1))
+        self.assertAlmostEqual(result.cost, cheapest["price"])
+        rejected = self.executor.buy(3, 0, 1, cheapest["price"] / 2)
+        self.assertEqual((rejected.status, rejected.status_code, rejected.fallback), ("rejected", 409, False))
+
+    def test_unauthenticated_or_missing_endpoint_allows_fallback(self):
+        self.server.state.configure(require_session=True)
+        result = self.executor.buy(3, 0, 1, 1000)
+        self.assertEqual((result.status, result.status_code, result.fallback), ("rejected", 401, True))
+        self.executor.api_url = f"{self.server.base_url}/api/v2/no-such-endpoint/"
+        self.session.cookies.set("sessionid", "abc")
+        self.assertTrue(self.executor.buy(3, 0, 1, 1000).fallback)
+
+
+class HttpClientTests(unittest.TestCase):
+    def test_warm_up_fills_pool_and_fetches_reuse_it(self):
+        with SimServer() as server:
+            session = create_session(pool_maxsize=3, cache=True)
+            self.addCleanup(session.close)
+            results = warm_up(session, [server.market_url(1), server.market_url(2)], connections=3)
+            self.assertIsInstance(results[server.base_url], float)
+            poolmanager = session.get_adapter(server.base_url).poolmanager
+            self.assertEqual(len(poolmanager.pools), 1)
+            pool = poolmanager.pools[next(iter(poolmanager.pools.keys()))]
+            self.assertEqual(pool.num_connections, 3)
+
+            session.get(server.market_url(1), timeout=5)
+            self.assertEqual(pool.num_connections, 3)
+            self.assertEqual(session.timer.count, 1)  # Warmup HEADs are not timed
+            self.assertEqual(session.timer.records[0]["cache_status"], "miss")
+
+    def test_warm_up_pings_draw_from_rate_limiter(self):
+        with SimServer() as server:
+            session = create_session(timer=False)
+            self.addCleanup(session.close)
+            limiter = TokenBucket(0.001, 3)
+            results = warm_up(session, [server.market_url(1)], connections=2, rate_limiter=limiter)
+            self.assertIsInstance(results[server.base_url], float)
+            self.assertTrue(limiter.try_acquire())
+            self.assertFalse(limiter.try_acquire())  # The two pings used two of the three tokens
+            self.assertIn("no rate limiter token", warm_up(session, [server.market_url(1)], timeout=0.1,
+                                                            rate_limiter=limiter)[server.base_url])
+
+    def test_warm_up_reports_unreachable_origin(self):
+        session = create_session(timer=False)
+        self.addCleanup(session.close)
+        results = warm_up(session, ["http://127.0.0.1:9/api/v3/market/0/1/"], timeout=1)
+        self.assertIsInstance(results["http://127.0.0.1:9"], str)
+
+
+class WarmDriverTests(unittest.TestCase):
+    def setUp(self):
+        self.now = [0.0]
+        self.started = []
+
+        def factory(**kwargs):
+            driver = Mock()
+            driver.execute_script.return_value = "complete"
+            self.started.append(driver)
+            return driver
+
+        self.warm = WarmDriver(idle_timeout=100, max_age=1000, warm_url="http://sim/market/resource/1/",
+                               factory=factory, clock=lambda: self.now[0])
+
+    def test_reuses_healthy_driver_and_recycles_when_idle(self):
+        first = self.warm.get()
+        first.get.assert_called_once_with("http://sim/market/resource/1/")
+        self.now[0] = 50
+        self.assertIs(self.warm.get(), first)
+        self.now[0] = 200
+        self.warm.maintain()  # Idle for 150s
+        first.quit.assert_called_once()
+        self.assertIsNot(self.warm.get(), first)
+        self.assertEqual(len(self.started), 2)
+
+    def test_restarts_crashed_driver(self):
+        first = self.warm.get()
+        first.execute_script.side_effect = ConnectionRefusedError()
+        second = self.warm.get()
+        self.assertIsNot(second, first)
+        self.assertEqual(self.warm.restarts, 1)
+        self.warm.quit()
+        second.quit.assert_called_once()
+        self.assertIsNone(self.warm.driver)
+
+
+class CashServiceTests(unittest.TestCase):
+    def test_reads_balance_from_sim_cashflow_api_and_debits_locally(self):
+        with SimServer(cash=1_000_000) as server:
+            session = create_session()
+            self.addCleanup(session.close)
+            now = [0.0]
+            cash = CashService(session, f"{server.base_url}/api/v2/companies/me/cashflow/recent/",
+                               ttl=60, clock=lambda: now[0])
+            self.assertIsNone(cash.cached())
+            self.assertEqual(cash.balance(), 1_000_000)
+            cash.debit(250_000)
+            self.assertEqual(cash.cached(), 750_000)
+            now[0] = 61
+            self.assertIsNone(cash.cached())
+            self.assertEqual(cash.balance(), 1_000_000)  # Expired: the server's value wins again
+            self.assertEqual(session.timer.count, 2)
+
+    def test_payload_shapes(self):
+        self.assertEqual(parse_cash_payload({"money": 12.5, "entries": []}), 12.5)
+        self.assertEqual(parse_cash_payload([{"balance": 7}, {"balance": 3}]), 7.0)
+        self.assertIsNone(parse_cash_payload({"detail": "Authentication credentials were not provided."}))
+
+
+class CookieBridgeTests(unittest.TestCase):
+    def test_reads_unencrypted_profile_cookies_for_domain(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        os.makedirs(os.path.join(tmp.name, "Default", "Network"))
+        conn = sqlite3.connect(os.path.join(tmp.name, "Default", "Network", "Cookies"))
+        conn.execute("CREATE TABLE meta (key TEXT, value TEXT)")
+        conn.execute("INSERT INTO meta VALUES ('version', '24')")
+        conn.execute("CREATE TABLE cookies (host_key TEXT, name TEXT, value TEXT, encrypted_value BLOB, expires_utc INTEGER)")
+        conn.executemany("INSERT INTO cookies VALUES (?, ?, ?, ?, 0)", [
+            (".simcompanies.com", "sessionid", "abc", b""),
+            ("www.simcompanies.com", "csrftoken", "tok", b""),
+            (".example.com", "sessionid", "other", b""),
+        ])
+        conn.commit()
+        conn.close()
+        self.assertEqual(cookies_from_profile(tmp.name), {"sessionid": "abc", "csrftoken": "tok"})
+
+    def test_driver_cookies_reach_sessions_and_rejection_forces_refresh(self):
+        driver = Mock()
+        driver.get_cookies.return_value = [{"name": "sessionid", "value": "one", "domain": ".simcompanies.com"}]
+        now = [0.0]
+        bridge = CookieBridge(driver_provider=lambda: driver, refresh_interval=300, clock=lambda: now[0])
+        session = bridge.attach(requests.Session())
+        self.assertTrue(bridge.refresh())
+        self.assertEqual(session.cookies.get("sessionid", domain=".simcompanies.com"), "one")
+
+        driver.get_cookies.return_value = [{"name": "sessionid", "value": "two", "domain": ".simcompanies.com"}]
+        bridge.ensure_fresh()  # Not due yet
+        self.assertEqual(bridge.cookies["sessionid"], "one")
+        rejected = requests.Response()
+        rejected.status_code = 401
+        for hook in session.hooks["response"]:
+            hook(rejected)
+        bridge.ensure_fresh()
+        self.assertEqual(session.cookies.get("sessionid", domain=".simcompanies.com"), "two")
+
+
+class TradeLedgerTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.today = datetime.datetime(2026, 3, 2, 12, 0)
+        self.ledger = TradeLedger(os.path.join(self.tmp.name, "ledger.sqlite3"), batch_size=10,
+                                  now=lambda: self.today)
+        self.addCleanup(self.ledger.close)
+
+    def test_daily_spend_counts_confirmed_trades_only(self):
+        self.ledger.record("ATTEMPTED", "Power", 1, 10, 2.0, 100)
+        self.ledger.record("CONFIRMED", "Power", 1, 10, 2.0, 100, "ok")
+        self.ledger.record("REJECTED", "Water", 2, 11, 1.0, 50, "price changed")
+        self.ledger.record("CONFIRMED", "Water", 2, 12, 1.5, 10, timestamp=self.today - datetime.timedelta(days=1))
+        self.assertEqual(self.ledger.spend("Power"), 200.0)
+        self.assertEqual(self.ledger.spend(), 200.0)
+        rows = self.ledger.daily_summary(days=2)
+        self.assertEqual([row[:4] for row in rows], [
+            ("2026-03-02", "Power", "ATTEMPTED", 1), ("2026-03-02", "Power", "CONFIRMED", 1),
+            ("2026-03-02", "Water", "REJECTED", 1), ("2026-03-01", "Water", "CONFIRMED", 1)])
+        wal = self.ledger._conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(wal, "wal")
+
+    def test_text_log_migration_is_idempotent(self):
+        line = ("2026-03-02T09:15:00.123456 | Status:CONFIRMED | Product:Power | ResourceID:1 | OrderID:7 | "
+                "Price:2.5 | Quantity:40 | Detail:Purchased | 40 units\n")
+        self.assertEqual(parse_text_log_line(line)["detail"], "Purchased | 40 units")
+        events_path = os.path.join(self.tmp.name, "trade_events.txt")
+        success_path = os.path.join(self.tmp.name, "successful_trade.txt")
+        for path in (events_path, success_path):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(line + "not a trade line\n")
+        self.assertEqual(self.ledger.import_text_log(events_path), 1)
+        self.assertEqual(self.ledger.import_text_log(success_path), 0)  # Same CONFIRMED event
+        self.assertEqual(self.ledger.import_text_log(events_path), 0)
+        self.assertEqual(self.ledger.spend("Power"), 100.0)
+
+    def test_grown_log_does_not_repeat_events_without_order_id(self):
+        line = ("2026-03-02T09:15:00.123456 | Status:REJECTED | Product:Power | ResourceID:1 | OrderID:N/A | "
+                "Price:2.5 | Quantity:40 | Detail:Price changed\n")
+        path = os.path.join(self.tmp.name, "trade_events.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(line)
+        self.assertEqual(self.ledger.import_text_log(path), 1)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line.replace("09:15", "09:16"))
+        self.assertEqual(self.ledger.import_text_log(path), 1)  # Only the appended line is new
+        self.assertEqual(self.ledger._conn.execute("SELECT COUNT(*) FROM trades").fetchone()[0], 2)
+
+
+class LoginStateTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.now = 1000.0
+        self.path = os.path.join(self.tmp.name, "profile.json")
+
+    def make_state(self):
+        return LoginState(self.path, ttl=60, clock=lambda: self.now)
+
+    def test_verified_state_expires_and_is_shared_through_file(self):
+        state = self.make_state()
+        self.assertFalse(state.is_fresh())
+        state.mark_verified()
+        other_process = self.make_state()
+        self.assertTrue(other_process.is_fresh())
+        self.now += 61
+        self.assertFalse(other_process.is_fresh())
+
+    def test_rejections_and_sign_in_redirects_mark_stale(self):
+        state = self.make_state()
+        for status_code, headers, url in ((401, {}, "https://x.test/api/v2/me"),
+                                          (302, {"Location": "/signin/"}, "https://x.test/landscape/"),
+                                          (200, {}, "https://x.test/signin/?next=/landscape/")):
+            state.mark_verified()
+            response = requests.Response()
+            response.status_code, response.url = status_code, url
+            response.headers.update(headers)
+            state(response)
+            self.assertFalse(self.make_state().is_fresh(), status_code)
+        self.assertFalse(is_sign_in_url("https://x.test/market/resource/1/"))
+
+
+class LogUtilsTests(unittest.TestCase):
+    def test_module_levels_match_most_specific_prefix(self):
+        levels = parse_module_levels(" market_utils=warning, AutoBuyer=DEBUG,AutoBuyer.errors=ERROR,broken")
+        self.assertEqual(levels, {"market_utils": "WARNING", "AutoBuyer": "DEBUG", "AutoBuyer.errors": "ERROR"})
+        self.assertEqual(level_for("AutoBuyer.errors", levels, "INFO"), "ERROR")
+        self.assertEqual(level_for("AutoBuyer.batch", levels, "INFO"), "DEBUG")
+        self.assertEqual(level_for("pipeline", levels, "INFO"), "INFO")
+
+    def test_file_logger_writes_through_background_writer(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(tmp.name)
+        logger = setup_logger("tests.queued", "queued_test.log", console=False, fmt="%(levelname)s %(message)s")
+        logger.info("first")
+        logger.debug("hidden")
+        logger.error("second")
+        stop_logging()  # Drains the queue
+        with open(os.path.join("record", "queued_test.log"), encoding="utf-8") as f:
+            self.assertEqual(f.read().splitlines(), ["INFO first", "ERROR second"])
+        self.assertEqual((logger.handlers, logger.propagate), ([], True))  # Nothing left feeding a stopped queue
+        setup_logger("tests.queued", "queued_test.log", console=False, fmt="%(levelname)s %(message)s").info("third")
+        stop_logging()
+        with open(os.path.join("record", "queued_test.log"), encoding="utf-8") as f:
+            self.assertEqual(f.read().splitlines()[-1], "INFO third")
+
+
+class BacktestTests(unittest.TestCase):
+    def timeline(self, rows):
+        timestamps, products, lowest, second, depth = zip(*rows)
+        return Timeline(["Power", "Water"], timestamps, products, lowest, second, depth)
+
+    def test_thresholds_compared_over_same_history(self):
+        timeline = self.timeline([
+            (1000, 0, 90.0, 100.0, 10),
+            (1060, 0, 90.0, 100.0, 10),  # Same listing, already bought out
+            (1030, 1, 50.0, 100.0, 5),
+        ])
+        current = run_backtest(timeline, 0.94, {}, {}, cash=1000)
+        self.assertEqual([fill[1:4] for fill in current.fills], [("Power", 90.0, 10), ("Water", 50.0, 2)])
+        summary = current.summary()
+        self.assertEqual((summary["triggered"], summary["listings"], summary["spend"], summary["savings"]),
+                         (3, 2, 1000.0, 200.0))
+        stricter = run_backtest(timeline, 0.90, {}, {}, cash=1000).summary()
+        self.assertEqual((stricter["triggered"], stricter["units"], stricter["spend"]), (1, 5, 250.0))
+
+    def test_missed_listings_are_counted_by_reason(self):
+        timeline = self.timeline([(1000, 0, 90.0, 100.0, 10), (1060, 0, 95.0, 100.0, 10), (1000, 1, 50.0, 100.0, 5)])
+        result = run_backtest(timeline, 0.94, {}, {"Water": 40}, latency=10)
+        self.assertEqual(result.fills, [])
+        self.assertEqual(result.missed["gone"], [1, 10, 100.0])  # Repriced before the order executed
+        self.assertEqual(result.missed["quantity cap"], [1, 5, 250.0])  # MAX_TOTAL_COST below one unit
+        result = run_backtest(timeline, 0.94, {}, {}, cash=5_080, min_cash_reserve=5_000)
+        self.assertEqual(result.missed["cash reserve"], [1, 10, 100.0])
+        self.assertEqual(result.fills[0][1:4], ("Water", 50.0, 1))
+
+    def test_fills_are_planned_like_the_purchase(self):
+        timeline = self.timeline([(1000, 0, 90.0, 100.0, 10)])
+        result = run_backtest(timeline, 0.94, {"Power": 8}, {"Power": 500}, cash=1000)
+        planned = walk_depth([{"price": 90.0, "quantity": 10}], 8, 500)
+        self.assertEqual(result.fills[0][3:5], (planned.quantity, planned.cost))
+        self.assertEqual(planned.quantity, 5)
+
 
 class AutoBuyerTests(unittest.TestCase):
+    def setUp(self):
+        # AutoBuyer opens its trade ledger and error log under record/; keep them out of the working tree
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(tmp.name)
+        patcher = patch.object(AutoBuyer_config, "TRADE_LEDGER_PATH", os.path.join(tmp.name, "record", "ledger.sqlite3"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(stop_logging)  # Closes the error log before the directory is removed
+
+    def make_buyer(self, max_buy_quantity=None):
+        buyer = AutoBuyer({}, max_buy_quantity or {}, {}, None, None, None)
+        if buyer.trade_ledger is not None:
+            self.addCleanup(buyer.trade_ledger.close)
+        return buyer
+
     def test_extract_resource_id(self):
-        buyer = AutoBuyer({}, {}, {}, None, None, None)
+        buyer = self.make_buyer()
         self.assertEqual(
             buyer._extract_resource_id("https://www.simcompanies.com/api/v3/market/0/113/"),
             113,
         )
 
     def test_invalid_resource_url_returns_none(self):
-        buyer = AutoBuyer({}, {}, {}, None, None, None)
+        buyer = self.make_buyer()
         self.assertIsNone(buyer._extract_resource_id("https://example.test/not-market"))
 
+    def test_confirmation_reruns_watcher_after_page_reload(self):
+        from selenium.common.exceptions import JavascriptException
+        buyer = self.make_buyer()
+        buyer.driver = Mock()
+        buyer.driver.execute_async_script.side_effect = [
+            JavascriptException("document unloaded while waiting for result"),
+            ["confirmed", "Purchased 5 units"],
+        ]
+        self.assertEqual(buyer._wait_for_purchase_confirmation("<tr></tr>"), ("confirmed", "Purchased 5 units"))
+        self.assertEqual(buyer.driver.execute_async_script.call_count, 2)
+
+    def test_confirmation_times_out_as_unknown(self):
+        buyer = self.make_buyer()
+        buyer.driver = Mock()
+        buyer.driver.execute_async_script.return_value = None
+        status, _ = buyer._wait_for_purchase_confirmation("<tr></tr>", timeout=0)
+        self.assertEqual(status, "unknown")
+
+    def test_batch_submits_every_tab_before_confirming(self):
+        buyer = self.make_buyer()
+        driver = buyer.driver = Mock()
+        driver.current_window_handle = "main"
+        driver.window_handles = ["main"]
+        driver.execute_script.side_effect = lambda script, url: driver.window_handles.append(url)
+        buyer.cash_service = Mock()
+        buyer.cash_service.balance.return_value = 10_000
+        steps = []
+        buyer._start_price_recheck = Mock(side_effect=lambda name, info: steps.append(("recheck", name)))
+        buyer._submit_buy_order = Mock(side_effect=lambda name, *args, available_cash, **kwargs: steps.append(
+            ("submit", name, available_cash)) or {"product_name": name, "price": 2.0, "quantity": 1000})
+        buyer._confirm_buy_order = Mock(side_effect=lambda ticket: steps.append(("confirm", ticket["product_name"])) or True)
+        opportunities = [
+            Opportunity(name, order_id, priority=1, payload={
+                "product_info": {"url": f"https://www.simcompanies.com/api/v3/market/0/{order_id}/", "quality": 0},
+                "lowest_order": {"id": order_id, "price": 2.0, "quantity": 1000}})
+            for name, order_id in (("Power", 1), ("Water", 2))
+        ]
+        with patch("AutoBuyer.WebDriverWait"):  # Market pages count as loaded
+            self.assertEqual(buyer._buy_in_tabs(opportunities, None), 2)
+        self.assertEqual(steps, [("recheck", "Power"), ("submit", "Power", 10_000),
+                                 ("recheck", "Water"), ("submit", "Water", 8_000.0),
+                                 ("confirm", "Power"), ("confirm", "Water")])
+        self.assertEqual(driver.close.call_count, 2)
+        driver.switch_to.window.assert_called_with("main")
+
+    def test_http_buy_walks_every_order_below_threshold(self):
+        buyer = self.make_buyer({"Power": 1000})
+        buyer._log_trade = Mock()
+        buyer.cash_service = Mock()
+        buyer.cash_service.balance.return_value = 700 + AutoBuyer_config.MIN_CASH_RESERVE
+        buyer.purchase_executor = Mock()
+        buyer.purchase_executor.buy.return_value = PurchaseResult("confirmed", 74, 700.0)
+        orders = [{"id": 1, "price": 9.0, "quantity": 40}, {"id": 2, "price": 10.0, "quantity": 60}]
+        product_info = {"url": "https://www.simcompanies.com/api/v3/market/0/1/", "quality": 0}
+
+        self.assertTrue(buyer._buy_over_http("Power", product_info, 1, 9.0, 40, depth_orders=orders))
+        # $700 above the reserve buys all 40 at $9 and 34 of the $10 order
+        buyer.purchase_executor.buy.assert_called_once_with(1, 0, 74, 10.0)
+        self.assertEqual(buyer._log_trade.call_args.args[:6], ("CONFIRMED", "Power", 1, 1, 700.0 / 74, 74))
+
+    def test_price_recheck_reads_api_before_page(self):
+        buyer = self.make_buyer()
+        buyer._get_current_market_price = Mock(return_value=9.5)
+        product_info = {"url": "https://www.simcompanies.com/api/v3/market/0/1/", "quality": 0}
+        buyer.get_market_data = Mock(return_value=({"lowest_order": {"id": 1, "price": 9.0, "quantity": 5},
+                                                    "order_book": "book"}, {}))
+        self.assertEqual(buyer._live_market_price("Power", buyer._start_price_recheck("Power", product_info)), (9.0, "book"))
+        self.assertEqual(buyer.get_market_data.call_args.kwargs["headers"], {"Cache-Control": "no-cache"})
+        buyer._get_current_market_price.assert_not_called()
+
+        buyer.get_market_data.return_value = (None, {"kind": "timeout", "message": "timed out"})
+        self.assertEqual(buyer._live_market_price("Power", buyer._start_price_recheck("Power", product_info)), (9.5, None))
+
+    def test_price_recheck_gives_up_on_an_empty_bucket(self):
+        buyer = self.make_buyer()
+        buyer._get_current_market_price = Mock(return_value=9.5)
+        buyer.session = Mock()
+        buyer.rate_limiter = TokenBucket(0.001, 1)
+        buyer.rate_limiter.acquire()  # Emptied by the sweep
+        product_info = {"url": "https://www.simcompanies.com/api/v3/market/0/1/", "quality": 0}
+        with patch.object(AutoBuyer_config, "PRICE_RECHECK_TIMEOUT_SECONDS", 0.05):
+            started_at = time.monotonic()
+            price_recheck = buyer._start_price_recheck("Power", product_info)
+            self.assertEqual(price_recheck.result(timeout=5)[1]["kind"], "rate_limited")
+            self.assertEqual(buyer._live_market_price("Power", price_recheck), (9.5, None))
+        self.assertLess(time.monotonic() - started_at, 1)
+        buyer.session.get.assert_not_called()  # No request left queued behind the purchase
+
     def test_parse_price_with_thousands_separator(self):
         self.assertEqual(AutoBuyer._parse_price_text("$2,200.000"), 2200.0)
 
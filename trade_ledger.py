@@ -0,0 +1,235 @@
+"""SQLite ledger of AutoBuyer trade events.
+
+Usage:
+    python trade_ledger.py migrate [record/trade_events.txt record/successful_trade.txt]
+    python trade_ledger.py summary [--days 7] [--product Power]
+"""
+import argparse
+import datetime
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+TEXT_LOG_PATHS = (os.path.join('record', 'trade_events.txt'), os.path.join('record', 'successful_trade.txt'))
+SPEND_STATUS = 'CONFIRMED'
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS trades ("
+    "id INTEGER PRIMARY KEY, ts TEXT NOT NULL, day TEXT NOT NULL, status TEXT NOT NULL, product TEXT NOT NULL, "
+    "resource_id INTEGER, order_id INTEGER, price REAL, quantity INTEGER, cost REAL, detail TEXT)",
+    # Importing the same text log twice, or both text logs (every CONFIRMED line is in each), adds nothing.
+    # COALESCE because SQLite treats NULLs as distinct, which would let events without an order id repeat.
+    "CREATE UNIQUE INDEX IF NOT EXISTS trades_event_key ON trades (ts, status, product, COALESCE(order_id, -1))",
+    "CREATE INDEX IF NOT EXISTS trades_product_day ON trades (product, day, status)",
+    "CREATE INDEX IF NOT EXISTS trades_day_status ON trades (day, status)",
+    "CREATE TABLE IF NOT EXISTS imported_logs (path TEXT PRIMARY KEY, size INTEGER, rows INTEGER, imported_at TEXT)",
+    "CREATE VIEW IF NOT EXISTS daily_trades AS "
+    "SELECT day, product, status, COUNT(*) AS events, SUM(quantity) AS quantity, SUM(cost) AS cost "
+    "FROM trades GROUP BY day, product, status",
+    "CREATE VIEW IF NOT EXISTS daily_spend AS "
+    "SELECT day, product, COUNT(*) AS purchases, SUM(quantity) AS quantity, SUM(cost) AS spend "
+    f"FROM trades WHERE status = '{SPEND_STATUS}' GROUP BY day, product",
+)
+
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _float_or_none(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_text_log_line(line):
+    """Parse one ``_log_trade`` text line into a row dict, or None if it is not one.
+
+    ``Detail`` is the last field and may itself contain ``" | "``.
+    """
+    parts = line.rstrip('\n').split(' | ', 7)
+    if len(parts) < 8 or not parts[1].startswith('Status:'):
+        return None
+    try:
+        timestamp = datetime.datetime.fromisoformat(parts[0])
+    except ValueError:
+        return None
+    fields = {}
+    for part in parts[1:]:
+        key, _, value = part.partition(':')
+        fields[key] = value
+    return {
+        'ts': timestamp.isoformat(), 'status': fields.get('Status', ''), 'product': fields.get('Product', ''),
+        'resource_id': _int_or_none(fields.get('ResourceID')), 'order_id': _int_or_none(fields.get('OrderID')),
+        'price': _float_or_none(fields.get('Price')), 'quantity': _int_or_none(fields.get('Quantity')),
+        'detail': fields.get('Detail', ''),
+    }
+
+
+class TradeLedger:
+    """Trade events in a SQLite database in WAL mode, with per-day views.
+
+    ``record`` buffers events and writes them in one transaction once
+    ``batch_size`` are pending or the oldest has waited ``flush_interval``
+    seconds. CONFIRMED events are written right away so spend checks and
+    readers in other processes see them. Queries flush first.
+    """
+
+    def __init__(self, path, batch_size=20, flush_interval=5.0, clock=time.monotonic, now=datetime.datetime.now):
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._clock = clock
+        self._now = now  # Local time, like the text logs, so "today" matches the player's day
+        self._lock = threading.RLock()
+        self._pending = []
+        self._pending_since = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # One connection guarded by the lock: the pipeline worker logs trades from its own thread.
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL; a power loss can only drop the last commits
+        with self._conn:
+            if self._conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'trades_event'").fetchone():
+                # Ledgers from the earlier index kept repeated events without an order id; drop them first
+                self._conn.execute("DELETE FROM trades WHERE id NOT IN ("
+                                   "SELECT MIN(id) FROM trades GROUP BY ts, status, product, COALESCE(order_id, -1))")
+                self._conn.execute("DROP INDEX trades_event")
+            for statement in SCHEMA:
+                self._conn.execute(statement)
+
+    def record(self, status, product_name, resource_id, order_id, price, quantity, detail="", timestamp=None):
+        timestamp = timestamp or self._now()
+        price = _float_or_none(price)
+        quantity = _int_or_none(quantity)
+        cost = price * quantity if price is not None and quantity is not None else None
+        row = (timestamp.isoformat(), timestamp.date().isoformat(), status, product_name,
+               _int_or_none(resource_id), _int_or_none(order_id), price, quantity, cost, str(detail))
+        with self._lock:
+            self._pending.append(row)
+            if self._pending_since is None:
+                self._pending_since = self._clock()
+            if (status == SPEND_STATUS or len(self._pending) >= self.batch_size
+                    or self._clock() - self._pending_since >= self.flush_interval):
+                self.flush()
+
+    def _insert(self, rows):
+        return self._conn.executemany(
+            "INSERT OR IGNORE INTO trades (ts, day, status, product, resource_id, order_id, price, quantity, cost, detail) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows).rowcount
+
+    def flush(self):
+        """Write pending events in one transaction."""
+        with self._lock:
+            if not self._pending:
+                return
+            rows, self._pending, self._pending_since = self._pending, [], None
+            try:
+                with self._conn:
+                    self._insert(rows)
+            except sqlite3.Error as e:
+                logger.warning(f"Could not write {len(rows)} trade events to {self.path}: {e}")
+                self._pending = rows + self._pending  # Retried on the next flush
+
+    def spend(self, product_name=None, day=None):
+        """Confirmed spend on ``day`` (default today), for one product or all."""
+        day = (day or self._now().date()).isoformat()
+        query = "SELECT COALESCE(SUM(cost), 0) FROM trades WHERE day = ? AND status = ?"
+        params = [day, SPEND_STATUS]
+        if product_name is not None:
+            query += " AND product = ?"
+            params.append(product_name)
+        with self._lock:
+            self.flush()
+            return float(self._conn.execute(query, params).fetchone()[0])
+
+    def daily_summary(self, days=7, product_name=None):
+        """Rows of the ``daily_trades`` view for the last ``days`` days, newest first."""
+        since = (self._now().date() - datetime.timedelta(days=days - 1)).isoformat()
+        query = "SELECT day, product, status, events, quantity, cost FROM daily_trades WHERE day >= ?"
+        params = [since]
+        if product_name is not None:
+            query += " AND product = ?"
+            params.append(product_name)
+        query += " ORDER BY day DESC, product, status"
+        with self._lock:
+            self.flush()
+            return self._conn.execute(query, params).fetchall()
+
+    def import_text_log(self, path):
+        """Import a ``trade_events.txt``-style file. Returns the number of new rows; a file imported unchanged is skipped."""
+        if not os.path.exists(path):
+            return 0
+        size = os.path.getsize(path)
+        key = os.path.abspath(path)
+        with self._lock:
+            self.flush()
+            previous = self._conn.execute("SELECT size FROM imported_logs WHERE path = ?", (key,)).fetchone()
+            if previous is not None and previous[0] == size:
+                return 0
+            rows = []
+            skipped = 0
+            with open(path, encoding='utf-8', errors='replace') as f:
+                for line in f:
+                    event = parse_text_log_line(line)
+                    if event is None:
+                        skipped += bool(line.strip())
+                        continue
+                    cost = (event['price'] * event['quantity']
+                            if event['price'] is not None and event['quantity'] is not None else None)
+                    rows.append((event['ts'], event['ts'][:10], event['status'], event['product'], event['resource_id'],
+                                 event['order_id'], event['price'], event['quantity'], cost, event['detail']))
+            with self._conn:
+                added = self._insert(rows)
+                self._conn.execute("INSERT OR REPLACE INTO imported_logs VALUES (?, ?, ?, ?)",
+                                   (key, size, len(rows), self._now().isoformat()))
+        if skipped:
+            logger.warning(f"Skipped {skipped} unparseable lines in {path}")
+        return added
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self._conn.close()
+
+
+def main(argv=None):
+    from config import TRADE_LEDGER_PATH
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default=TRADE_LEDGER_PATH)
+    commands = parser.add_subparsers(dest='command', required=True)
+    migrate = commands.add_parser('migrate', help='Import text trade logs')
+    migrate.add_argument('paths', nargs='*', default=list(TEXT_LOG_PATHS))
+    summary = commands.add_parser('summary', help='Per-day events, quantity and cost')
+    summary.add_argument('--days', type=int, default=7)
+    summary.add_argument('--product')
+    args = parser.parse_args(argv)
+
+    ledger = TradeLedger(args.db)
+    try:
+        if args.command == 'migrate':
+            for path in args.paths:
+                print(f"{path}: {ledger.import_text_log(path)} new events")
+        else:
+            print(f"{'day':<10} {'product':<24} {'status':<10} {'events':>7} {'quantity':>10} {'cost':>16}")
+            for day, product, status, events, quantity, cost in ledger.daily_summary(args.days, args.product):
+                print(f"{day:<10} {product:<24} {status:<10} {events:>7} {quantity or 0:>10} {cost or 0:>16,.2f}")
+    finally:
+        ledger.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())